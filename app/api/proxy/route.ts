@@ -69,6 +69,8 @@ export async function POST(request: NextRequest) {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
+        // The backend queues jobs fairly per user
+        'X-User-Id': userId,
       },
     });
 
@@ -78,14 +80,19 @@ export async function POST(request: NextRequest) {
     const data = await backendResponse.json();
     console.log('Backend response data:', data);
 
-    // Return the response with rate limit headers
+    // Return the response with rate limit headers, and the backend's Retry-After when it is at capacity
+    const headers: Record<string, string> = {
+      "X-RateLimit-Limit": limit.toString(),
+      "X-RateLimit-Remaining": remaining.toString(),
+      "X-RateLimit-Reset": reset.toString(),
+    };
+    const retryAfter = backendResponse.headers.get('Retry-After');
+    if (retryAfter) {
+      headers["Retry-After"] = retryAfter;
+    }
     return NextResponse.json(data, {
       status: backendResponse.status,
-      headers: {
-        "X-RateLimit-Limit": limit.toString(),
-        "X-RateLimit-Remaining": remaining.toString(),
-        "X-RateLimit-Reset": reset.toString(),
-      }
+      headers,
     });
 
   } catch (error) {
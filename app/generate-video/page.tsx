@@ -7,10 +7,24 @@ import PredefinedPosts from '@/components/PredefinedPosts';
 import { Spinner } from "@/components/ui/loadingSpinner";
 import { Sparkles } from "lucide-react";
 
+// Labels for the pipeline stages pushed by the progress stream
+const STAGE_LABELS: Record<string, string> = {
+  fetching: "Fetching the Reddit post",
+  scripting: "Writing the script",
+  tts: "Recording the voiceover",
+  captions: "Timing the captions",
+  rendering: "Rendering the video",
+  uploading: "Uploading the video",
+};
+
 export default function Home() {
   const router = useRouter();
   const [taskId, setTaskId] = useState("");
   const [status, setStatus] = useState("");
+  const [stage, setStage] = useState("");
+  const [percent, setPercent] = useState<number | null>(null);
+  const [queuePosition, setQueuePosition] = useState<number | null>(null);
+  const [usePolling, setUsePolling] = useState(false);
   const [error, setError] = useState("");
   const [isLoading, setIsLoading] = useState(false);
 
@@ -18,6 +32,9 @@ export default function Home() {
     try {
       setIsLoading(true);
       setStatus("");
+      setStage("");
+      setPercent(null);
+      setUsePolling(false);
       setError("");
 
       // Use the proxy instead of calling backend directly
@@ -49,6 +66,25 @@ export default function Home() {
     }
   };
 
+  // Apply a task status, from the progress stream or from polling
+  const handleStatus = useCallback((data: any) => {
+    setStatus(data.status);
+    if (data.stage) setStage(data.stage);
+    setQueuePosition(data.status === "pending" && data.queue_position ? data.queue_position : null);
+
+    if (data.error && data.status === "failed") {
+      setError(data.error);
+      setIsLoading(false); // Stop loading on failure
+    }
+
+    if (data.status === "completed") {
+      setIsLoading(false); // Stop loading on completion
+      router.push(`/completed-generation/${taskId}`);
+    } else if (data.status === "failed") {
+      setIsLoading(false); // Stop loading on failure
+    }
+  }, [taskId, router]);
+
   const checkTaskStatus = useCallback(async () => {
     if (!taskId) return;
 
@@ -65,43 +101,67 @@ export default function Home() {
       
       const data = await response.json();
       console.log('Status response data:', data);
-      setStatus(data.status);
-      
-      if (data.error && data.status === "failed") {
-        setError(data.error);
-        setIsLoading(false); // Stop loading on failure
-      }
-      
-      if (data.status === "completed") {
-        setIsLoading(false); // Stop loading on completion
-        router.push(`/completed-generation/${taskId}`);
-      } else if (data.status === "failed") {
-        setIsLoading(false); // Stop loading on failure
-      }
+      handleStatus(data);
     } catch (err: any) {
       console.log('Error checking task status:', err);
       setIsLoading(false); // Stop loading on error
     }
-  }, [taskId,router]);
+  }, [taskId, handleStatus]);
 
   // Function to get display status
   const getDisplayStatus = () => {
     if (status === "failed") return "Failed - Check error message below";
     if (status === "completed") return "Completed!";
+    if (status === "processing" && STAGE_LABELS[stage]) {
+      return percent !== null ? `${STAGE_LABELS[stage]}... ${Math.round(percent)}%` : `${STAGE_LABELS[stage]}...`;
+    }
     if (status === "processing") return "Processing...";
+    if (status === "pending" && queuePosition !== null) return `Queued, position ${queuePosition}`;
     if (isLoading) return "Starting...";
     return status;
   };
 
+  // Progress is pushed over Server-Sent Events, polling is the fallback if the stream fails
+  useEffect(() => {
+    if (!taskId || usePolling || typeof EventSource === "undefined") return;
+
+    const backendUrl = process.env.NEXT_PUBLIC_BACKEND_HOST;
+    const source = new EventSource(`${backendUrl}/backend/py/reddit/reddit-commentary/events/${taskId}`);
+    source.addEventListener("status", (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      handleStatus(data);
+      if (data.status !== "pending" && data.status !== "processing") source.close();
+    });
+    source.addEventListener("stage", (event) => {
+      setStage(JSON.parse((event as MessageEvent).data).stage);
+      setPercent(null);
+    });
+    source.addEventListener("progress", (event) => {
+      const data = JSON.parse((event as MessageEvent).data);
+      setStage(data.stage);
+      setPercent(data.percent);
+    });
+    source.onerror = () => {
+      console.log('Progress stream failed, falling back to polling');
+      source.close();
+      setUsePolling(true);
+    };
+
+    return () => {
+      source.close();
+    };
+  }, [taskId, usePolling, handleStatus]);
+
   useEffect(() => {
     if (!taskId || status === "completed" || status === "failed") return;
+    if (!usePolling && typeof EventSource !== "undefined") return;
     
     const pollInterval = setInterval(checkTaskStatus, 5000);
     
     return () => {
       clearInterval(pollInterval);
     };
-  }, [status, taskId, checkTaskStatus]);
+  }, [status, taskId, usePolling, checkTaskStatus]);
 
   return (
     <main className="flex min-h-screen flex-col items-center justify-center p-24">
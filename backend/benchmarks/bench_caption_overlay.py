@@ -0,0 +1,94 @@
+"""
+Compare burning captions in with libass (the subtitles filter) against the pre-rendered caption overlay.
+
+Captions are made from synthetic word timings at the TTS speaking rate. For the overlay, the time to
+render its images is reported separately, from an empty cache and from a warm one, since the captions
+stage does it before the render and images are reused across jobs.
+
+Usage (from backend/): python -m benchmarks.bench_caption_overlay [--template bg.mp4] [--duration 20] [--runs 3]
+"""
+import os
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from media import caption_layers
+from media.audio import SPEECH_WORDS_PER_SECOND
+from media.captions import build_cues, cues_to_srt
+from media.templates import EncodeProfile
+from benchmarks.fakes import write_test_template
+from benchmarks.bench_template_render import write_test_inputs
+
+WORDS = "the quick brown fox jumps over the lazy dog while everyone on reddit argues about it".split()
+
+def write_test_cues(tmpdir: str, duration: float) -> tuple:
+    """Write captions.json and captions.srt for words spoken at SPEECH_WORDS_PER_SECOND"""
+    word_seconds = 1 / SPEECH_WORDS_PER_SECOND
+    timed_words = []
+    for index in range(int(duration * SPEECH_WORDS_PER_SECOND)):
+        word = WORDS[index % len(WORDS)] + ("." if index % 9 == 8 else "")
+        timed_words.append({"word": word, "start": index * word_seconds, "end": (index + 0.8) * word_seconds})
+    cues = build_cues(timed_words, "phrase")
+    json_path = os.path.join(tmpdir, "captions.json")
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(cues, f)
+    srt_path = os.path.join(tmpdir, "captions.srt")
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write(cues_to_srt(cues))
+    return json_path, srt_path
+
+def run_ffmpeg(template_path: str, audio_path: str, caption_args: list, filter_graph: str, output_path: str) -> dict:
+    cmd = [
+        'ffmpeg', '-y', '-stream_loop', '-1', '-i', template_path, '-i', audio_path, *caption_args,
+        '-filter_complex', filter_graph + "[v]",
+        '-map', '[v]', '-map', '1:a', *EncodeProfile.from_env().ffmpeg_args(),
+        '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k', '-shortest', output_path
+    ]
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stderr=subprocess.PIPE)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {"wall": wall, "cpu": (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)}
+
+def time_layers(json_path: str, workdir: str, style: str) -> tuple:
+    """Seconds to write the overlay playlist and how many images had to be rendered"""
+    stats = {}
+    start = time.perf_counter()
+    playlist_path = caption_layers.write_caption_overlay(json_path, workdir, style=style, stats=stats)
+    return time.perf_counter() - start, stats.get("rendered", 0), playlist_path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--template", help="Background template, a synthetic one is used if omitted")
+    parser.add_argument("--duration", type=float, default=20.0, help="Voiceover length in seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # An empty image cache, so the first overlay run shows the cold cost
+        caption_layers.CAPTION_CACHE_DIR = os.path.join(tmpdir, "caption-layers")
+        template_path = os.path.abspath(args.template) if args.template else write_test_template(os.path.join(tmpdir, "background.mp4"))
+        audio_path, _ = write_test_inputs(tmpdir, args.duration)
+        json_path, srt_path = write_test_cues(tmpdir, args.duration)
+
+        print(f"{'variant':28} {'layers s':>9} {'images':>7} {'wall s':>8} {'cpu s':>8}")
+        variants = [("libass", None), ("overlay plain", "plain"), ("overlay highlight", "highlight")]
+        for name, style in variants:
+            for run in range(args.runs):
+                layer_seconds, rendered = 0.0, 0
+                if style:
+                    layer_seconds, rendered, playlist_path = time_layers(json_path, tmpdir, style)
+                    caption_args = ['-f', 'concat', '-safe', '0', '-i', playlist_path]
+                    filter_graph = caption_layers.overlay_filter(2)
+                else:
+                    caption_args = []
+                    filter_graph = f"[0:v]subtitles='{srt_path}':force_style='Fontsize=18'"
+                result = run_ffmpeg(template_path, audio_path, caption_args, filter_graph, os.path.join(tmpdir, "out.mp4"))
+                label = f"{name} (run {run + 1})"
+                print(f"{label:28} {layer_seconds:9.3f} {rendered:7d} {result['wall']:8.2f} {result['cpu']:8.2f}")
+
+if __name__ == "__main__":
+    main()
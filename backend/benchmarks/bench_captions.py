@@ -0,0 +1,84 @@
+"""
+Compare local script-to-audio caption alignment against Deepgram transcription.
+
+Deepgram word timestamps are used as the reference, so DEEPGRAM_API_KEY must be set.
+If --audio is omitted the script is voiced with Deepgram TTS first.
+
+Usage (from backend/): python -m benchmarks.bench_captions --script script.txt [--audio audio.wav]
+"""
+import re
+import time
+import difflib
+import argparse
+import tempfile
+from media.captions import align_script_to_audio
+from clients.deepgram import DeepgramService
+
+def normalize(word: str) -> str:
+    return re.sub(r"[^a-z0-9']", "", word.lower())
+
+def compare_timings(local_words: list, reference_words: list) -> dict:
+    """Match words by text and measure start/end differences against the reference"""
+    local_tokens = [normalize(w["word"]) for w in local_words]
+    reference_tokens = [normalize(w["word"]) for w in reference_words]
+    matcher = difflib.SequenceMatcher(a=local_tokens, b=reference_tokens, autojunk=False)
+    start_errors, end_errors = [], []
+    for block in matcher.get_matching_blocks():
+        for offset in range(block.size):
+            local = local_words[block.a + offset]
+            reference = reference_words[block.b + offset]
+            start_errors.append(abs(local["start"] - reference["start"]))
+            end_errors.append(abs(local["end"] - reference["end"]))
+    if not start_errors:
+        return {"matched": 0}
+    start_errors.sort()
+    return {
+        "matched": len(start_errors),
+        "mean_start_error": sum(start_errors) / len(start_errors),
+        "p95_start_error": start_errors[int(len(start_errors) * 0.95) - 1 if len(start_errors) > 1 else 0],
+        "mean_end_error": sum(end_errors) / len(end_errors),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--script", required=True, help="Text file with the voiceover script")
+    parser.add_argument("--audio", help="WAV file of the voiceover, generated with Deepgram TTS when omitted")
+    args = parser.parse_args()
+
+    with open(args.script, "r", encoding="utf-8") as f:
+        script = f.read().strip()
+    deepgram_service = DeepgramService()
+
+    if args.audio:
+        with open(args.audio, "rb") as f:
+            audio_bytes = f.read()
+    else:
+        audio_bytes = deepgram_service.generate_audio_with_deepgram(script)
+
+    start = time.perf_counter()
+    local_words = align_script_to_audio(script, audio_bytes)
+    local_latency = time.perf_counter() - start
+
+    with tempfile.NamedTemporaryFile(suffix=".wav") as audio_file:
+        audio_file.write(audio_bytes)
+        audio_file.flush()
+        start = time.perf_counter()
+        response = deepgram_service.transcribe_with_deepgram(audio_file.name)
+        remote_latency = time.perf_counter() - start
+
+    reference_words = [
+        {"word": w.word, "start": w.start, "end": w.end}
+        for w in response.results.channels[0].alternatives[0].words
+    ]
+    result = compare_timings(local_words, reference_words)
+
+    print(f"local alignment latency:   {local_latency * 1000:8.1f} ms")
+    print(f"deepgram STT latency:      {remote_latency * 1000:8.1f} ms")
+    print(f"matched words:             {result['matched']} of {len(reference_words)}")
+    if result["matched"]:
+        print(f"mean start error:          {result['mean_start_error'] * 1000:8.1f} ms")
+        print(f"p95 start error:           {result['p95_start_error'] * 1000:8.1f} ms")
+        print(f"mean end error:            {result['mean_end_error'] * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
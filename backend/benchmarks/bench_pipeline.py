@@ -0,0 +1,144 @@
+"""
+Load-test the whole pipeline offline: N jobs through process_reddit_commentary against local
+stand-ins for Reddit, OpenAI, Deepgram (benchmarks.fakes) and S3 (moto, or --s3-endpoint for MinIO).
+
+Reports p50/p95 of every stage (from the per-task timings) and end to end, throughput in
+jobs per minute, CPU seconds per job (this process and its ffmpeg children) and peak RSS,
+so pipeline changes can be compared without network access or API keys.
+
+Usage (from backend/): python -m benchmarks.bench_pipeline [--jobs 20] [--concurrency 4] [--json results.json]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import resource
+from utils.task_queue import TaskStatus
+from benchmarks.fakes import FakeSettings, start_fake_services, start_fake_s3, write_test_template
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def cpu_seconds() -> float:
+    """CPU time of this process and of the ffmpeg processes it waited for"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def peak_rss_mb(who: int) -> float:
+    rss_kb = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes on Linux
+    return rss_kb / 1024 ** 2 if sys.platform == "darwin" else rss_kb / 1024
+
+async def run_jobs(jobs: int, concurrency: int) -> list:
+    from routers.router import process_reddit_commentary, create_commentary_task
+    from utils.job_executor import job_executor
+    from utils.task_queue import task_queue
+
+    slots = asyncio.Semaphore(concurrency)
+
+    async def run_job(index: int) -> dict:
+        # A fresh post ID per job so nothing is served from the result cache
+        post_id = f"b{uuid.uuid4().hex[:8]}"
+        url = f"https://www.reddit.com/r/bench/comments/{post_id}/job_{index}/"
+        async with slots:
+            task_id = create_commentary_task(url, post_id)
+            start = time.perf_counter()
+            try:
+                await job_executor.submit(process_reddit_commentary(task_id, url, post_id))
+            except Exception as e:
+                print(f"Job {index} failed: {e}")
+            seconds = time.perf_counter() - start
+        task = task_queue.get_task(task_id) or {}
+        return {"status": task.get("status"), "seconds": seconds, "timings": task.get("timings") or {}}
+
+    return await asyncio.gather(*(run_job(index) for index in range(jobs)))
+
+def summarize(results: list, wall_seconds: float, cpu: float) -> dict:
+    completed = [result for result in results if result["status"] == TaskStatus.COMPLETED.value]
+    stages = {}
+    for result in completed:
+        for name, values in result["timings"].items():
+            stages.setdefault(name, []).append(values["seconds"])
+    end_to_end = [result["seconds"] for result in completed]
+    return {
+        "jobs": len(results),
+        "completed": len(completed),
+        "wall_seconds": round(wall_seconds, 2),
+        "jobs_per_minute": round(len(completed) / wall_seconds * 60, 2) if wall_seconds else 0.0,
+        "cpu_seconds_per_job": round(cpu / len(results), 2) if results else 0.0,
+        "peak_rss_mb": round(peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "peak_child_rss_mb": round(peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "end_to_end": {"p50": round(percentile(end_to_end, 0.5), 3), "p95": round(percentile(end_to_end, 0.95), 3)},
+        "stages": {
+            name: {"p50": round(percentile(values, 0.5), 3), "p95": round(percentile(values, 0.95), 3)}
+            for name, values in stages.items()
+        },
+    }
+
+def print_summary(summary: dict):
+    print(f"{summary['completed']}/{summary['jobs']} jobs completed in {summary['wall_seconds']}s: "
+          f"{summary['jobs_per_minute']} jobs/min, {summary['cpu_seconds_per_job']} CPU s/job, "
+          f"peak RSS {summary['peak_rss_mb']} MB (ffmpeg {summary['peak_child_rss_mb']} MB)")
+    print(f"{'stage':18} {'p50 s':>8} {'p95 s':>8}")
+    for name, values in list(summary["stages"].items()) + [("end_to_end", summary["end_to_end"])]:
+        print(f"{name:18} {values['p50']:8.3f} {values['p95']:8.3f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs submitted at once")
+    parser.add_argument("--max-running-jobs", type=int, help="MAX_RUNNING_JOBS of the executor under test")
+    parser.add_argument("--template", help="Background template to upload, a synthetic one is used if omitted")
+    parser.add_argument("--script-sentences", type=int, default=6, help="Length of the fake LLM's script")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="Fake LLM time to first token")
+    parser.add_argument("--tts-latency", type=float, default=0.25, help="Fake TTS time to first byte")
+    parser.add_argument("--reddit-latency", type=float, default=0.1, help="Fake Reddit response time")
+    parser.add_argument("--s3-endpoint", help="Use an existing S3-compatible endpoint (e.g. MinIO) instead of moto")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    settings = FakeSettings(script_sentences=args.script_sentences, llm_first_token=args.llm_latency,
+                            tts_first_byte=args.tts_latency, reddit_latency=args.reddit_latency)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server, env = start_fake_services(settings=settings)
+        s3_server, s3_env = start_fake_s3(bucket_name=f"bench-{uuid.uuid4().hex[:8]}", endpoint_url=args.s3_endpoint)
+        env.update(s3_env)
+        env.update({
+            "RESULT_CACHE_DIR": os.path.join(tmpdir, "result-cache"),
+            "TEMPLATE_CACHE_DIR": os.path.join(tmpdir, "template-cache"),
+            "MAX_QUEUED_JOBS": str(max(args.jobs, 50)),
+        })
+        if args.max_running_jobs:
+            env["MAX_RUNNING_JOBS"] = str(args.max_running_jobs)
+        # Services read their endpoints and limits at import time, so configure them first
+        os.environ.update(env)
+        from routers.router import TEMPLATE_FILE_NAME
+        from utils.services import get_cloudflare_s3, services
+
+        template_path = os.path.abspath(args.template) if args.template else write_test_template(os.path.join(tmpdir, "background.mp4"))
+        get_cloudflare_s3().upload_path_to_s3(template_path, env["CLOUDFLARE_TTS_BUCKET_NAME"], TEMPLATE_FILE_NAME)
+
+        cpu_start = cpu_seconds()
+        start = time.perf_counter()
+        results = asyncio.run(run_jobs(args.jobs, args.concurrency))
+        summary = summarize(results, time.perf_counter() - start, cpu_seconds() - cpu_start)
+        print_summary(summary)
+        if args.json:
+            with open(args.json, "w") as output:
+                json.dump(summary, output, indent=2)
+
+        services.close()
+        server.shutdown()
+        if s3_server:
+            s3_server.stop()
+
+if __name__ == "__main__":
+    main()
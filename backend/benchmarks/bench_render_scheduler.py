@@ -0,0 +1,85 @@
+"""
+Compare aggregate render throughput of the fixed encode settings against the render scheduler.
+
+N renders are submitted at once and run --concurrency at a time, like the render stage of the
+job executor. "fixed" uses EncodeProfile.from_env() for every render (x264 picks its own thread
+count), "scheduled" leases a thread budget and a preset from the ladder by the renders still waiting.
+
+Usage (from backend/): python -m benchmarks.bench_render_scheduler [--renders 8] [--concurrency 4] [--template bg.mp4]
+"""
+import os
+import time
+import wave
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from media.templates import EncodeProfile
+from media.render_scheduler import RenderScheduler, CPU_COUNT
+from media.video import process_video_streaming
+from benchmarks.fakes import write_test_template
+from benchmarks.bench_template_render import write_test_inputs
+
+def run_renders(renders: int, concurrency: int, template_path: str, audio_bytes: bytes, srt_path: str,
+                tmpdir: str, scheduler: RenderScheduler = None) -> dict:
+    waiting = [renders]
+    lock = threading.Lock()
+    presets = {}
+
+    def render(index: int) -> float:
+        workdir = os.path.join(tmpdir, f"render_{index}")
+        os.makedirs(workdir, exist_ok=True)
+        with lock:
+            waiting[0] -= 1
+        start = time.perf_counter()
+        render_stats = {}
+        if scheduler:
+            scheduler.run(process_video_streaming, audio_bytes, template_path, workdir, caption_path=srt_path,
+                          get_queue_depth=lambda: waiting[0], render_stats=render_stats)
+        else:
+            process_video_streaming(audio_bytes, template_path, workdir, caption_path=srt_path,
+                                    encode_profile=EncodeProfile.from_env(), render_stats=render_stats)
+        preset = render_stats.get("encode_profile", {}).get("preset", EncodeProfile.from_env().preset)
+        with lock:
+            presets[preset] = presets.get(preset, 0) + 1
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        seconds = list(pool.map(render, range(renders)))
+    wall = time.perf_counter() - start
+    return {
+        "wall": wall,
+        "renders_per_minute": renders / wall * 60,
+        "mean_render": sum(seconds) / len(seconds),
+        "presets": presets,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--renders", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=CPU_COUNT, help="Renders running at once")
+    parser.add_argument("--template", help="Background template, a synthetic one is used if omitted")
+    parser.add_argument("--duration", type=float, default=15.0, help="Voiceover length in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template_path = os.path.abspath(args.template) if args.template else write_test_template(os.path.join(tmpdir, "background.mp4"))
+        audio_path, srt_path = write_test_inputs(tmpdir, args.duration)
+        with open(audio_path, "rb") as f:
+            audio_bytes = f.read()
+
+        variants = {
+            "fixed": None,
+            "scheduled": RenderScheduler(),
+        }
+        print(f"{args.renders} renders, {args.concurrency} at a time on {CPU_COUNT} cores")
+        print(f"{'variant':12} {'wall s':>8} {'renders/min':>12} {'mean render s':>14}  presets")
+        for name, scheduler in variants.items():
+            result = run_renders(args.renders, args.concurrency, template_path, audio_bytes, srt_path,
+                                 os.path.join(tmpdir, name), scheduler)
+            presets = ", ".join(f"{preset} x{count}" for preset, count in sorted(result["presets"].items()))
+            print(f"{name:12} {result['wall']:8.2f} {result['renders_per_minute']:12.2f} {result['mean_render']:14.2f}  {presets}")
+
+if __name__ == "__main__":
+    main()
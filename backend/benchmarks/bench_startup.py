@@ -0,0 +1,85 @@
+"""
+Measure backend cold-start cost: the time and memory it takes to import the app.
+
+Each run imports index in a fresh interpreter and reports wall time, peak RSS and the
+slowest imports (from -X importtime). It exits non-zero when a budget is exceeded or
+when a heavy library that should only load on first use is imported at startup, so it
+can run in CI to stop startup regressions.
+
+Usage (from backend/): python -m benchmarks.bench_startup [--runs 5] [--max-seconds 1.5] [--max-rss-mb 150]
+"""
+import sys
+import json
+import argparse
+import subprocess
+
+# Libraries that must only be imported on the code paths that use them
+LAZY_MODULES = ["moviepy", "numpy", "imageio", "boto3", "botocore", "openai", "deepgram", "deepgram_captions"]
+
+PROBE = """
+import sys, json, time, resource
+start = time.perf_counter()
+import index
+seconds = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+# ru_maxrss is in bytes on macOS and kilobytes on Linux
+rss_mb = rss_kb / 1024 ** 2 if sys.platform == "darwin" else rss_kb / 1024
+loaded = sorted({name.split(".")[0] for name in sys.modules})
+print(json.dumps({"seconds": seconds, "rss_mb": rss_mb, "loaded": loaded}))
+"""
+
+def run_probe(importtime: bool = False) -> tuple:
+    cmd = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", PROBE]
+    result = subprocess.run(cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+def slowest_imports(importtime_log: str, top: int) -> list:
+    """Top-level packages by cumulative import time, from -X importtime output"""
+    totals = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[len("import time:"):].split("|")
+            microseconds = int(cumulative)
+        except ValueError:
+            continue
+        # Nesting is shown by indentation, only top-level entries are counted since
+        # their cumulative time already includes everything they imported
+        name = name[1:]
+        if not name.startswith(" ") and "." not in name:
+            totals[name] = max(totals.get(name, 0), microseconds)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.5, help="Budget for the median import time")
+    parser.add_argument("--max-rss-mb", type=float, default=150, help="Budget for peak RSS after import")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to list")
+    args = parser.parse_args()
+
+    samples = [run_probe()[0] for _ in range(args.runs)]
+    seconds = sorted(sample["seconds"] for sample in samples)[len(samples) // 2]
+    rss_mb = max(sample["rss_mb"] for sample in samples)
+    print(f"import index: median {seconds:.3f}s, peak RSS {rss_mb:.1f} MB over {args.runs} runs")
+
+    _, importtime_log = run_probe(importtime=True)
+    print("Slowest imports:")
+    for name, microseconds in slowest_imports(importtime_log, args.top):
+        print(f"  {name:30} {microseconds / 1000:8.1f} ms")
+
+    failures = []
+    if seconds > args.max_seconds:
+        failures.append(f"import time {seconds:.3f}s exceeds {args.max_seconds}s")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb} MB")
+    eager = [name for name in LAZY_MODULES if name in samples[0]["loaded"]]
+    if eager:
+        failures.append(f"imported at startup but should be lazy: {', '.join(eager)}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compare the sequential script -> TTS -> render path against sentence-level streaming.
+
+Runs offline against the fake LLM/TTS servers from benchmarks.fakes and reports
+time to first audio, time to first rendered segment and end-to-end latency.
+Without --template a synthetic background is generated with ffmpeg.
+
+Usage (from backend/): python -m benchmarks.bench_streaming [--template ss_background.mp4] [--runs 3]
+"""
+import os
+import time
+import argparse
+import tempfile
+from benchmarks.fakes import start_fake_services, write_test_template
+
+def run_sequential(openai_service, deepgram_service, template_path: str, workdir: str) -> dict:
+    from media.video import prepare_captions, process_video_streaming
+
+    start = time.perf_counter()
+    script = openai_service.generate_commentary_script("Title", "Description")
+    audio = deepgram_service.generate_audio_with_deepgram(script)
+    first_audio = time.perf_counter() - start
+    caption_path = prepare_captions(audio, script, workdir)
+    process_video_streaming(audio, template_path, workdir, script=script, caption_path=caption_path)
+    total = time.perf_counter() - start
+    # Nothing is rendered before the whole voiceover exists
+    return {"first_audio": first_audio, "first_segment": total, "total": total}
+
+def run_streaming(openai_service, deepgram_service, template_path: str, workdir: str) -> dict:
+    from media.streaming import render_sentence_stream
+
+    start = time.perf_counter()
+    render_stats = {}
+    deltas = openai_service.stream_commentary_script("Title", "Description")
+    render_sentence_stream(deltas, deepgram_service.stream_pcm_with_deepgram, template_path, workdir,
+                           render_stats=render_stats)
+    return {
+        "first_audio": render_stats["first_audio_seconds"],
+        "first_segment": render_stats["first_segment_seconds"],
+        "total": time.perf_counter() - start,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--template", help="Path to a background template, a synthetic one is used if omitted")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    # The clients read their endpoints at import time, so point them at the fakes first
+    server, env = start_fake_services()
+    os.environ.update(env)
+    from clients.openai import OpenAIService
+    from clients.deepgram import DeepgramService
+    from media.templates import get_prepared_template
+
+    openai_service = OpenAIService()
+    deepgram_service = DeepgramService()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        template_path = os.path.abspath(args.template) if args.template else write_test_template(os.path.join(tmpdir, "background.mp4"))
+        get_prepared_template(template_path)
+
+        print(f"{'variant':12} {'first audio s':>14} {'first segment s':>16} {'total s':>8}")
+        for name, run in (("sequential", run_sequential), ("streaming", run_streaming)):
+            results = []
+            for _ in range(args.runs):
+                with tempfile.TemporaryDirectory(dir=tmpdir) as workdir:
+                    results.append(run(openai_service, deepgram_service, template_path, workdir))
+            averages = {key: sum(r[key] for r in results) / len(results) for key in results[0]}
+            print(f"{name:12} {averages['first_audio']:14.2f} {averages['first_segment']:16.2f} {averages['total']:8.2f}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
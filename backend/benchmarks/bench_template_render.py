@@ -0,0 +1,84 @@
+"""
+Compare the legacy full-template render against rendering from prepared segments.
+
+Usage (from backend/): python -m benchmarks.bench_template_render --template ss_background.mp4 --duration 20
+"""
+import os
+import time
+import wave
+import argparse
+import resource
+import tempfile
+import subprocess
+from media.templates import EncodeProfile, get_prepared_template, write_segment_playlist
+
+def write_test_inputs(tmpdir: str, duration: float) -> tuple:
+    """Write a silent voiceover WAV and an SRT with one caption per second"""
+    audio_path = os.path.join(tmpdir, "audio.wav")
+    with wave.open(audio_path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(24000)
+        f.writeframes(b"\0\0" * int(24000 * duration))
+
+    srt_path = os.path.join(tmpdir, "captions.srt")
+    with open(srt_path, "w", encoding="utf-8") as f:
+        for second in range(int(duration)):
+            f.write(f"{second + 1}\n00:00:{second:02d},000 --> 00:00:{second:02d},900\nCaption number {second + 1}\n\n")
+    return audio_path, srt_path
+
+def run_ffmpeg(video_input: list, audio_path: str, srt_path: str, encode_args: list, output_path: str) -> dict:
+    cmd = [
+        'ffmpeg', '-y', *video_input, '-i', audio_path,
+        '-vf', f"subtitles='{srt_path}':force_style='Fontsize=18'",
+        *encode_args,
+        '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-b:a', '128k', '-movflags', '+faststart',
+        '-map', '0:v', '-map', '1:a', '-shortest', output_path
+    ]
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stderr=subprocess.PIPE)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {"wall": wall, "cpu": cpu, "size": os.path.getsize(output_path)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--template", required=True, help="Path to the background template")
+    parser.add_argument("--duration", type=float, default=20.0, help="Voiceover length in seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    template_path = os.path.abspath(args.template)
+    start = time.perf_counter()
+    manifest = get_prepared_template(template_path)
+    print(f"Template preparation (one-off or cached): {time.perf_counter() - start:.2f}s")
+
+    profile = EncodeProfile.from_env()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        audio_path, srt_path = write_test_inputs(tmpdir, args.duration)
+        playlist_path = write_segment_playlist(template_path, manifest, args.duration, os.path.join(tmpdir, "bg.ffconcat"))
+        variants = {
+            "legacy (stream_loop, medium)": (
+                ['-stream_loop', '-1', '-i', template_path],
+                ['-c:v', 'libx264', '-preset', 'medium', '-crf', '28']
+            ),
+            f"segments ({profile.preset}, crf {profile.crf})": (
+                ['-f', 'concat', '-safe', '0', '-i', playlist_path],
+                profile.ffmpeg_args()
+            ),
+        }
+        print(f"{'variant':40} {'wall s':>8} {'cpu s':>8} {'size MB':>8}")
+        for name, (video_input, encode_args) in variants.items():
+            results = [
+                run_ffmpeg(video_input, audio_path, srt_path, encode_args, os.path.join(tmpdir, f"out_{run}.mp4"))
+                for run in range(args.runs)
+            ]
+            wall = sum(r["wall"] for r in results) / len(results)
+            cpu = sum(r["cpu"] for r in results) / len(results)
+            size = results[-1]["size"] / 1024 ** 2
+            print(f"{name:40} {wall:8.2f} {cpu:8.2f} {size:8.2f}")
+
+if __name__ == "__main__":
+    main()
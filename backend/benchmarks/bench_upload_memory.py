@@ -0,0 +1,104 @@
+"""
+Measure peak memory per job of the upload paths for a rendered video.
+
+Each variant runs in a fresh process and reports how far its peak RSS grew over the
+baseline after imports. Without --endpoint-url parts are sent to an in-process client
+that only counts bytes, with it (e.g. a local MinIO or moto server) real requests are made.
+
+Usage (from backend/): python -m benchmarks.bench_upload_memory --size-mb 50
+"""
+import os
+import sys
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+import boto3
+from storage.cloudflare_s3 import CloudflareS3
+
+VARIANTS = ["bytesio", "path", "stream"]
+BUCKET_NAME = "bench"
+
+class CountingS3Client:
+    """Accepts uploads and keeps only the number of bytes received"""
+    def __init__(self):
+        self.received = 0
+
+    def upload_fileobj(self, fileobj, bucket, key, **kwargs):
+        while True:
+            chunk = fileobj.read(8 * 1024 ** 2)
+            if not chunk:
+                break
+            self.received += len(chunk)
+
+    def upload_file(self, file_path, bucket, key, **kwargs):
+        with open(file_path, "rb") as f:
+            self.upload_fileobj(f, bucket, key)
+
+    def create_multipart_upload(self, **kwargs):
+        return {"UploadId": "bench"}
+
+    def upload_part(self, Body, PartNumber, **kwargs):
+        self.received += len(Body)
+        return {"ETag": f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, **kwargs):
+        pass
+
+    def abort_multipart_upload(self, **kwargs):
+        pass
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+def run_variant(variant: str, file_path: str, endpoint_url: str):
+    if endpoint_url:
+        s3_client = boto3.client("s3", endpoint_url=endpoint_url, region_name="auto")
+        s3_client.create_bucket(Bucket=BUCKET_NAME)
+    else:
+        s3_client = CountingS3Client()
+    cloudflare_s3 = CloudflareS3(s3_client=s3_client)
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+
+    if variant == "bytesio":
+        # Previous behaviour: the whole output is read into memory before uploading
+        with open(file_path, "rb") as f:
+            video_bytes = f.read()
+        cloudflare_s3.upload_file_to_s3(video_bytes, BUCKET_NAME, "bench.mp4")
+    elif variant == "path":
+        cloudflare_s3.upload_path_to_s3(file_path, BUCKET_NAME, "bench.mp4")
+    else:
+        with open(file_path, "rb") as f:
+            cloudflare_s3.upload_stream_to_s3(f, BUCKET_NAME, "bench.mp4")
+
+    print(f"{variant:10} {time.perf_counter() - start:8.2f} {peak_rss_mb() - baseline:12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size-mb", type=int, default=50, help="Size of the fake rendered video")
+    parser.add_argument("--endpoint-url", help="S3-compatible endpoint to upload to")
+    parser.add_argument("--variant", choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument("--file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        run_variant(args.variant, args.file, args.endpoint_url)
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4") as f:
+        for _ in range(args.size_mb):
+            f.write(os.urandom(1024 ** 2))
+        f.flush()
+        print(f"{'variant':10} {'wall s':>8} {'peak RSS +MB':>12}")
+        for variant in VARIANTS:
+            cmd = [sys.executable, "-m", "benchmarks.bench_upload_memory", "--variant", variant, "--file", f.name]
+            if args.endpoint_url:
+                cmd += ["--endpoint-url", args.endpoint_url]
+            subprocess.run(cmd, check=True)
+
+if __name__ == "__main__":
+    main()
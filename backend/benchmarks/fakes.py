@@ -0,0 +1,306 @@
+"""
+Local stand-ins for Reddit, OpenAI, Deepgram and S3 for running the pipeline offline.
+
+One HTTP server answers:
+- Reddit's token, post and listing endpoints with canned JSON.
+- The OpenAI Responses API (plain and streamed), with a script of configurable length.
+- Deepgram's /v1/speak, with a synthetic voice: one tone burst per word and pauses between
+  sentences, so local caption alignment behaves like it does on real speech.
+
+Latencies are configurable to model time-to-first-token and time-to-first-byte.
+S3 is served by moto's server (`pip install "moto[server]"`) unless an endpoint is given.
+
+Usage (from backend/): python -m benchmarks.fakes [--port 8765] [--s3]
+then export the printed variables before starting the backend.
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import struct
+import argparse
+import threading
+import subprocess
+from array import array
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from media.captions import estimate_word_weight
+
+DEFAULT_SCRIPT = (
+    "Did you know that a single Reddit post can change how a whole city commutes? "
+    "One user asked why the buses in their town always arrived in pairs. "
+    "Hundreds of replies later, a transit planner explained the bunching effect in plain words. "
+    "The city read the thread, changed the schedule, and the wait times dropped by a third. "
+    "Sometimes the internet really does fix things."
+)
+
+class FakeSettings:
+    """Script length and latencies of the fake services, in seconds"""
+    def __init__(self, script: str = DEFAULT_SCRIPT, script_sentences: int = None, llm_first_token: float = 0.4,
+                 llm_token_interval: float = 0.02, tts_first_byte: float = 0.25, tts_realtime_factor: float = 0.1,
+                 reddit_latency: float = 0.1):
+        if script_sentences:
+            # Repeat the sentences of the canned script to reach the requested length
+            sentences = re.findall(r"[^.!?]+[.!?]", script)
+            script = " ".join(sentences[i % len(sentences)].strip() for i in range(script_sentences))
+        self.script = script
+        self.llm_first_token = llm_first_token
+        self.llm_token_interval = llm_token_interval
+        self.tts_first_byte = tts_first_byte
+        # Seconds spent producing one second of audio after the first byte
+        self.tts_realtime_factor = tts_realtime_factor
+        self.reddit_latency = reddit_latency
+
+# Compressed TTS encodings: response content type and the ffmpeg muxer and encoder producing them
+COMPRESSED_ENCODINGS = {
+    "aac": ("audio/aac", "adts", "aac"),
+    "mp3": ("audio/mpeg", "mp3", "libmp3lame"),
+    "opus": ("audio/ogg", "ogg", "libopus"),
+}
+
+def encode_pcm(pcm: bytes, sample_rate: int, encoding: str, bit_rate: int) -> bytes:
+    """Encode the synthetic voice like Deepgram's compressed encodings"""
+    _, muxer, encoder = COMPRESSED_ENCODINGS[encoding]
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+        '-c:a', encoder, '-b:a', str(bit_rate), '-f', muxer, 'pipe:1'
+    ], input=pcm, stdout=subprocess.PIPE, check=True)
+    return result.stdout
+
+def reddit_post(post_id: str, subreddit: str = "bench") -> dict:
+    return {
+        "id": post_id,
+        "title": f"Why do buses always arrive in pairs? ({post_id})",
+        "selftext": "Every morning I wait twenty minutes and then two buses show up at once. What is going on?",
+        "permalink": f"/r/{subreddit}/comments/{post_id}/why_do_buses_arrive_in_pairs/",
+        "stickied": False,
+    }
+
+def reddit_comments(post_id: str) -> list:
+    """A post with comments in the shape of /comments/{id}.json"""
+    comments = [
+        {"kind": "t1", "data": {"body": f"Comment {index} on {post_id}", "ups": 100 - index}}
+        for index in range(20)
+    ]
+    return [
+        {"kind": "Listing", "data": {"children": [{"kind": "t3", "data": reddit_post(post_id)}]}},
+        {"kind": "Listing", "data": {"children": comments}},
+    ]
+
+def synthesize_pcm(text: str, sample_rate: int) -> bytes:
+    """Synthetic mono 16-bit speech: a tone per word sized by its syllables, gaps between words"""
+    samples = array("h")
+    silence = lambda seconds: samples.extend([0] * int(sample_rate * seconds))
+    silence(0.08)
+    for index, word in enumerate(text.split()):
+        duration = 0.1 * estimate_word_weight(word)
+        frequency = 180 + 40 * (index % 5)
+        samples.extend(int(8000 * math.sin(2 * math.pi * frequency * n / sample_rate)) for n in range(int(sample_rate * duration)))
+        silence(0.3 if re.search(r"[.!?,]$", word) else 0.16)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+def wav_header(sample_rate: int) -> bytes:
+    """Streaming WAV header with placeholder sizes, like TTS APIs send"""
+    return (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE" +
+            b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, sample_rate, sample_rate * 2, 2, 16) +
+            b"data" + struct.pack("<I", 0xFFFFFFFF))
+
+def make_handler(settings: FakeSettings):
+    class FakeHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def read_body(self) -> bytes:
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def send_json(self, body: dict):
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def start_chunked(self, content_type: str):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+
+        def write_chunk(self, data: bytes):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def end_chunked(self):
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            time.sleep(settings.reddit_latency)
+            post = re.match(r"^/comments/([a-z0-9]+)\.json$", url.path)
+            listing = re.match(r"^/r/(\w+)/(top|hot)\.json$", url.path)
+            if post:
+                self.send_json(reddit_comments(post.group(1)))
+            elif listing:
+                limit = int(parse_qs(url.query).get("limit", ["10"])[0])
+                children = [
+                    {"kind": "t3", "data": reddit_post(f"{listing.group(1).lower()[:4]}{index:04d}", listing.group(1))}
+                    for index in range(limit)
+                ]
+                self.send_json({"kind": "Listing", "data": {"children": children}})
+            else:
+                self.send_error(404)
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            if path == "/api/v1/access_token":
+                self.read_body()
+                time.sleep(settings.reddit_latency)
+                self.send_json({"access_token": "fake-token", "token_type": "bearer", "expires_in": 3600})
+            elif path.endswith("/responses"):
+                self.handle_responses(json.loads(self.read_body() or b"{}"))
+            elif path.endswith("/speak"):
+                self.handle_speak(json.loads(self.read_body() or b"{}"))
+            else:
+                self.send_error(404)
+
+        def handle_responses(self, request: dict):
+            response = {
+                "id": "resp_fake", "object": "response", "created_at": int(time.time()), "model": request.get("model"),
+                "status": "completed", "parallel_tool_calls": False, "tool_choice": "auto", "tools": [],
+                "output": [{
+                    "type": "message", "id": "msg_fake", "role": "assistant", "status": "completed",
+                    "content": [{"type": "output_text", "text": settings.script, "annotations": []}],
+                }],
+            }
+            time.sleep(settings.llm_first_token)
+            if not request.get("stream"):
+                self.send_json(response)
+                return
+
+            self.start_chunked("text/event-stream")
+            sequence = 0
+            # Word-sized deltas keep their leading whitespace, like model tokens
+            for token in re.findall(r"\s*\S+", settings.script):
+                event = {
+                    "type": "response.output_text.delta", "item_id": "msg_fake", "output_index": 0,
+                    "content_index": 0, "delta": token, "sequence_number": sequence,
+                }
+                self.write_chunk(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+                sequence += 1
+                time.sleep(settings.llm_token_interval)
+            event = {"type": "response.completed", "response": response, "sequence_number": sequence}
+            self.write_chunk(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+            self.end_chunked()
+
+        def handle_speak(self, request: dict):
+            query = parse_qs(urlparse(self.path).query)
+            sample_rate = int(query.get("sample_rate", ["24000"])[0])
+            pcm = synthesize_pcm(request.get("text", ""), sample_rate)
+            time.sleep(settings.tts_first_byte)
+            encoding = query.get("encoding", ["linear16"])[0]
+            if encoding in COMPRESSED_ENCODINGS:
+                audio = encode_pcm(pcm, sample_rate, encoding, int(query.get("bit_rate", ["48000"])[0]))
+                self.start_chunked(COMPRESSED_ENCODINGS[encoding][0])
+            elif query.get("container") == ["none"]:
+                audio = pcm
+                self.start_chunked("audio/l16")
+            else:
+                audio = wav_header(sample_rate) + pcm
+                self.start_chunked("audio/wav")
+            # 100 ms of PCM per chunk (less for compressed audio), produced at the configured realtime factor
+            chunk_size = sample_rate // 10 * 2
+            for offset in range(0, len(audio), chunk_size):
+                self.write_chunk(audio[offset:offset + chunk_size])
+                time.sleep(0.1 * settings.tts_realtime_factor)
+            self.end_chunked()
+
+    return FakeHandler
+
+def start_fake_services(port: int = 0, settings: FakeSettings = None) -> tuple:
+    """
+    Serve the fakes on a background thread.
+    Returns the server and the environment variables that point the clients at it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(settings or FakeSettings()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    env = {
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "fake",
+        "DEEPGRAM_API_URL": base_url,
+        "DEEPGRAM_API_KEY": "fake",
+        "REDDIT_API_URL": base_url,
+        "REDDIT_AUTH_URL": base_url,
+        "REDDIT_APP_CLIENT_ID": "fake",
+        "REDDIT_APP_SECRET_KEY": "fake",
+    }
+    return server, env
+
+def start_fake_s3(bucket_name: str = "bench", endpoint_url: str = None, port: int = 0) -> tuple:
+    """
+    Serve S3 with moto, or use an existing S3-compatible endpoint (e.g. MinIO), and create the bucket.
+    Returns the server (None for an existing endpoint) and the environment variables for CloudflareS3.
+    """
+    server = None
+    if not endpoint_url:
+        from moto.server import ThreadedMotoServer
+        server = ThreadedMotoServer(ip_address="127.0.0.1", port=port or 5000 + os.getpid() % 1000)
+        server.start()
+        endpoint_url = f"http://127.0.0.1:{server._server.server_port}"
+    env = {
+        "CLOUDFLARE_ENDPOINT_URL": endpoint_url,
+        "CLOUDFLARE_ACCESS_KEY_ID": os.environ.get("CLOUDFLARE_ACCESS_KEY_ID", "fake"),
+        "CLOUDFLARE_SECRET_ACCESS_KEY": os.environ.get("CLOUDFLARE_SECRET_ACCESS_KEY", "fake"),
+        "CLOUDFLARE_TTS_BUCKET_NAME": bucket_name,
+        "CLOUDFLARE_PUBLIC_BUCKET_URL": f"{endpoint_url}/{bucket_name}",
+    }
+    import boto3
+    s3_client = boto3.client(
+        "s3", endpoint_url=endpoint_url, region_name="us-east-1",
+        aws_access_key_id=env["CLOUDFLARE_ACCESS_KEY_ID"], aws_secret_access_key=env["CLOUDFLARE_SECRET_ACCESS_KEY"]
+    )
+    try:
+        s3_client.create_bucket(Bucket=bucket_name)
+    except s3_client.exceptions.BucketAlreadyOwnedByYou:
+        pass
+    return server, env
+
+def write_test_template(path: str, seconds: int = 60, width: int = 1080, height: int = 1920, fps: int = 30) -> str:
+    """Write a synthetic background video with ffmpeg's test source"""
+    subprocess.run([
+        'ffmpeg', '-y', '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}', '-t', str(seconds),
+        '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path
+    ], check=True, stderr=subprocess.PIPE)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--s3", action="store_true", help="Also serve S3 with moto")
+    parser.add_argument("--script-sentences", type=int, help="Length of the fake LLM's script")
+    args = parser.parse_args()
+    server, env = start_fake_services(args.port, FakeSettings(script_sentences=args.script_sentences))
+    s3_server = None
+    if args.s3:
+        s3_server, s3_env = start_fake_s3(port=args.port + 1)
+        env.update(s3_env)
+    for name, value in env.items():
+        print(f"export {name}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        if s3_server:
+            s3_server.stop()
+
+if __name__ == "__main__":
+    main()
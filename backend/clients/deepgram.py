@@ -1,18 +1,42 @@
 import os
-from deepgram import DeepgramClient, SpeakOptions, PrerecordedOptions
-from deepgram_captions import DeepgramConverter, srt
+from typing import Iterator
+from media.audio import TTS_AUDIO_CODEC, TTS_BIT_RATE, AUDIO_FORMATS, get_audio_format
 
 DEEPGRAM_API_KEY = os.environ.get("DEEPGRAM_API_KEY")
+# Override to point the client at a local fake server for offline runs
+DEEPGRAM_API_URL = os.environ.get("DEEPGRAM_API_URL", "api.deepgram.com")
+# Sample rate of the raw PCM requested for streamed sentences
+TTS_SAMPLE_RATE = int(os.environ.get("TTS_SAMPLE_RATE", 24000))
 
 class DeepgramService:
     """
     This class is used to generate audio and captions with Deepgram
     """
     def __init__(self):
-        self.deepgram_client = DeepgramClient(DEEPGRAM_API_KEY)
-        self.audio_options = SpeakOptions(
+        # The SDK is imported on first use, it is slow to import
+        from deepgram import DeepgramClient, DeepgramClientOptions, SpeakOptions, PrerecordedOptions
+
+        self.deepgram_client = DeepgramClient(DEEPGRAM_API_KEY, DeepgramClientOptions(url=DEEPGRAM_API_URL))
+        if TTS_AUDIO_CODEC not in AUDIO_FORMATS:
+            raise ValueError(f"Unsupported TTS_AUDIO_CODEC: {TTS_AUDIO_CODEC}")
+        if TTS_AUDIO_CODEC == "linear16":
+            self.audio_options = SpeakOptions(
+                model='aura-2-apollo-en',
+                encoding='linear16'
+            )
+        else:
+            # Compressed voiceovers are a fraction of the size and are copied into the MP4 without re-encoding
+            self.audio_options = SpeakOptions(
+                model='aura-2-apollo-en',
+                encoding=TTS_AUDIO_CODEC,
+                bit_rate=TTS_BIT_RATE
+            )
+        # Headerless PCM, so chunks can go straight into ffmpeg's stdin
+        self.pcm_options = SpeakOptions(
             model='aura-2-apollo-en',
-            encoding='linear16'
+            encoding='linear16',
+            container='none',
+            sample_rate=TTS_SAMPLE_RATE
         )
         self.caption_options = PrerecordedOptions(
             smart_format=True,
@@ -23,7 +47,7 @@ class DeepgramService:
 
     def generate_audio_with_deepgram(self, input_text: str) -> bytes:
         """
-        Generate audio with Deepgram and return raw bytes
+        Generate audio with Deepgram in TTS_AUDIO_CODEC and return raw bytes
         """
         try:
             # Build request body using input text
@@ -48,21 +72,46 @@ class DeepgramService:
         except Exception as e:
             raise ValueError(f"Error generating speech: {e}") from e
 
+    def stream_pcm_with_deepgram(self, input_text: str) -> Iterator[bytes]:
+        """
+        Generate audio with Deepgram and yield mono 16-bit PCM chunks as they arrive
+        """
+        try:
+            response = self.deepgram_client.speak.rest.v("1").stream_raw(
+                {"text": input_text},
+                self.pcm_options
+            )
+        except Exception as e:
+            raise ValueError(f"Error generating speech: {e}") from e
+        try:
+            yield from response.iter_bytes()
+        finally:
+            response.close()
+
+    def transcribe_with_deepgram(self, audio_file_path: str):
+        """
+        Transcribe an audio file path with Deepgram and return the raw response
+        """
+        with open(audio_file_path, "rb") as audio:
+            audio_bytes = audio.read()
+            source = {
+                "buffer": audio_bytes,
+                "mimetype": get_audio_format(audio_bytes)["mimetype"]
+            }
+            return self.deepgram_client.listen.prerecorded.v("1").transcribe_file(
+                source,
+                self.caption_options
+            )
+
     def generate_captions_with_deepgram(self, audio_file_path: str) -> str:
         """
         Generate captions with Deepgram from an audio file path
         """
+        from deepgram_captions import DeepgramConverter, srt
+
         try:
             # Transcribe audio file using Deepgram
-            with open(audio_file_path, "rb") as audio:
-                source = {
-                    "buffer": audio.read(),
-                    "mimetype": "audio/wav"
-                }
-                response = self.deepgram_client.listen.prerecorded.v("1").transcribe_file(
-                    source,
-                    self.caption_options
-                )
+            response = self.transcribe_with_deepgram(audio_file_path)
             # Process transcription response
             transcription = DeepgramConverter(response)
             return srt(transcription) # Return transcription in SRT format
@@ -1,18 +1,20 @@
 import os
-from openai import OpenAI
+from typing import Iterator
 
 class OpenAIService:
     """
     This class is used to generate audio and captions with OpenAI
     """
     def __init__(self):
-        self.openai_client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'))
+        from openai import OpenAI  # Imported on first use, it is slow to import
 
-    def generate_commentary_script(self, title: str, description: str) -> str:
-        """
-        Generate a concise, engaging voiceover script for vertical Shorts video
-        """
-        prompt = f"""
+        # OPENAI_BASE_URL can point the client at a local fake server for offline runs
+        self.openai_client = OpenAI(api_key=os.environ.get('OPENAI_API_KEY'), base_url=os.environ.get('OPENAI_BASE_URL'))
+
+    def build_commentary_prompt(self, title: str, description: str, max_words: int = None) -> str:
+        # A word budget is given when a previous script came out too long or too short
+        length_rule = f" Use between {int(max_words * 0.85)} and {max_words} words." if max_words else ""
+        return f"""
             Generate a concise, engaging voiceover script for vertical Shorts video:
 
             Title: {title}
@@ -33,8 +35,14 @@ class OpenAIService:
             • Payoff: 1–2 sentences delivering a satisfying conclusion.
             • Start with something like: "Did you know", or catchy line
 
-            Make sure that the text is not too long and not too short. The video is from 15 to 20 seconds. Make sure the captions do not exceed the video duration.
+            Make sure that the text is not too long and not too short. The video is from 15 to 20 seconds. Make sure the captions do not exceed the video duration.{length_rule}
+        """
+
+    def generate_commentary_script(self, title: str, description: str, max_words: int = None) -> str:
+        """
+        Generate a concise, engaging voiceover script for vertical Shorts video
         """
+        prompt = self.build_commentary_prompt(title, description, max_words)
         try:
             # Generate commentary script using OpenAI
             openai_response = self.openai_client.responses.create(
@@ -46,6 +54,24 @@ class OpenAIService:
             print(f"Error generating commentary script: {e}")
             raise e
 
+    def stream_commentary_script(self, title: str, description: str) -> Iterator[str]:
+        """
+        Generate the commentary script as a stream of text deltas
+        """
+        prompt = self.build_commentary_prompt(title, description)
+        try:
+            stream = self.openai_client.responses.create(
+                model="gpt-4o-mini",
+                input=prompt,
+                stream=True
+            )
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    yield event.delta
+        except Exception as e:
+            print(f"Error streaming commentary script: {e}")
+            raise e
+
     def text_to_speech_file(self, text: str, voice: str = "onyx") -> bytes:
         """
         Generate speech using OpenAI TTS API and return raw bytes.
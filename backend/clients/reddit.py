@@ -1,65 +1,192 @@
 import requests
 import base64
 import os
-from typing import Dict
+import re
+import time
+import random
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+from requests.adapters import HTTPAdapter
+
+POST_ID_PATTERN = re.compile(r"/comments/([a-z0-9]+)", re.IGNORECASE)
+SUBREDDIT_PATTERN = re.compile(r"^[A-Za-z0-9_]{2,21}$")
+LISTINGS = ("top", "hot")
+TIME_FILTERS = ("hour", "day", "week", "month", "year", "all")
+
+# Overridable to point the client at a local fake server for offline runs
+REDDIT_API_URL = os.environ.get("REDDIT_API_URL", "https://oauth.reddit.com")
+REDDIT_AUTH_URL = os.environ.get("REDDIT_AUTH_URL", "https://www.reddit.com")
+REDDIT_MAX_RETRIES = int(os.environ.get("REDDIT_MAX_RETRIES", 3))
+REDDIT_BACKOFF_SECONDS = float(os.environ.get("REDDIT_BACKOFF_SECONDS", 0.5))
+REDDIT_MAX_BACKOFF_SECONDS = 30.0
+# Refresh the access token this many seconds before Reddit expires it
+TOKEN_REFRESH_MARGIN_SECONDS = 60
+SHORT_LINK_CACHE_SIZE = 1024
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
 
 class RedditClient:
     """
-    This class is used to fetch a post and its comments from a given URL and return the post data
+    This class is used to fetch a post and its comments from a given URL and return the post data.
+
+    One instance is meant to be shared: it keeps a pooled keep-alive session, caches the
+    OAuth token until shortly before it expires and caches resolved /s/ share links.
     """
-    def __init__(self):
+    def __init__(self, pool_size: int = 16):
         self.auth_headers = {
             'User-Agent': 'ai-reels-builder/1.0 by TimTimer'
         }
-    
-    def get_reddit_access_token(self):
-        """Get Reddit API access token using client credentials"""
-        client_id = os.getenv("REDDIT_APP_CLIENT_ID")
-        client_secret = os.getenv("REDDIT_APP_SECRET_KEY")
-        
-        if not client_id or not client_secret:
-            raise Exception("Reddit API credentials not found in environment variables")
-        
-        auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
-        headers = {
-            'Authorization': f'Basic {auth}',
-            'User-Agent': self.auth_headers['User-Agent']
-        }
-        data = {'grant_type': 'client_credentials'}
-        
-        response = requests.post('https://www.reddit.com/api/v1/access_token', 
-                               headers=headers, data=data)
-        
-        if response.status_code == 200:
-            return response.json()['access_token']
-        else:
-            raise Exception(f"Failed to get Reddit access token: {response.text}")
-    
-    def fetch_post_authenticated(self, url: str) -> Dict:
-        """Fetch post using Reddit API authentication"""
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.token_lock = threading.Lock()
+        self.access_token = None
+        self.token_expires_at = 0.0
+
+        self.short_links_lock = threading.Lock()
+        self.short_links = OrderedDict()
+
+        # Reddit reports its remaining budget in X-Ratelimit-* headers
+        self.rate_limit_lock = threading.Lock()
+        self.rate_limited_until = 0.0
+
+    def close(self):
+        self.session.close()
+
+    def _wait_for_rate_limit(self):
+        with self.rate_limit_lock:
+            delay = self.rate_limited_until - time.time()
+        if delay > 0:
+            time.sleep(min(delay, REDDIT_MAX_BACKOFF_SECONDS))
+
+    def _record_rate_limit(self, response: requests.Response):
+        remaining = response.headers.get('X-Ratelimit-Remaining')
+        reset = response.headers.get('X-Ratelimit-Reset')
         try:
-            if '/s/' in url:
-                response = requests.get(url, headers=self.auth_headers, allow_redirects=True, timeout=10)
-                url = response.url
-            
-            # Get access token
-            token = self.get_reddit_access_token()
-            
-            # Convert URL to OAuth endpoint
-            if 'reddit.com' in url:
-                auth_url = url.replace('www.reddit.com', 'oauth.reddit.com')
-                if not auth_url.endswith('.json'):
-                    auth_url += '.json'
+            if remaining is not None and reset is not None and float(remaining) < 1:
+                with self.rate_limit_lock:
+                    self.rate_limited_until = max(self.rate_limited_until, time.time() + float(reset))
+        except ValueError:
+            pass
+
+    def _retry_delay(self, response: requests.Response, attempt: int) -> float:
+        """
+        Honor Retry-After, and X-Ratelimit-Reset when the response was a 429 (Reddit sends the reset
+        on every response, a 5xx is not a rate limit). Otherwise exponential backoff with full jitter.
+        Exhausted budgets (X-Ratelimit-Remaining < 1) are waited out by _record_rate_limit.
+        """
+        if response is not None:
+            headers = ('Retry-After', 'X-Ratelimit-Reset') if response.status_code == 429 else ('Retry-After',)
+            for header in headers:
+                value = response.headers.get(header)
+                if value:
+                    try:
+                        return min(float(value), REDDIT_MAX_BACKOFF_SECONDS) + random.uniform(0, REDDIT_BACKOFF_SECONDS)
+                    except ValueError:
+                        pass
+        return random.uniform(0, min(REDDIT_MAX_BACKOFF_SECONDS, REDDIT_BACKOFF_SECONDS * 2 ** attempt))
+
+    def _request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request through the shared session, retrying 429/5xx and connection errors"""
+        kwargs.setdefault('timeout', 10)
+        for attempt in range(REDDIT_MAX_RETRIES + 1):
+            self._wait_for_rate_limit()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+                self._record_rate_limit(response)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    return response
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == REDDIT_MAX_RETRIES:
+                    raise
+            if attempt == REDDIT_MAX_RETRIES:
+                return response
+            delay = self._retry_delay(response, attempt)
+            print(f"Reddit request to {url} failed, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def get_reddit_access_token(self, force_refresh: bool = False):
+        """Get Reddit API access token using client credentials, reusing it until it is about to expire"""
+        with self.token_lock:
+            if not force_refresh and self.access_token and time.time() < self.token_expires_at:
+                return self.access_token
+
+            client_id = os.getenv("REDDIT_APP_CLIENT_ID")
+            client_secret = os.getenv("REDDIT_APP_SECRET_KEY")
+
+            if not client_id or not client_secret:
+                raise Exception("Reddit API credentials not found in environment variables")
+
+            auth = base64.b64encode(f"{client_id}:{client_secret}".encode()).decode()
+            headers = {
+                'Authorization': f'Basic {auth}',
+                'User-Agent': self.auth_headers['User-Agent']
+            }
+            data = {'grant_type': 'client_credentials'}
+
+            response = self._request('POST', f'{REDDIT_AUTH_URL}/api/v1/access_token',
+                                     headers=headers, data=data)
+
+            if response.status_code == 200:
+                token_data = response.json()
+                self.access_token = token_data['access_token']
+                expires_in = float(token_data.get('expires_in', 3600))
+                self.token_expires_at = time.time() + max(0.0, expires_in - TOKEN_REFRESH_MARGIN_SECONDS)
+                return self.access_token
             else:
-                raise ValueError("Invalid Reddit URL")
-            
-            # Make authenticated request
+                raise Exception(f"Failed to get Reddit access token: {response.text}")
+
+    def resolve_url(self, url: str) -> str:
+        """Resolve /s/ share links to the full post URL"""
+        if '/s/' not in url:
+            return url
+        with self.short_links_lock:
+            if url in self.short_links:
+                self.short_links.move_to_end(url)
+                return self.short_links[url]
+        response = self._request('GET', url, headers=self.auth_headers, allow_redirects=True)
+        resolved_url = response.url
+        if POST_ID_PATTERN.search(resolved_url):
+            # Only cache links that actually resolved to a post
+            with self.short_links_lock:
+                self.short_links[url] = resolved_url
+                while len(self.short_links) > SHORT_LINK_CACHE_SIZE:
+                    self.short_links.popitem(last=False)
+        return resolved_url
+
+    def get_post_id(self, url: str) -> str:
+        """Return the canonical post ID of a Reddit URL, resolving share links first"""
+        match = POST_ID_PATTERN.search(self.resolve_url(url))
+        if not match:
+            raise ValueError("Invalid Reddit URL")
+        return match.group(1).lower()
+
+    def _get_authenticated(self, url: str, params: Dict = None) -> requests.Response:
+        """GET an OAuth endpoint with the cached token, refreshing it once if Reddit rejects it"""
+        response = None
+        for force_refresh in (False, True):
             auth_headers = {
-                'Authorization': f'Bearer {token}',
+                'Authorization': f'Bearer {self.get_reddit_access_token(force_refresh)}',
                 'User-Agent': self.auth_headers['User-Agent']
             }
-            
-            response = requests.get(auth_url, headers=auth_headers, timeout=10)
+            response = self._request('GET', url, headers=auth_headers, params=params)
+            # A revoked or expired token gets one refresh
+            if response.status_code != 401:
+                break
+        return response
+
+    def fetch_post_authenticated(self, url: str) -> Dict:
+        """Fetch post using Reddit API authentication"""
+        try:
+            if 'reddit.com' not in url:
+                raise ValueError("Invalid Reddit URL")
+            # The OAuth endpoint only needs the post ID, which also drops share query strings
+            auth_url = f"{REDDIT_API_URL}/comments/{self.get_post_id(url)}.json"
+            # Make authenticated request
+            response = self._get_authenticated(auth_url)
             print('Authenticated response received')
             
         except requests.RequestException as e:
@@ -71,7 +198,42 @@ class RedditClient:
             return response.json()
         else:
             print(f'Auth request failed with status: {response.status_code}')
-            raise Exception(f"Failed to fetch Reddit post with auth. Status code: {response.status_code}")
+            # Carries the response, so pipeline retries can tell a 429 or 5xx from a missing post
+            raise requests.HTTPError(f"Failed to fetch Reddit post with auth. Status code: {response.status_code}",
+                                     response=response)
+
+    def get_listing(self, subreddit: str, listing: str = "top", time_filter: str = "day", limit: int = 10) -> List[Dict]:
+        """
+        Fetch a subreddit listing in a single request and return its posts
+        with their URL, post ID, title and description
+        """
+        if not SUBREDDIT_PATTERN.match(subreddit):
+            raise ValueError("Invalid subreddit name")
+        if listing not in LISTINGS:
+            raise ValueError(f"Listing must be one of {', '.join(LISTINGS)}")
+        params = {'limit': max(1, min(limit, 100)), 'raw_json': 1}
+        if listing == "top":
+            if time_filter not in TIME_FILTERS:
+                raise ValueError(f"Time filter must be one of {', '.join(TIME_FILTERS)}")
+            params['t'] = time_filter
+
+        response = self._get_authenticated(f"{REDDIT_API_URL}/r/{subreddit}/{listing}.json", params)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch r/{subreddit} {listing} listing. Status code: {response.status_code}")
+
+        posts = []
+        for child in response.json()["data"]["children"]:
+            post = child.get("data", {})
+            # Pinned moderator posts are not content
+            if child.get("kind") != "t3" or post.get("stickied"):
+                continue
+            posts.append({
+                "post_id": post["id"].lower(),
+                "url": f"https://www.reddit.com{post['permalink']}",
+                "title": post.get("title", ""),
+                "description": post.get("selftext", ""),
+            })
+        return posts[:limit]
 
     def extract_post_data(self, data: Dict, top_n: int = 5) -> Dict:
         """
@@ -103,8 +265,8 @@ class RedditClient:
                 "description": description,
                 "top_comments": top_comments
             }
-        except Exception as e:
-            print(e)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ValueError(f"Unexpected Reddit post data: {e}") from e
 
     def get_post_and_comments(self, url: str, top_n: int = 5) -> Dict:
         """
@@ -115,4 +277,6 @@ class RedditClient:
             post_data = self.extract_post_data(data, top_n)
             return post_data
         except Exception as e:
-            print(f"Authenticated request failed: {e}")
\ No newline at end of file
+            # Re-raised so the pipeline retries transient failures and fails in the reddit stage
+            print(f"Authenticated request failed: {e}")
+            raise
\ No newline at end of file
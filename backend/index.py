@@ -1,9 +1,30 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import router
+from routers import router, metrics
+from utils.services import services, get_checkpoint_store
+from storage.checkpoints import collect_garbage_periodically
+from utils.job_executor import job_executor
 
-app = FastAPI(docs_url="/backend/py/docs", openapi_url="/backend/py/openapi.json")
+# Build the service clients in the background right after startup instead of on the first request
+SERVICES_WARMUP = os.getenv("SERVICES_WARMUP", "0") == "1"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Clients are created lazily on first use and shared app-wide through the registry
+    app.state.services = services
+    warmup = asyncio.create_task(asyncio.to_thread(services.warm_up)) if SERVICES_WARMUP else None
+    checkpoint_gc = asyncio.create_task(collect_garbage_periodically(get_checkpoint_store))
+    yield
+    checkpoint_gc.cancel()
+    if warmup:
+        await warmup
+    job_executor.shutdown()
+    services.close()
+
+app = FastAPI(docs_url="/backend/py/docs", openapi_url="/backend/py/openapi.json", lifespan=lifespan)
 frontend_host_url = os.getenv("FRONTEND_HOST_URL")
 
 # Add CORS middleware
@@ -19,4 +40,5 @@ app.add_middleware(
 )
 
 app.include_router(router.router, prefix="/backend/py/reddit")
+app.include_router(metrics.router, prefix="/backend/py")
 
@@ -0,0 +1,125 @@
+import os
+import sys
+import subprocess
+from array import array
+from typing import Tuple
+
+# Voiceover codec requested from TTS: "linear16" (WAV), "aac", "mp3" or "opus"
+TTS_AUDIO_CODEC = os.environ.get("TTS_AUDIO_CODEC", "aac")
+# Bit rate of compressed voiceovers, and of the AAC encode when the codec cannot be copied
+TTS_BIT_RATE = int(os.environ.get("TTS_BIT_RATE", 48000))
+# Sample rate voiceovers are decoded to for alignment, plenty for speech and silence detection
+DECODE_SAMPLE_RATE = 16000
+
+# How each codec is stored and whether it can be copied into the MP4 as is
+AUDIO_FORMATS = {
+    "linear16": {"extension": "wav", "mimetype": "audio/wav", "copy": False, "muxer": "wav", "encoder": "pcm_s16le"},
+    # Deepgram sends AAC as ADTS, MP4 needs the ADTS headers rewritten to an AudioSpecificConfig
+    "aac": {"extension": "aac", "mimetype": "audio/aac", "copy": True, "bitstream_filter": "aac_adtstoasc",
+            "muxer": "adts", "encoder": "aac"},
+    "mp3": {"extension": "mp3", "mimetype": "audio/mpeg", "copy": True, "muxer": "mp3", "encoder": "libmp3lame"},
+    # Ogg Opus, carried in MP4 as an Opus track
+    "opus": {"extension": "ogg", "mimetype": "audio/ogg", "copy": True, "muxer": "ogg", "encoder": "libopus"},
+}
+# Target length of a reel's voiceover
+REEL_MIN_SECONDS = float(os.environ.get("REEL_MIN_SECONDS", 15))
+REEL_MAX_SECONDS = float(os.environ.get("REEL_MAX_SECONDS", 20))
+# atempo range that still sounds natural for speech
+MIN_TEMPO = 0.9
+MAX_TEMPO = float(os.environ.get("MAX_TEMPO", 1.15))
+# Speaking rate of the TTS voice, used to estimate a script's duration before TTS
+SPEECH_WORDS_PER_SECOND = float(os.environ.get("SPEECH_WORDS_PER_SECOND", 2.6))
+
+def detect_audio_codec(audio_bytes: bytes) -> str:
+    """
+    Return the codec of voiceover bytes from their header, so cached audio from
+    before a TTS_AUDIO_CODEC change is still handled correctly
+    """
+    if audio_bytes[:4] == b"RIFF":
+        return "linear16"
+    if audio_bytes[:4] == b"OggS":
+        return "opus"
+    if audio_bytes[:3] == b"ID3":
+        return "mp3"
+    if len(audio_bytes) >= 2 and audio_bytes[0] == 0xFF and audio_bytes[1] & 0xF0 == 0xF0:
+        # ADTS has layer bits 00, MPEG audio layer III has 01
+        return "aac" if audio_bytes[1] & 0x06 == 0 else "mp3"
+    if len(audio_bytes) >= 2 and audio_bytes[0] == 0xFF and audio_bytes[1] & 0xE0 == 0xE0:
+        return "mp3"  # MPEG-2.5 frame sync
+    raise ValueError("Unknown voiceover format")
+
+def get_audio_format(audio_bytes: bytes) -> dict:
+    return AUDIO_FORMATS[detect_audio_codec(audio_bytes)]
+
+def audio_output_args(audio_bytes: bytes) -> list:
+    """
+    ffmpeg output arguments for the voiceover track: copied when the codec fits MP4, AAC otherwise
+    """
+    audio_format = get_audio_format(audio_bytes)
+    if not audio_format["copy"]:
+        return ['-c:a', 'aac', '-b:a', '128k']
+    args = ['-c:a', 'copy']
+    if audio_format.get("bitstream_filter"):
+        args += ['-bsf:a', audio_format["bitstream_filter"]]
+    return args
+
+def decode_audio_pcm(audio_bytes: bytes, sample_rate: int = DECODE_SAMPLE_RATE) -> Tuple[array, int]:
+    """
+    Decode compressed voiceover bytes to mono 16-bit samples with ffmpeg, for the steps that need PCM
+    """
+    result = subprocess.run(
+        ['ffmpeg', '-v', 'error', '-i', 'pipe:0', '-f', 's16le', '-ac', '1', '-ar', str(sample_rate), 'pipe:1'],
+        input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    if result.returncode != 0:
+        raise ValueError(f"Error decoding voiceover: {result.stderr.decode(errors='replace').strip()}")
+    data = result.stdout[:len(result.stdout) - len(result.stdout) % 2]
+    samples = array("h")
+    samples.frombytes(data)
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples, sample_rate
+
+def estimate_speech_seconds(script: str) -> float:
+    """Estimate how long the TTS voice takes to read a script"""
+    return len(script.split()) / SPEECH_WORDS_PER_SECOND
+
+def is_script_length_ok(script: str) -> bool:
+    """Whether a script's estimated reading time can be fitted to the target with atempo"""
+    seconds = estimate_speech_seconds(script)
+    return REEL_MIN_SECONDS * MIN_TEMPO <= seconds <= REEL_MAX_SECONDS * MAX_TEMPO
+
+def target_word_count() -> int:
+    return int(REEL_MAX_SECONDS * SPEECH_WORDS_PER_SECOND)
+
+def time_stretch(audio_bytes: bytes, tempo: float) -> bytes:
+    """
+    Speed a voiceover up (tempo > 1) or slow it down with ffmpeg's atempo, keeping its codec and pitch
+    """
+    audio_format = get_audio_format(audio_bytes)
+    cmd = ['ffmpeg', '-v', 'error', '-i', 'pipe:0', '-filter:a', f"atempo={tempo:.4f}", '-c:a', audio_format["encoder"]]
+    if audio_format["encoder"] != "pcm_s16le":
+        cmd += ['-b:a', str(TTS_BIT_RATE)]
+    result = subprocess.run(cmd + ['-f', audio_format["muxer"], 'pipe:1'],
+                            input=audio_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise ValueError(f"Error time-stretching voiceover: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout
+
+def fit_voiceover(audio_bytes: bytes) -> tuple:
+    """
+    Time-stretch a voiceover into REEL_MIN_SECONDS..REEL_MAX_SECONDS when atempo can get it there
+    without sounding unnatural, before any CPU is spent on the render.
+    Returns the audio, its duration and the tempo applied (1.0 when untouched).
+    """
+    from media.probe import get_voiceover_duration
+
+    duration = get_voiceover_duration(audio_bytes)
+    if duration > REEL_MAX_SECONDS:
+        tempo = min(duration / REEL_MAX_SECONDS, MAX_TEMPO)
+    elif duration < REEL_MIN_SECONDS:
+        tempo = max(duration / REEL_MIN_SECONDS, MIN_TEMPO)
+    else:
+        return audio_bytes, duration, 1.0
+    print(f"Voiceover is {duration:.1f}s, time-stretching by {tempo:.3f}")
+    return time_stretch(audio_bytes, tempo), duration / tempo, tempo
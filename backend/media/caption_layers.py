@@ -0,0 +1,219 @@
+import os
+import re
+import json
+import hashlib
+import tempfile
+import subprocess
+from functools import lru_cache
+from typing import List, Optional, Tuple
+from media.captions import cues_to_srt
+from media.templates import TEMPLATE_WIDTH
+
+# "overlay" burns pre-rendered caption images in with a timed overlay, "libass" uses the subtitles filter
+CAPTION_RENDERER = os.environ.get("CAPTION_RENDERER", "overlay")
+# "plain" shows each cue as is, "highlight" colours the word being spoken
+CAPTION_STYLE = os.environ.get("CAPTION_STYLE", "plain")
+CAPTION_FONT_PATH = os.environ.get("CAPTION_FONT_PATH", "")
+CAPTION_FONT_SIZE = int(os.environ.get("CAPTION_FONT_SIZE", 72))
+CAPTION_STROKE_WIDTH = int(os.environ.get("CAPTION_STROKE_WIDTH", 5))
+CAPTION_TEXT_COLOR = os.environ.get("CAPTION_TEXT_COLOR", "#FFFFFF")
+CAPTION_HIGHLIGHT_COLOR = os.environ.get("CAPTION_HIGHLIGHT_COLOR", "#FFD400")
+# Height of the caption band and its distance from the bottom of the frame
+CAPTION_BAND_HEIGHT = int(os.environ.get("CAPTION_BAND_HEIGHT", 360))
+CAPTION_MARGIN_BOTTOM = int(os.environ.get("CAPTION_MARGIN_BOTTOM", 320))
+# Rendered caption images, shared by every job on this host
+CAPTION_CACHE_DIR = os.environ.get("CAPTION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "reels-caption-layers"))
+# Bump when rendering changes so cached images are not reused
+CAPTION_LAYER_VERSION = 1
+
+FONT_CANDIDATES = (
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf",
+    "/Library/Fonts/Arial Bold.ttf",
+    "/System/Library/Fonts/Supplemental/Arial Bold.ttf",
+)
+SRT_TIME = re.compile(r"(\d+):(\d+):(\d+)[,.](\d+)")
+
+@lru_cache(maxsize=1)
+def find_font_path() -> Optional[str]:
+    """Font file for captions: CAPTION_FONT_PATH, fontconfig's bold sans, then well-known paths"""
+    if CAPTION_FONT_PATH:
+        return CAPTION_FONT_PATH
+    try:
+        result = subprocess.run(['fc-match', '-f', '%{file}', 'DejaVu Sans:bold'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=5)
+        path = result.stdout.decode().strip()
+        if path and os.path.exists(path):
+            return path
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return next((path for path in FONT_CANDIDATES if os.path.exists(path)), None)
+
+# Pillow is only needed by the overlay renderer, so it is imported when a font is first loaded
+@lru_cache(maxsize=8)
+def get_font(path: Optional[str], size: int):
+    """Loaded fonts are kept for the life of the process, glyphs are rasterized once per font"""
+    from PIL import ImageFont
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+@lru_cache(maxsize=4096)
+def measure_word(word: str, font_path: Optional[str], size: int) -> float:
+    return get_font(font_path, size).getlength(word)
+
+def wrap_words(words: List[str], font_path: Optional[str], size: int, max_width: float) -> List[List[int]]:
+    """Split a cue's words into lines that fit max_width, as lists of word indices"""
+    space = measure_word(" ", font_path, size)
+    lines, current, width = [], [], 0.0
+    for index, word in enumerate(words):
+        word_width = measure_word(word, font_path, size)
+        if current and width + space + word_width > max_width:
+            lines.append(current)
+            current, width = [], 0.0
+        width += (space if current else 0) + word_width
+        current.append(index)
+    if current:
+        lines.append(current)
+    return lines
+
+def layer_key(words: List[str], highlight: Optional[int]) -> str:
+    """Cache key of one caption image: its text, highlighted word and everything that styles it"""
+    style = [CAPTION_LAYER_VERSION, find_font_path(), CAPTION_FONT_SIZE, CAPTION_STROKE_WIDTH, CAPTION_TEXT_COLOR,
+             CAPTION_HIGHLIGHT_COLOR, TEMPLATE_WIDTH, CAPTION_BAND_HEIGHT, words, highlight]
+    return hashlib.sha1(json.dumps(style).encode()).hexdigest()
+
+def render_layer(words: List[str], highlight: Optional[int] = None):
+    """Draw a cue centred on a transparent band, with the highlighted word (an index) in the highlight colour"""
+    from PIL import Image, ImageDraw
+
+    font_path = find_font_path()
+    font = get_font(font_path, CAPTION_FONT_SIZE)
+    image = Image.new("RGBA", (TEMPLATE_WIDTH, CAPTION_BAND_HEIGHT), (0, 0, 0, 0))
+    if not words:
+        return image
+    draw = ImageDraw.Draw(image)
+    space = measure_word(" ", font_path, CAPTION_FONT_SIZE)
+    line_height = CAPTION_FONT_SIZE + 2 * CAPTION_STROKE_WIDTH
+    lines = wrap_words(words, font_path, CAPTION_FONT_SIZE, TEMPLATE_WIDTH * 0.9)
+    y = (CAPTION_BAND_HEIGHT - line_height * len(lines)) / 2
+    for line in lines:
+        line_width = sum(measure_word(words[index], font_path, CAPTION_FONT_SIZE) for index in line) + space * (len(line) - 1)
+        x = (TEMPLATE_WIDTH - line_width) / 2
+        for index in line:
+            color = CAPTION_HIGHLIGHT_COLOR if index == highlight else CAPTION_TEXT_COLOR
+            draw.text((x, y), words[index], font=font, fill=color,
+                      stroke_width=CAPTION_STROKE_WIDTH, stroke_fill="#000000")
+            x += measure_word(words[index], font_path, CAPTION_FONT_SIZE) + space
+        y += line_height
+    return image
+
+def get_layer_path(words: List[str], highlight: Optional[int] = None, stats: dict = None) -> str:
+    """Path of a caption image in CAPTION_CACHE_DIR, rendered only if no job rendered it before"""
+    key = layer_key(words, highlight)
+    path = os.path.join(CAPTION_CACHE_DIR, key[:2], f"{key}.png")
+    if os.path.exists(path):
+        if stats is not None:
+            stats["cached"] = stats.get("cached", 0) + 1
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under a temporary name, concurrent jobs never read a partial image
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".png", delete=False) as f:
+        render_layer(words, highlight).save(f, format="PNG", optimize=False)
+        tmp_path = f.name
+    os.replace(tmp_path, path)
+    if stats is not None:
+        stats["rendered"] = stats.get("rendered", 0) + 1
+    return path
+
+def parse_srt(content: str) -> List[dict]:
+    """Cues of an SRT file, without word timings"""
+    def seconds(match) -> float:
+        hours, minutes, secs, millis = (int(value) for value in match.groups())
+        return hours * 3600 + minutes * 60 + secs + millis / 1000
+
+    cues = []
+    for block in re.split(r"\n\s*\n", content.strip()):
+        lines = block.strip().splitlines()
+        timing = next((index for index, line in enumerate(lines) if "-->" in line), None)
+        if timing is None:
+            continue
+        start, end = (SRT_TIME.search(part) for part in lines[timing].split("-->"))
+        if start and end:
+            cues.append({"text": " ".join(lines[timing + 1:]).strip(), "start": seconds(start), "end": seconds(end)})
+    return cues
+
+def load_cues(caption_path: str) -> List[dict]:
+    """Cues from a captions.json written by the captions stage, or from an SRT file"""
+    with open(caption_path, encoding="utf-8") as f:
+        content = f.read()
+    if caption_path.endswith(".json"):
+        return json.loads(content)
+    if caption_path.endswith(".srt"):
+        return parse_srt(content)
+    raise ValueError(f"Caption overlay needs JSON or SRT captions: {caption_path}")
+
+def caption_frames(cues: List[dict], style: str = CAPTION_STYLE) -> List[Tuple[float, float, List[str], Optional[int]]]:
+    """(start, end, words, highlighted word) of every caption image shown, in time order"""
+    frames = []
+    for cue in cues:
+        words = cue["text"].split()
+        timed_words = cue.get("words") or []
+        if style == "highlight" and len(timed_words) == len(words) and len(words) > 1:
+            # Each word stays highlighted until the next one starts, so the cue never flickers
+            for index, word in enumerate(timed_words):
+                end = timed_words[index + 1]["start"] if index + 1 < len(timed_words) else cue["end"]
+                frames.append((word["start"], end, words, index))
+        else:
+            frames.append((cue["start"], cue["end"], words, None))
+    return frames
+
+def prerender_layers(cues: List[dict], style: str = CAPTION_STYLE) -> dict:
+    """Render every caption image of a job ahead of the encode, returns rendered/cached counts"""
+    stats = {}
+    for _, _, words, highlight in caption_frames(cues, style):
+        get_layer_path(words, highlight, stats)
+    return stats
+
+def write_caption_overlay(caption_path: str, workdir: str, style: str = CAPTION_STYLE, stats: dict = None) -> str:
+    """
+    Write an ffconcat playlist of caption images with their durations, a blank image in the gaps,
+    and return its path. Decoded as a video input it holds one frame per caption change, so
+    the encode only composites it with overlay instead of laying out and rasterizing text.
+    """
+    blank = get_layer_path([], None, stats)
+    entries = []
+    cursor = 0.0
+    for start, end, words, highlight in caption_frames(load_cues(caption_path), style):
+        start = max(start, cursor)
+        if end - start < 0.001:
+            continue
+        if start - cursor >= 0.001:
+            entries.append((blank, start - cursor))
+        entries.append((get_layer_path(words, highlight, stats), end - start))
+        cursor = end
+    entries.append((blank, 1.0))
+    lines = ["ffconcat version 1.0"]
+    for path, duration in entries:
+        lines += [f"file '{path}'", f"duration {duration:.3f}"]
+    # The concat demuxer ignores the last duration unless the file is listed again
+    lines.append(f"file '{blank}'")
+    # Named after the captions, so per-sentence captions of a streamed render get their own playlist
+    playlist_path = os.path.join(workdir, os.path.splitext(os.path.basename(caption_path))[0] + ".ffconcat")
+    with open(playlist_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return playlist_path
+
+def overlay_filter(caption_input: int, background: str = "[0:v]") -> str:
+    """Overlay the caption band from input caption_input on the background, centred above the bottom margin"""
+    return (f"{background}[{caption_input}:v]overlay=x=(main_w-overlay_w)/2:"
+            f"y=main_h-overlay_h-{CAPTION_MARGIN_BOTTOM}:eof_action=repeat")
+
+def write_subtitle_file(caption_path: str, workdir: str) -> str:
+    """Captions the subtitles filter can read, for the libass fallback"""
+    if not caption_path.endswith(".json"):
+        return caption_path
+    srt_path = os.path.join(workdir, os.path.splitext(os.path.basename(caption_path))[0] + ".srt")
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write(cues_to_srt(load_cues(caption_path)))
+    return srt_path
@@ -0,0 +1,252 @@
+import os
+import re
+import sys
+import math
+import struct
+from array import array
+from typing import List, Tuple
+
+CAPTION_MODE = os.environ.get("CAPTION_MODE", "local")  # "local" or "deepgram"
+CAPTION_FORMAT = os.environ.get("CAPTION_FORMAT", "srt")  # "srt" or "ass"
+CAPTION_CHUNKING = os.environ.get("CAPTION_CHUNKING", "phrase")  # "phrase" or "word"
+PHRASE_MAX_WORDS = int(os.environ.get("CAPTION_PHRASE_MAX_WORDS", 4))
+PHRASE_MAX_CHARS = int(os.environ.get("CAPTION_PHRASE_MAX_CHARS", 24))
+
+WINDOW_MS = 20
+MIN_SILENCE_MS = 120
+MIN_SPEECH_MS = 80
+
+SENTENCE_END = re.compile(r"[.!?]['\")\]]*$")
+CLAUSE_END = re.compile(r"[,;:–—-]['\")\]]*$")
+
+def read_wav_pcm(audio_bytes: bytes) -> Tuple[array, int]:
+    """
+    Return the 16-bit samples of the first channel and the sample rate of WAV bytes
+    """
+    offset = 12  # Skip the RIFF header
+    channels = sample_rate = bits = None
+    while offset + 8 <= len(audio_bytes):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", audio_bytes, offset)
+        if chunk_id == b"fmt ":
+            _, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", audio_bytes, offset + 8)
+        elif chunk_id == b"data":
+            if bits != 16:
+                raise ValueError("Only 16-bit PCM WAV is supported")
+            # Streamed WAVs can carry a placeholder size, so read to the end of the buffer
+            data = audio_bytes[offset + 8:]
+            data = data[:len(data) - len(data) % 2]
+            samples = array("h")
+            samples.frombytes(data)
+            if sys.byteorder == "big":
+                samples.byteswap()
+            return samples[::channels], sample_rate
+        offset += 8 + chunk_size + (chunk_size % 2)
+    raise ValueError("Invalid WAV data")
+
+def detect_speech_regions(samples: array, sample_rate: int) -> List[Tuple[float, float]]:
+    """
+    Split audio into speech regions separated by silences, using windowed RMS energy
+    """
+    window = max(1, sample_rate * WINDOW_MS // 1000)
+    energies = []
+    for start in range(0, len(samples), window):
+        frame = samples[start:start + window]
+        energies.append(math.sqrt(sum(s * s for s in frame) / len(frame)))
+    if not energies:
+        return []
+
+    ranked = sorted(energies)
+    floor = ranked[len(ranked) // 10]
+    peak = ranked[len(ranked) * 95 // 100]
+    if peak <= floor:
+        return []
+    threshold = floor + 0.08 * (peak - floor)
+
+    min_silence_windows = MIN_SILENCE_MS // WINDOW_MS
+    regions = []
+    region_start = None
+    silent_run = 0
+    for index, energy in enumerate(energies):
+        if energy >= threshold:
+            if region_start is None:
+                region_start = index
+            silent_run = 0
+        elif region_start is not None:
+            silent_run += 1
+            # Only a long enough pause ends a region, short dips are part of words
+            if silent_run >= min_silence_windows:
+                regions.append((region_start, index - silent_run + 1))
+                region_start = None
+                silent_run = 0
+    if region_start is not None:
+        regions.append((region_start, len(energies) - silent_run))
+
+    seconds_per_window = window / sample_rate
+    return [
+        (start * seconds_per_window, end * seconds_per_window)
+        for start, end in regions
+        if (end - start) * WINDOW_MS >= MIN_SPEECH_MS
+    ]
+
+def estimate_word_weight(word: str) -> float:
+    """Approximate spoken length of a word from its syllable count"""
+    letters = re.sub(r"[^a-z0-9]", "", word.lower())
+    if letters.isdigit():
+        return 1.0 + len(letters)  # Numbers are read digit group by digit group
+    syllables = len(re.findall(r"[aeiouy]+", letters))
+    if letters.endswith("e") and syllables > 1:
+        syllables -= 1
+    return max(1, syllables) + 0.1 * len(letters)
+
+def split_words_into_regions(words: List[str], weights: List[float], regions: List[Tuple[float, float]]) -> List[int]:
+    """
+    Choose where the word list breaks between speech regions, preferring punctuation.
+    Returns the index of the first word of every region after the first.
+    """
+    total_weight = sum(weights)
+    total_speech = sum(end - start for start, end in regions)
+    average_weight = total_weight / len(weights)
+    cumulative = [0.0]
+    for weight in weights:
+        cumulative.append(cumulative[-1] + weight)
+
+    splits = []
+    previous = 0
+    speech_so_far = 0.0
+    for region_index, (start, end) in enumerate(regions[:-1]):
+        speech_so_far += end - start
+        target = total_weight * speech_so_far / total_speech
+        remaining_regions = len(regions) - region_index - 1
+        best_index, best_score = None, None
+        # Leave at least one word for every remaining region
+        for index in range(previous + 1, len(words) - remaining_regions + 1):
+            score = abs(cumulative[index] - target)
+            if SENTENCE_END.search(words[index - 1]):
+                score -= 1.5 * average_weight
+            elif CLAUSE_END.search(words[index - 1]):
+                score -= 0.5 * average_weight
+            if best_score is None or score < best_score:
+                best_index, best_score = index, score
+        splits.append(best_index)
+        previous = best_index
+    return splits
+
+def read_audio_pcm(audio_bytes: bytes) -> Tuple[array, int]:
+    """
+    Return samples and sample rate of a voiceover, decoding compressed audio only when it is not WAV
+    """
+    if audio_bytes[:4] == b"RIFF":
+        return read_wav_pcm(audio_bytes)
+    from media.audio import decode_audio_pcm
+    return decode_audio_pcm(audio_bytes)
+
+def align_script_to_audio(script: str, audio_bytes: bytes) -> List[dict]:
+    """
+    Estimate word timings of a known script from the TTS audio (WAV or compressed bytes) it was spoken from
+    """
+    samples, sample_rate = read_audio_pcm(audio_bytes)
+    return align_script_to_samples(script, samples, sample_rate)
+
+def align_script_to_samples(script: str, samples: array, sample_rate: int) -> List[dict]:
+    """
+    Estimate word timings of a known script from mono 16-bit PCM samples
+    """
+    words = script.split()
+    if not words:
+        return []
+    regions = detect_speech_regions(samples, sample_rate)
+    if not regions:
+        raise ValueError("No speech detected in audio")
+
+    # More pauses than words means noise split a word, merge the shortest gaps away
+    while len(regions) > len(words):
+        gaps = [regions[i + 1][0] - regions[i][1] for i in range(len(regions) - 1)]
+        shortest = gaps.index(min(gaps))
+        regions[shortest:shortest + 2] = [(regions[shortest][0], regions[shortest + 1][1])]
+
+    weights = [estimate_word_weight(word) for word in words]
+    bounds = [0] + split_words_into_regions(words, weights, regions) + [len(words)]
+
+    timed_words = []
+    for (start, end), first, last in zip(regions, bounds, bounds[1:]):
+        region_weight = sum(weights[first:last])
+        cursor = start
+        for index in range(first, last):
+            duration = (end - start) * weights[index] / region_weight
+            timed_words.append({"word": words[index], "start": cursor, "end": cursor + duration})
+            cursor += duration
+    return timed_words
+
+def build_cues(timed_words: List[dict], chunking: str = CAPTION_CHUNKING) -> List[dict]:
+    """
+    Group timed words into caption cues, one word per cue or short phrases split at punctuation
+    """
+    if chunking == "word":
+        return [{"text": w["word"], "start": w["start"], "end": w["end"], "words": [w]} for w in timed_words]
+
+    cues = []
+    current = []
+    for word in timed_words:
+        text_length = len(" ".join(w["word"] for w in current + [word]))
+        if current and (len(current) >= PHRASE_MAX_WORDS or text_length > PHRASE_MAX_CHARS):
+            cues.append(current)
+            current = []
+        current.append(word)
+        if SENTENCE_END.search(word["word"]) or CLAUSE_END.search(word["word"]):
+            cues.append(current)
+            current = []
+    if current:
+        cues.append(current)
+    return [
+        {"text": " ".join(w["word"] for w in cue), "start": cue[0]["start"], "end": cue[-1]["end"], "words": cue}
+        for cue in cues
+    ]
+
+def format_timestamp(seconds: float, separator: str = ",") -> str:
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    secs, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{milliseconds:03d}"
+
+def cues_to_srt(cues: List[dict]) -> str:
+    blocks = []
+    for index, cue in enumerate(cues, start=1):
+        blocks.append(f"{index}\n{format_timestamp(cue['start'])} --> {format_timestamp(cue['end'])}\n{cue['text']}\n")
+    return "\n".join(blocks)
+
+def cues_to_ass(cues: List[dict], font_size: int = 18) -> str:
+    def ass_time(seconds: float) -> str:
+        centiseconds = int(round(seconds * 100))
+        hours, centiseconds = divmod(centiseconds, 360000)
+        minutes, centiseconds = divmod(centiseconds, 6000)
+        secs, centiseconds = divmod(centiseconds, 100)
+        return f"{hours:d}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+    lines = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, OutlineColour, BorderStyle, Outline, Shadow, Alignment, MarginV",
+        f"Style: Default,Arial,{font_size},&H00FFFFFF,&H00000000,1,1,0,2,20",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Text",
+    ]
+    for cue in cues:
+        lines.append(f"Dialogue: 0,{ass_time(cue['start'])},{ass_time(cue['end'])},Default,{cue['text']}")
+    return "\n".join(lines) + "\n"
+
+def generate_caption_cues(script: str, audio_bytes: bytes, chunking: str = CAPTION_CHUNKING) -> List[dict]:
+    """Timed caption cues, with their word timings, for a script from its TTS audio"""
+    return build_cues(align_script_to_audio(script, audio_bytes), chunking)
+
+def generate_captions(script: str, audio_bytes: bytes, caption_format: str = CAPTION_FORMAT, chunking: str = CAPTION_CHUNKING) -> str:
+    """
+    Generate SRT or ASS captions for a script from its TTS audio without a speech-to-text round trip
+    """
+    cues = generate_caption_cues(script, audio_bytes, chunking)
+    if caption_format == "ass":
+        return cues_to_ass(cues)
+    return cues_to_srt(cues)
@@ -0,0 +1,236 @@
+import os
+import json
+import struct
+import threading
+import subprocess
+from collections import OrderedDict
+from typing import Optional
+
+# Probed files remembered per path and ETag (or mtime and size)
+PROBE_CACHE_MAX_ENTRIES = int(os.environ.get("PROBE_CACHE_MAX_ENTRIES", 256))
+# moov boxes beyond this size are left to ffprobe
+MOOV_MAX_BYTES = 32 * 1024 ** 2
+
+ADTS_SAMPLE_RATES = (96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350)
+OPUS_SAMPLE_RATE = 48000  # Ogg Opus granule positions always count 48 kHz samples
+
+_probe_cache = OrderedDict()
+_probe_lock = threading.Lock()
+
+def get_wav_duration(audio_bytes: bytes) -> float:
+    """Return the duration of WAV bytes, tolerating streamed headers with placeholder sizes"""
+    offset = 12  # Skip the RIFF header
+    byte_rate = None
+    while offset + 8 <= len(audio_bytes):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", audio_bytes, offset)
+        if chunk_id == b"fmt ":
+            byte_rate = struct.unpack_from("<I", audio_bytes, offset + 16)[0]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                break
+            return (len(audio_bytes) - offset - 8) / byte_rate
+        offset += 8 + chunk_size + (chunk_size % 2)
+    raise ValueError("Invalid WAV data")
+
+def get_wav_byte_rate(audio_bytes: bytes) -> int:
+    offset = 12
+    while offset + 8 <= len(audio_bytes):
+        chunk_id, chunk_size = struct.unpack_from("<4sI", audio_bytes, offset)
+        if chunk_id == b"fmt ":
+            return struct.unpack_from("<I", audio_bytes, offset + 16)[0]
+        offset += 8 + chunk_size + (chunk_size % 2)
+    raise ValueError("Invalid WAV data")
+
+def get_adts_duration(audio_bytes: bytes) -> float:
+    """Return the duration of ADTS AAC bytes by walking the frame headers, 1024 samples per raw block"""
+    offset = samples = 0
+    sample_rate = None
+    while offset + 7 <= len(audio_bytes):
+        header = audio_bytes[offset:offset + 7]
+        if header[0] != 0xFF or header[1] & 0xF6 != 0xF0:
+            break
+        sample_rate = ADTS_SAMPLE_RATES[(header[2] & 0x3C) >> 2]
+        frame_length = ((header[3] & 0x03) << 11) | (header[4] << 3) | (header[5] >> 5)
+        if frame_length < 7:
+            break
+        samples += 1024 * ((header[6] & 0x03) + 1)
+        offset += frame_length
+    if not sample_rate:
+        raise ValueError("Invalid ADTS data")
+    return samples / sample_rate
+
+def get_ogg_opus_duration(audio_bytes: bytes) -> float:
+    """Return the duration of Ogg Opus bytes from the last page's granule position minus the pre-skip"""
+    head = audio_bytes.find(b"OpusHead")
+    last_page = audio_bytes.rfind(b"OggS")
+    if head < 0 or last_page < 0 or last_page + 14 > len(audio_bytes):
+        raise ValueError("Invalid Ogg Opus data")
+    pre_skip = struct.unpack_from("<H", audio_bytes, head + 10)[0]
+    granule = struct.unpack_from("<q", audio_bytes, last_page + 6)[0]
+    return max(0, granule - pre_skip) / OPUS_SAMPLE_RATE
+
+def get_audio_bytes_duration(audio_bytes: bytes) -> Optional[float]:
+    """
+    Return the duration of voiceover bytes from their headers, or None when the format
+    has no cheap way to tell (e.g. MP3 without a Xing header)
+    """
+    try:
+        if audio_bytes[:4] == b"RIFF":
+            return get_wav_duration(audio_bytes)
+        if audio_bytes[:4] == b"OggS":
+            return get_ogg_opus_duration(audio_bytes)
+        if len(audio_bytes) >= 2 and audio_bytes[0] == 0xFF and audio_bytes[1] & 0xF6 == 0xF0:
+            return get_adts_duration(audio_bytes)
+    except (ValueError, struct.error, IndexError) as e:
+        print(f"Could not read voiceover duration from its headers: {e}")
+    return None
+
+def get_voiceover_duration(audio_bytes: bytes, audio_path: str = None) -> float:
+    """Return the voiceover duration from its headers, with one ffprobe call as the fallback"""
+    duration = get_audio_bytes_duration(audio_bytes)
+    if duration is not None:
+        return duration
+    if audio_path:
+        return get_duration(audio_path)
+    return probe_with_ffprobe("pipe:0", input_bytes=audio_bytes)["duration"]
+
+def iter_boxes(data: bytes, offset: int = 0, end: int = None):
+    """Yield (type, payload start, payload end) of the ISO BMFF boxes in data[offset:end]"""
+    end = len(data) if end is None else end
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            break
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+def read_timescale_duration(data: bytes, start: int) -> tuple:
+    """Timescale and duration of an mvhd or mdhd payload"""
+    if data[start] == 1:
+        return struct.unpack_from(">IQ", data, start + 20)
+    return struct.unpack_from(">II", data, start + 12)
+
+def parse_moov(moov: bytes) -> dict:
+    """Duration and tracks from a moov box's mvhd, tkhd, mdhd and hdlr boxes"""
+    info = {"duration": None, "width": None, "height": None, "has_video": False, "has_audio": False}
+    for box_type, start, end in iter_boxes(moov):
+        if box_type == b"mvhd":
+            timescale, duration = read_timescale_duration(moov, start)
+            if timescale and duration:
+                info["duration"] = duration / timescale
+        elif box_type == b"trak":
+            track = {}
+            for child_type, child_start, child_end in iter_boxes(moov, start, end):
+                if child_type == b"tkhd":
+                    # width and height are 16.16 fixed point at the end of tkhd
+                    width, height = struct.unpack_from(">II", moov, child_end - 8)
+                    track["width"], track["height"] = width >> 16, height >> 16
+                elif child_type == b"mdia":
+                    for media_type, media_start, _ in iter_boxes(moov, child_start, child_end):
+                        if media_type == b"mdhd":
+                            timescale, duration = read_timescale_duration(moov, media_start)
+                            track["duration"] = duration / timescale if timescale else None
+                        elif media_type == b"hdlr":
+                            track["handler"] = moov[media_start + 8:media_start + 12]
+            if track.get("handler") == b"vide":
+                info["has_video"] = True
+                info["width"], info["height"] = track.get("width"), track.get("height")
+            elif track.get("handler") == b"soun":
+                info["has_audio"] = True
+            if not info["duration"] and track.get("duration"):
+                info["duration"] = track["duration"]
+    return info
+
+def probe_mp4(path: str) -> Optional[dict]:
+    """
+    Read duration and video size from an MP4's moov box without decoding anything.
+    Returns None when there is no usable moov, e.g. fragmented MP4 with a zero duration.
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        offset = 0
+        while offset + 8 <= file_size:
+            f.seek(offset)
+            header = f.read(16)
+            size, box_type = struct.unpack_from(">I4s", header)
+            header_size = 8
+            if size == 1:
+                size = struct.unpack_from(">Q", header, 8)[0]
+                header_size = 16
+            elif size == 0:
+                size = file_size - offset
+            if size < header_size:
+                return None
+            if box_type == b"moov":
+                if size > MOOV_MAX_BYTES:
+                    return None
+                f.seek(offset + header_size)
+                info = parse_moov(f.read(size - header_size))
+                return info if info["duration"] else None
+            offset += size
+    return None
+
+def probe_with_ffprobe(path: str, input_bytes: bytes = None) -> dict:
+    """Duration and video size from a single ffprobe call"""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration:stream=codec_type,width,height',
+         '-of', 'json', path],
+        input=input_bytes, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=30
+    )
+    output = json.loads(result.stdout)
+    streams = output.get("streams", [])
+    video = next((stream for stream in streams if stream.get("codec_type") == "video"), {})
+    return {
+        "duration": float(output["format"]["duration"]),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "has_video": bool(video),
+        "has_audio": any(stream.get("codec_type") == "audio" for stream in streams),
+    }
+
+def probe_file(path: str) -> dict:
+    with open(path, "rb") as f:
+        head = f.read(12)
+    if head[:4] == b"RIFF":
+        with open(path, "rb") as f:
+            # The data chunk length is all that is needed, so only the header is parsed
+            header = f.read(4096)
+        duration = get_wav_duration(header) + (os.path.getsize(path) - len(header)) / get_wav_byte_rate(header)
+        return {"duration": duration, "width": None, "height": None, "has_video": False, "has_audio": True}
+    if head[4:8] == b"ftyp":
+        info = probe_mp4(path)
+        if info:
+            return info
+    return probe_with_ffprobe(path)
+
+def probe(path: str, etag: str = None) -> dict:
+    """
+    Return duration, video size and track kinds of a media file, memoized per path and
+    ETag (or modification time and size when no ETag is known)
+    """
+    if etag:
+        key = (path, etag)
+    else:
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+    with _probe_lock:
+        info = _probe_cache.get(key)
+        if info is not None:
+            _probe_cache.move_to_end(key)
+            return info
+    info = probe_file(path)
+    with _probe_lock:
+        _probe_cache[key] = info
+        while len(_probe_cache) > PROBE_CACHE_MAX_ENTRIES:
+            _probe_cache.popitem(last=False)
+    return info
+
+def get_duration(path: str, etag: str = None) -> float:
+    """Return the duration of a media file in seconds"""
+    return probe(path, etag)["duration"]
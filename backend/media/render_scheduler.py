@@ -0,0 +1,79 @@
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import replace
+from typing import Callable, List
+from media.templates import EncodeProfile
+from utils.metrics import render_presets
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Pick the x264 preset and thread count per render from the current load, off uses RENDER_PRESET/RENDER_THREADS as is
+RENDER_ADAPTIVE = os.environ.get("RENDER_ADAPTIVE", "true").lower() == "true"
+# Presets from best quality to fastest, a busier queue moves renders down the ladder. It starts at the
+# EncodeProfile default so an idle server renders as fast as with fixed settings, load only makes it faster
+RENDER_PRESET_LADDER = os.environ.get("RENDER_PRESET_LADDER", f"{EncodeProfile.preset},superfast,ultrafast")
+# Jobs waiting behind a render that move it one step down the ladder
+RENDER_JOBS_PER_STEP = int(os.environ.get("RENDER_JOBS_PER_STEP", max(1, CPU_COUNT // 2)))
+
+def parse_preset_ladder(spec: str = RENDER_PRESET_LADDER) -> List[str]:
+    ladder = [preset.strip() for preset in spec.split(",") if preset.strip()]
+    if not ladder:
+        raise ValueError("RENDER_PRESET_LADDER is empty")
+    return ladder
+
+class RenderScheduler:
+    """
+    This class is used to choose the encode profile of every ffmpeg render from the current load.
+
+    Each render gets a share of the cores (cores / renders running) as its thread budget, so
+    concurrent renders don't oversubscribe the CPU, and a preset from the ladder by queue depth:
+    the first one when idle, faster ones as jobs wait. RENDER_PRESET and RENDER_THREADS,
+    when set, pin the preset and thread count.
+    """
+    def __init__(self, cpu_count: int = CPU_COUNT, ladder: List[str] = None,
+                 jobs_per_step: int = RENDER_JOBS_PER_STEP, adaptive: bool = RENDER_ADAPTIVE):
+        self.cpu_count = cpu_count
+        self.ladder = ladder or parse_preset_ladder()
+        self.jobs_per_step = max(1, jobs_per_step)
+        self.adaptive = adaptive
+        self.active_renders = 0
+        self._lock = threading.Lock()
+
+    def choose(self, queue_depth: int, active_renders: int) -> EncodeProfile:
+        """Encode profile for a render started with queue_depth jobs waiting and active_renders running (itself included)"""
+        profile = EncodeProfile.from_env()
+        if not self.adaptive:
+            return profile
+        if "RENDER_PRESET" not in os.environ:
+            step = min(len(self.ladder) - 1, max(0, queue_depth) // self.jobs_per_step)
+            profile = replace(profile, preset=self.ladder[step])
+        if not profile.threads:
+            profile = replace(profile, threads=max(1, self.cpu_count // max(1, active_renders)))
+        return profile
+
+    @contextmanager
+    def lease(self, queue_depth: int = 0):
+        """Hold a render slot for the duration of an ffmpeg run, yielding its encode profile"""
+        with self._lock:
+            self.active_renders += 1
+            profile = self.choose(queue_depth, self.active_renders)
+        render_presets.inc(preset=profile.preset)
+        try:
+            yield profile
+        finally:
+            with self._lock:
+                self.active_renders -= 1
+
+    def run(self, render: Callable, *args, get_queue_depth: Callable[[], int] = None, render_stats: dict = None, **kwargs):
+        """
+        Call render(*args, encode_profile=..., render_stats=..., **kwargs) under a lease, the queue
+        depth is read when the render actually starts. The chosen profile is added to render_stats.
+        """
+        render_stats = render_stats if render_stats is not None else {}
+        with self.lease(get_queue_depth() if get_queue_depth else 0) as encode_profile:
+            render_stats["encode_profile"] = vars(encode_profile)
+            return render(*args, encode_profile=encode_profile, render_stats=render_stats, **kwargs)
+
+# Global render scheduler instance
+render_scheduler = RenderScheduler()
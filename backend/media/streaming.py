@@ -0,0 +1,346 @@
+import os
+import re
+import json
+import time
+import queue
+import threading
+import subprocess
+from array import array
+from dataclasses import replace
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from clients.deepgram import TTS_SAMPLE_RATE
+from media.templates import (
+    TEMPLATE_WIDTH, TEMPLATE_HEIGHT, TEMPLATE_FPS, EncodeProfile, OutputProfile, get_prepared_template,
+    write_segment_playlist
+)
+from media.captions import CAPTION_FORMAT, align_script_to_samples, build_cues, cues_to_ass, cues_to_srt
+from media.caption_layers import CAPTION_RENDERER, write_subtitle_file
+from media.video import build_output_filter, get_caption_input, parse_ffmpeg_stats, stream_video
+from media.probe import get_duration
+from storage.background_library import BackgroundSource
+from utils.metrics import ffmpeg_cpu_seconds
+
+# Sentence end: terminal punctuation, optional closing quotes/brackets, then whitespace
+SENTENCE_BREAK = re.compile(r"[.!?]+['\")\]]*\s+")
+# Words whose trailing period does not end a sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "st", "jr", "sr", "vs", "etc", "e.g", "i.e", "u.s"}
+# Shorter pieces ("Wow." or "Dr.") are merged into the next sentence
+SENTENCE_MIN_CHARS = int(os.environ.get("STREAM_SENTENCE_MIN_CHARS", 20))
+# Upper bound on voiceover length, the background playlist is written for this long
+STREAM_MAX_SECONDS = int(os.environ.get("STREAM_MAX_SECONDS", 120))
+# Sentences whose segment is waiting to be rendered, TTS blocks once this many are queued
+STREAM_RENDER_AHEAD = int(os.environ.get("STREAM_RENDER_AHEAD", 4))
+
+def split_sentences(deltas: Iterable[str], min_chars: int = SENTENCE_MIN_CHARS) -> Iterator[str]:
+    """
+    Yield complete sentences from a stream of text deltas as soon as each one ends
+    """
+    buffer = ""
+    for delta in deltas:
+        buffer += delta
+        search_from = 0
+        while True:
+            match = SENTENCE_BREAK.search(buffer, search_from)
+            if not match:
+                break
+            sentence = buffer[:match.end()].strip()
+            last_word = sentence.rsplit(None, 1)[-1].rstrip(".").lower()
+            if len(sentence) < min_chars or last_word in ABBREVIATIONS:
+                search_from = match.end()
+                continue
+            yield sentence
+            buffer = buffer[match.end():]
+            search_from = 0
+    if buffer.strip():
+        yield buffer.strip()
+
+class PcmAudioEncoder:
+    """
+    This class is used to encode mono 16-bit PCM, written chunk by chunk to ffmpeg's stdin, into AAC
+    """
+    def __init__(self, output_path: str, sample_rate: int, log_path: str):
+        self.output_path = output_path
+        self.log_file = open(log_path, "wb")
+        self.process = subprocess.Popen([
+            'ffmpeg', '-y',
+            '-f', 's16le', '-ar', str(sample_rate), '-ac', '1', '-i', 'pipe:0',
+            '-c:a', 'aac', '-b:a', '128k',
+            output_path
+        ], stdin=subprocess.PIPE, stderr=self.log_file)
+
+    def write(self, pcm: bytes):
+        try:
+            self.process.stdin.write(pcm)
+        except BrokenPipeError:
+            raise RuntimeError("Audio encoding failed")
+
+    def close(self) -> str:
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=300)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            raise RuntimeError("Audio encoding timed out after 5 minutes")
+        finally:
+            self.log_file.close()
+        if self.process.returncode != 0:
+            raise RuntimeError("Audio encoding failed")
+        return self.output_path
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        self.log_file.close()
+
+class StreamingRender:
+    """
+    This class is used to render a video sentence by sentence while the voiceover is still being generated.
+
+    Every sentence's PCM is fed to a running AAC encoder as it arrives and its captions are
+    aligned from that sentence alone. A background thread renders each sentence's video
+    segment, frame-aligned to the audio timeline, and finish() joins the segments with
+    stream copy and muxes in the encoded audio.
+
+    With outputs, every segment is encoded once per profile from a single decode, as in
+    process_video_streaming, and finish() joins each profile's segments into its own video.
+    """
+    def __init__(self, template_path: str, workdir: str, encode_profile: EncodeProfile = None,
+                 sample_rate: int = TTS_SAMPLE_RATE, fps: int = TEMPLATE_FPS, render_stats: dict = None,
+                 outputs: List[OutputProfile] = None):
+        self.template_path = template_path
+        self.workdir = workdir
+        self.encode_profile = encode_profile or EncodeProfile.from_env()
+        self.outputs = outputs or [OutputProfile("output")]
+        self.sample_rate = sample_rate
+        self.fps = fps
+        self.render_stats = render_stats if render_stats is not None else {}
+        self.started = time.perf_counter()
+        self.samples_written = 0
+        self.frames_written = 0
+        self.segment_paths = []
+        self.error = None
+        self.background_filter = None
+        self.background_input = self.get_background_input()
+
+        self.audio = PcmAudioEncoder(
+            os.path.join(workdir, "audio.m4a"), sample_rate, os.path.join(workdir, "ffmpeg_audio.log")
+        )
+        self.render_queue = queue.Queue(maxsize=STREAM_RENDER_AHEAD)
+        self.render_thread = threading.Thread(target=self.render_worker, name="segment-render", daemon=True)
+        self.render_thread.start()
+
+    def get_background_input(self) -> Callable[[float], list]:
+        """
+        Return a function of the start time that gives ffmpeg input arguments for the background
+        """
+        if isinstance(self.template_path, BackgroundSource):
+            # One keyframe-aligned window per job, every segment seeks to its offset inside it
+            background = self.template_path
+            window_start = background.pick_start(STREAM_MAX_SECONDS)
+            self.background_filter = background.normalize_filter(TEMPLATE_WIDTH, TEMPLATE_HEIGHT, self.fps)
+            return lambda start: ['-stream_loop', '-1', '-ss', f"{(window_start + start) % background.duration:.3f}",
+                                  '-i', background.source]
+        try:
+            manifest = get_prepared_template(self.template_path)
+            playlist_path = write_segment_playlist(
+                self.template_path, manifest, STREAM_MAX_SECONDS, os.path.join(self.workdir, "background.ffconcat")
+            )
+            return lambda start: ['-ss', f"{start:.3f}", '-f', 'concat', '-safe', '0', '-i', playlist_path]
+        except Exception as e:
+            print(f"Prepared template unavailable, seeking in the full template: {e}")
+        duration = get_duration(self.template_path)
+        return lambda start: ['-stream_loop', '-1', '-ss', f"{start % duration:.3f}", '-i', self.template_path]
+
+    def add_sentence(self, text: str, pcm_chunks: Iterable[bytes]):
+        """
+        Stream one sentence's PCM into the audio encoder and queue its video segment
+        """
+        if self.error:
+            raise self.error
+        sentence_pcm = bytearray()
+        for chunk in pcm_chunks:
+            self.audio.write(chunk)
+            sentence_pcm.extend(chunk)
+            if "first_audio_seconds" not in self.render_stats:
+                self.render_stats["first_audio_seconds"] = round(time.perf_counter() - self.started, 3)
+        if len(sentence_pcm) % 2:
+            # Keep the next sentence sample-aligned
+            self.audio.write(b"\0")
+            sentence_pcm.append(0)
+        if not sentence_pcm:
+            return
+
+        start = self.samples_written / self.sample_rate
+        self.samples_written += len(sentence_pcm) // 2
+        end = self.samples_written / self.sample_rate
+        # Whole frames on the audio timeline, so segment lengths never drift from the audio
+        first_frame = self.frames_written
+        self.frames_written = round(end * self.fps)
+        index = len(self.segment_paths)
+        caption_path = self.write_sentence_captions(index, text, sentence_pcm, start - first_frame / self.fps)
+        self.segment_paths.append({
+            output.name: os.path.join(self.workdir, f"segment_{index:03d}_{output.name}.mp4") for output in self.outputs
+        })
+        self.render_queue.put((index, first_frame, self.frames_written - first_frame, caption_path))
+
+    def write_sentence_captions(self, index: int, text: str, pcm: bytearray, offset: float) -> Optional[str]:
+        """
+        Align captions for one sentence, shifted by the offset of its audio from its first frame
+        """
+        samples = array("h")
+        samples.frombytes(bytes(pcm))
+        try:
+            timed_words = align_script_to_samples(text, samples, self.sample_rate)
+        except Exception as e:
+            print(f"Caption alignment failed for sentence {index}, rendering it without captions: {e}")
+            return None
+        for word in timed_words:
+            word["start"] += offset
+            word["end"] += offset
+        cues = build_cues(timed_words)
+        if CAPTION_RENDERER == "overlay":
+            # The render reads them as caption images, see get_caption_input
+            caption_path = os.path.join(self.workdir, f"segment_{index:03d}.json")
+            with open(caption_path, "w", encoding="utf-8") as f:
+                json.dump(cues, f)
+            return caption_path
+        caption_path = os.path.join(self.workdir, f"segment_{index:03d}.{CAPTION_FORMAT}")
+        with open(caption_path, "w", encoding="utf-8") as f:
+            f.write(cues_to_ass(cues) if CAPTION_FORMAT == "ass" else cues_to_srt(cues))
+        return caption_path
+
+    def render_worker(self):
+        while True:
+            item = self.render_queue.get()
+            if item is None:
+                return
+            if self.error:
+                continue  # Drain the queue so add_sentence never blocks after a failure
+            try:
+                self.render_segment(*item)
+            except Exception as e:
+                self.error = e
+
+    def render_segment(self, index: int, first_frame: int, frame_count: int, caption_path: Optional[str]):
+        if frame_count <= 0:
+            return
+        caption_args, caption_input = [], None
+        if caption_path:
+            # Segments have no audio input, so the caption overlay is input 1
+            caption_args, caption_input = get_caption_input(caption_path, self.workdir, self.render_stats, input_index=1)
+            if caption_input is None:
+                caption_path = write_subtitle_file(caption_path, self.workdir)
+        cmd = ['ffmpeg', '-y', '-benchmark']
+        output_encode_profile = self.encode_profile
+        if self.encode_profile.threads:
+            cmd += ['-filter_complex_threads', str(self.encode_profile.threads)]
+            output_encode_profile = replace(self.encode_profile, threads=max(1, self.encode_profile.threads // len(self.outputs)))
+        cmd += [
+            *self.background_input(first_frame / self.fps),
+            *caption_args,
+            '-filter_complex', build_output_filter(caption_path, self.outputs, caption_input, self.background_filter),
+        ]
+        for output_index, output in enumerate(self.outputs):
+            cmd += [
+                '-map', f'[v{output_index}]',
+                *output.ffmpeg_args(output_encode_profile),
+                '-pix_fmt', 'yuv420p',
+                '-r', str(self.fps),
+                '-frames:v', str(frame_count),
+                '-an',
+                self.segment_paths[index][output.name]
+            ]
+        try:
+            result = subprocess.run(cmd, check=True, stderr=subprocess.PIPE, timeout=300)
+        except subprocess.CalledProcessError:
+            raise RuntimeError(f"Video processing failed for segment {index}")
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("Processing timed out after 5 minutes")
+        stats = parse_ffmpeg_stats(result.stderr.decode(errors="ignore"))
+        self.render_stats["ffmpeg_cpu_seconds"] = round(
+            self.render_stats.get("ffmpeg_cpu_seconds", 0) + stats.get("ffmpeg_cpu_seconds", 0), 3
+        )
+        if index == 0:
+            self.render_stats["first_segment_seconds"] = round(time.perf_counter() - self.started, 3)
+
+    def finish(self, upload_stream=None) -> dict:
+        """
+        Wait for the remaining segments and mux each output's segments with the audio.
+        Returns a dict of output name to path, the first output's path is None when
+        upload_stream took it (see stream_video).
+        """
+        self.render_queue.put(None)
+        self.render_thread.join()
+        audio_path = self.audio.close()
+        if self.error:
+            raise self.error
+        self.render_stats["sentences"] = len(self.segment_paths)
+        if "ffmpeg_cpu_seconds" in self.render_stats:
+            ffmpeg_cpu_seconds.observe(self.render_stats["ffmpeg_cpu_seconds"])
+        return {
+            output.name: self.join_segments(output.name, audio_path, upload_stream if index == 0 else None)
+            for index, output in enumerate(self.outputs)
+        }
+
+    def join_segments(self, name: str, audio_path: str, upload_stream=None) -> Optional[str]:
+        """Join the segments of one output and mux in the audio, returns its path or None when uploaded"""
+        segment_paths = [paths[name] for paths in self.segment_paths if os.path.exists(paths[name])]
+        if not segment_paths:
+            raise RuntimeError("No video segments were rendered")
+        playlist_path = os.path.join(self.workdir, f"segments_{name}.ffconcat")
+        with open(playlist_path, "w", encoding="utf-8") as f:
+            f.write("ffconcat version 1.0\n" + "".join(f"file '{path}'\n" for path in segment_paths))
+        cmd = [
+            'ffmpeg', '-y',
+            '-f', 'concat', '-safe', '0', '-i', playlist_path,
+            '-i', audio_path,
+            '-map', '0:v', '-map', '1:a',
+            '-c', 'copy',  # Segments share encoder settings, so they join without re-encoding
+            '-shortest',
+        ]
+        if upload_stream:
+            cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1']
+            stream_video(cmd, upload_stream)
+            return None
+
+        output_path = os.path.join(self.workdir, "output.mp4" if name == self.outputs[0].name else f"output_{name}.mp4")
+        cmd += ['-movflags', '+faststart', output_path]
+        try:
+            subprocess.run(cmd, check=True, stderr=subprocess.PIPE, timeout=300)
+        except subprocess.CalledProcessError:
+            raise RuntimeError("Video processing failed")
+        except subprocess.TimeoutExpired:
+            raise RuntimeError("Processing timed out after 5 minutes")
+        if os.path.getsize(output_path) == 0:
+            raise RuntimeError("Empty output file")
+        return output_path
+
+    def abort(self):
+        self.error = self.error or RuntimeError("Render aborted")
+        self.render_queue.put(None)
+        self.render_thread.join()
+        self.audio.kill()
+
+def render_sentence_stream(deltas: Iterable[str], synthesize: Callable[[str], Iterable[bytes]], template_path: str,
+                           workdir: str, encode_profile: EncodeProfile = None, upload_stream=None,
+                           render_stats: dict = None, outputs: List[OutputProfile] = None) -> Tuple[object, str]:
+    """
+    Render a video from streamed script deltas, voicing every sentence with synthesize(sentence)
+    (an iterable of PCM chunks) as soon as the sentence is complete.
+    Returns the output path (None when uploaded through upload_stream) and the full script.
+    With outputs, the first value is a dict of output name to path, as from process_video_streaming.
+    """
+    render = StreamingRender(template_path, workdir, encode_profile, render_stats=render_stats, outputs=outputs)
+    sentences = []
+    try:
+        for sentence in split_sentences(deltas):
+            sentences.append(sentence)
+            render.add_sentence(sentence, synthesize(sentence))
+        if not sentences:
+            raise ValueError("Generated script is empty")
+        output_paths = render.finish(upload_stream)
+        return (output_paths if outputs else output_paths["output"]), " ".join(sentences)
+    except BaseException:
+        render.abort()
+        raise
@@ -0,0 +1,192 @@
+import os
+import re
+import sys
+import csv
+import json
+import random
+import subprocess
+import threading
+from dataclasses import dataclass
+from typing import List, Optional
+
+TEMPLATE_WIDTH = int(os.environ.get("TEMPLATE_WIDTH", 1080))
+TEMPLATE_HEIGHT = int(os.environ.get("TEMPLATE_HEIGHT", 1920))
+TEMPLATE_FPS = int(os.environ.get("TEMPLATE_FPS", 30))
+TEMPLATE_SEGMENT_SECONDS = int(os.environ.get("TEMPLATE_SEGMENT_SECONDS", 2))
+# Outputs rendered from one decode, "name:WIDTHxHEIGHT[:crf[:maxrate]]" separated by commas, the first is the main video,
+# e.g. "hd:1080x1920,preview:720x1280:30,share:540x960:32:600k"
+RENDER_OUTPUTS = os.environ.get("RENDER_OUTPUTS", "")
+OUTPUT_NAME_PATTERN = re.compile(r"^[a-z0-9_]+$")
+
+MANIFEST_NAME = "manifest.json"
+PREPARED_SUFFIX = ".segments"
+
+_prepare_lock = threading.Lock()
+
+@dataclass
+class EncodeProfile:
+    """
+    x264 settings used for the final render
+    """
+    preset: str = "veryfast"
+    crf: int = 28
+    threads: int = 0  # 0 lets x264 decide
+
+    @classmethod
+    def from_env(cls) -> "EncodeProfile":
+        return cls(
+            preset=os.environ.get("RENDER_PRESET", cls.preset),
+            crf=int(os.environ.get("RENDER_CRF", cls.crf)),
+            threads=int(os.environ.get("RENDER_THREADS", cls.threads))
+        )
+
+    def ffmpeg_args(self) -> list:
+        return ['-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf), '-threads', str(self.threads)]
+
+@dataclass
+class OutputProfile:
+    """
+    One rendered output: its size and, optionally, its own CRF and bitrate cap
+    """
+    name: str
+    width: int = TEMPLATE_WIDTH
+    height: int = TEMPLATE_HEIGHT
+    crf: Optional[int] = None  # None uses the encode profile's CRF
+    maxrate: Optional[str] = None  # e.g. "600k", caps the bitrate for share versions
+
+    def ffmpeg_args(self, encode_profile: EncodeProfile) -> list:
+        args = ['-c:v', 'libx264', '-preset', encode_profile.preset, '-crf', str(self.crf or encode_profile.crf),
+                '-threads', str(encode_profile.threads)]
+        if self.maxrate:
+            args += ['-maxrate', self.maxrate, '-bufsize', self.maxrate]
+        return args
+
+    @property
+    def is_full_size(self) -> bool:
+        return (self.width, self.height) == (TEMPLATE_WIDTH, TEMPLATE_HEIGHT)
+
+def parse_output_profiles(spec: str = RENDER_OUTPUTS) -> List[OutputProfile]:
+    """
+    Parse RENDER_OUTPUTS, a single full-size output named "hd" when it is empty
+    """
+    profiles = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        fields = entry.split(":")
+        if len(fields) < 2 or not OUTPUT_NAME_PATTERN.match(fields[0]):
+            raise ValueError(f"Invalid render output: {entry}")
+        width, height = (int(value) for value in fields[1].lower().split("x"))
+        profiles.append(OutputProfile(
+            name=fields[0],
+            width=width,
+            height=height,
+            crf=int(fields[2]) if len(fields) > 2 and fields[2] else None,
+            maxrate=fields[3] if len(fields) > 3 else None
+        ))
+    if len({profile.name for profile in profiles}) != len(profiles):
+        raise ValueError("Render output names must be unique")
+    return profiles or [OutputProfile("hd")]
+
+def get_prepared_dir(template_path: str) -> str:
+    """Prepared segments live next to the cached template, so they share its ETag-keyed name"""
+    return template_path + PREPARED_SUFFIX
+
+def prepare_template(source_path: str, output_dir: str, segment_seconds: int = TEMPLATE_SEGMENT_SECONDS,
+                     width: int = TEMPLATE_WIDTH, height: int = TEMPLATE_HEIGHT, fps: int = TEMPLATE_FPS) -> dict:
+    """
+    Normalize a background video into fixed-length, keyframe-aligned segments at the target size and fps
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    segment_list_path = os.path.join(output_dir, "segments.csv")
+    cmd = [
+        'ffmpeg',
+        '-y',
+        '-i', source_path,
+        '-an',  # Voiceover is the only audio track
+        '-vf', f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps}",
+        '-c:v', 'libx264',
+        '-preset', 'slow',  # Paid once per template, so spend it on quality
+        '-crf', '18',
+        '-pix_fmt', 'yuv420p',
+        '-force_key_frames', f"expr:gte(t,n_forced*{segment_seconds})",
+        '-sc_threshold', '0',
+        '-f', 'segment',
+        '-segment_time', str(segment_seconds),
+        '-segment_list', segment_list_path,
+        '-segment_list_type', 'csv',
+        '-reset_timestamps', '1',
+        os.path.join(output_dir, 'seg_%04d.mp4')
+    ]
+    try:
+        subprocess.run(cmd, check=True, stderr=subprocess.PIPE, timeout=1800)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"Template preparation failed: {e.stderr.decode(errors='ignore')[-500:]}")
+
+    segments = []
+    with open(segment_list_path, newline="") as f:
+        for file_name, start, end in csv.reader(f):
+            segments.append({"file": file_name, "duration": float(end) - float(start)})
+
+    manifest = {
+        "source": os.path.basename(source_path),
+        "segment_seconds": segment_seconds,
+        "width": width,
+        "height": height,
+        "fps": fps,
+        "segments": segments
+    }
+    # The manifest is written last and marks the preparation as complete
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    return manifest
+
+def load_manifest(prepared_dir: str) -> dict:
+    manifest_path = os.path.join(prepared_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def get_prepared_template(template_path: str) -> dict:
+    """
+    Return the segment manifest for a template, preparing it on first use
+    """
+    prepared_dir = get_prepared_dir(template_path)
+    manifest = load_manifest(prepared_dir)
+    if manifest:
+        return manifest
+    with _prepare_lock:
+        manifest = load_manifest(prepared_dir)
+        if manifest:
+            return manifest
+        print(f"Preparing template segments for {template_path}")
+        return prepare_template(template_path, prepared_dir)
+
+def write_segment_playlist(template_path: str, manifest: dict, duration: float, playlist_path: str, rng: random.Random = None) -> str:
+    """
+    Write an ffmpeg concat playlist that starts at a random segment and covers duration seconds
+    """
+    rng = rng or random.Random()
+    segments = manifest["segments"]
+    prepared_dir = get_prepared_dir(template_path)
+    index = rng.randrange(len(segments))
+    covered = 0.0
+    lines = ["ffconcat version 1.0"]
+    while covered < duration:
+        segment = segments[index]
+        lines.append(f"file '{os.path.join(prepared_dir, segment['file'])}'")
+        covered += segment["duration"]
+        # Wrap around to loop the background like -stream_loop did
+        index = (index + 1) % len(segments)
+    with open(playlist_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return playlist_path
+
+if __name__ == "__main__":
+    # Offline preparation: python -m media.templates <source.mp4> [output_dir]
+    if len(sys.argv) < 2:
+        print("Usage: python -m media.templates <source.mp4> [output_dir]")
+        sys.exit(1)
+    source = sys.argv[1]
+    target = sys.argv[2] if len(sys.argv) > 2 else get_prepared_dir(source)
+    result = prepare_template(source, target)
+    print(f"Prepared {len(result['segments'])} segments in {target}")
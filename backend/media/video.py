@@ -1,74 +1,330 @@
 import os
-import tempfile
-from io import BytesIO
-from moviepy import VideoFileClip, AudioFileClip, TextClip
-from clients.deepgram import DeepgramService
+import re
+import json
+import time
+import threading
+from dataclasses import replace
+from typing import List
+from media.templates import (
+    TEMPLATE_WIDTH, TEMPLATE_HEIGHT, TEMPLATE_FPS, EncodeProfile, OutputProfile, get_prepared_template,
+    write_segment_playlist
+)
+from media.captions import CAPTION_MODE, CAPTION_FORMAT, generate_captions, generate_caption_cues
+from media.caption_layers import (
+    CAPTION_RENDERER, prerender_layers, write_caption_overlay, overlay_filter, write_subtitle_file
+)
+from media.audio import get_audio_format, audio_output_args
+from media.probe import get_duration, get_voiceover_duration
+from utils.metrics import ffmpeg_cpu_seconds, ffmpeg_encode_fps
+from utils.services import get_deepgram_service
+from storage.background_library import BackgroundSource
 import subprocess
 
-deepgram_service = DeepgramService()
+# Render from pre-sliced template segments instead of looping and re-encoding the whole template
+USE_PREPARED_TEMPLATES = os.environ.get("USE_PREPARED_TEMPLATES", "1") == "1"
 
 def get_audio_duration(file_path: str) -> float:
     """Return the duration of an audio file in seconds"""
-    return AudioFileClip(file_path).duration
+    return get_duration(file_path)
 
 def get_video_duration(file_path: str) -> float:
     """Return the duration of a video file in seconds"""
-    return VideoFileClip(file_path).duration
+    return get_duration(file_path)
 
-def subtitle_generator(txt: str) -> TextClip:
+# moviepy pulls in numpy and imageio, so it is only imported by the helper that uses it
+def subtitle_generator(txt: str) -> "TextClip":
     """Generate a TextClip for subtitles."""
+    from moviepy import TextClip
     return TextClip(text=txt, font_size=24, color='white', stroke_color='black', stroke_width=1)
 
-def process_video_streaming(audio_bytes: bytes, video_bytes: BytesIO) -> BytesIO:
+def get_background_input(video_path: str, duration: float, tmpdir: str) -> list:
     """
-    Merge video, audio, and captions with length check using MoviePy
+    Return ffmpeg input arguments for the background: a window of a library background, or
+    prepared segments of the single template from a random offset
     """
-    with tempfile.TemporaryDirectory() as tmpdir:
-        # Write input bytes to temp files
-        audio_path = os.path.join(tmpdir, "audio.wav")
-        video_path = os.path.join(tmpdir, "video.mp4")
-        srt_path   = os.path.join(tmpdir, "captions.srt")
-        output_path= os.path.join(tmpdir, "output.mp4")
+    if isinstance(video_path, BackgroundSource):
+        return video_path.input_args(duration)
+    if USE_PREPARED_TEMPLATES:
+        try:
+            manifest = get_prepared_template(video_path)
+            playlist_path = write_segment_playlist(video_path, manifest, duration, os.path.join(tmpdir, "background.ffconcat"))
+            return ['-f', 'concat', '-safe', '0', '-i', playlist_path]
+        except Exception as e:
+            print(f"Prepared template unavailable, looping the full template: {e}")
+    return ['-stream_loop', '-1', '-i', video_path]  # Loop video to match audio length
+
+def write_captions(script: str, audio_bytes: bytes, audio_path: str, tmpdir: str) -> str:
+    """
+    Write captions for the voiceover and return their path.
+    Captions are aligned locally from the known script, Deepgram transcription is the fallback.
+    """
+    if CAPTION_MODE == "local" and script and CAPTION_RENDERER == "overlay":
+        try:
+            # Cues keep their word timings for highlighting, the images are rendered now, off the encode
+            cues = generate_caption_cues(script, audio_bytes)
+            caption_path = os.path.join(tmpdir, "captions.json")
+            with open(caption_path, "w", encoding="utf-8") as f:
+                json.dump(cues, f)
+            try:
+                layer_stats = prerender_layers(cues)
+                print(f"Caption images: {layer_stats.get('rendered', 0)} rendered, {layer_stats.get('cached', 0)} cached")
+            except Exception as e:
+                print(f"Pre-rendering caption images failed, the render will retry: {e}")
+            return caption_path
+        except Exception as e:
+            print(f"Local caption alignment failed, falling back to Deepgram: {e}")
+    elif CAPTION_MODE == "local" and script:
+        try:
+            caption_path = os.path.join(tmpdir, f"captions.{CAPTION_FORMAT}")
+            with open(caption_path, "w", encoding="utf-8") as f:
+                f.write(generate_captions(script, audio_bytes))
+            return caption_path
+        except Exception as e:
+            print(f"Local caption alignment failed, falling back to Deepgram: {e}")
 
+    caption_path = os.path.join(tmpdir, "captions.srt")
+    srt_content = get_deepgram_service().generate_captions_with_deepgram(audio_path)
+    with open(caption_path, "w", encoding="utf-8") as f:
+        f.write(srt_content)
+    return caption_path
+
+def write_audio(audio_bytes: bytes, workdir: str) -> str:
+    """Write the voiceover to the work directory once and return its path"""
+    audio_path = os.path.join(workdir, f"audio.{get_audio_format(audio_bytes)['extension']}")
+    if not os.path.exists(audio_path):
         with open(audio_path, "wb") as f:
             f.write(audio_bytes)
-        video_bytes.seek(0)
-        with open(video_path, "wb") as f:
-            f.write(video_bytes.read())
-
-        # Generate and write captions (SRT)
-        srt_content = deepgram_service.generate_captions_with_deepgram(audio_path)
-        with open(srt_path, "w", encoding="utf-8") as f:
-            f.write(srt_content)
-        cmd = [
-            'ffmpeg',
-            '-y',  # Overwrite output
-            '-stream_loop', '-1',  # Loop video to match audio length
-            '-i', video_path,
-            '-i', audio_path,
-            '-vf', f"subtitles='{srt_path}':force_style='Fontsize=18'",  # Burn subtitles
-            '-c:v', 'libx264',
-            '-preset', 'medium',
-            '-crf', '28',
-            '-pix_fmt', 'yuv420p',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-movflags', '+faststart',
-            '-map', '0:v',  # Map video from first input
+    return audio_path
+
+def prepare_captions(audio_bytes: bytes, script: str, workdir: str) -> str:
+    """
+    Write captions for the voiceover into workdir, this only needs the audio so it can run before the render
+    """
+    audio_path = write_audio(audio_bytes, workdir)
+    return write_captions(script, audio_bytes, audio_path, workdir)
+
+def parse_ffmpeg_stats(stderr: str) -> dict:
+    """
+    Read CPU time (from -benchmark) and encode speed (from the last progress line) out of ffmpeg's stderr
+    """
+    stats = {}
+    bench = re.search(r"bench: utime=([\d.]+)s stime=([\d.]+)s rtime=([\d.]+)s", stderr)
+    if bench:
+        stats["ffmpeg_cpu_seconds"] = round(float(bench.group(1)) + float(bench.group(2)), 3)
+        stats["ffmpeg_wall_seconds"] = float(bench.group(3))
+    frames = re.findall(r"frame=\s*(\d+)", stderr)
+    if frames:
+        stats["frames"] = int(frames[-1])
+    fps = re.findall(r"fps=\s*([\d.]+)", stderr)
+    if fps:
+        stats["ffmpeg_fps"] = float(fps[-1])
+    return stats
+
+def record_ffmpeg_stats(stderr: str, render_stats: dict):
+    stats = parse_ffmpeg_stats(stderr)
+    if "ffmpeg_cpu_seconds" in stats:
+        ffmpeg_cpu_seconds.observe(stats["ffmpeg_cpu_seconds"])
+    if "ffmpeg_fps" in stats:
+        ffmpeg_encode_fps.observe(stats["ffmpeg_fps"])
+    if render_stats is not None:
+        render_stats.update(stats)
+
+def read_ffmpeg_stderr(stderr, log: list, duration: float = None, on_progress=None):
+    """
+    Collect ffmpeg's stderr lines into log, calling on_progress(percent) from -progress output
+    whenever another whole percent of duration has been encoded
+    """
+    last_percent = -1
+    for raw_line in iter(stderr.readline, b""):
+        line = raw_line.decode(errors="ignore").strip()
+        log.append(line)
+        if not (on_progress and duration and line.startswith("out_time_us=")):
+            continue
+        try:
+            percent = min(100.0, int(line.split("=", 1)[1]) / 1_000_000 / duration * 100)
+        except ValueError:
+            continue  # N/A until the first frame is written
+        if int(percent) > last_percent:
+            last_percent = int(percent)
+            try:
+                on_progress(percent)
+            except Exception as e:
+                print(f"Error reporting render progress: {e}")
+
+def start_ffmpeg(cmd: list, duration: float = None, on_progress=None, stdout=None) -> tuple:
+    """
+    Start ffmpeg with its stderr read on a thread, so a full pipe never blocks it.
+    Returns the process, the reader thread and the list the log lines are collected in.
+    """
+    # Machine readable progress on stderr instead of the \r-separated stats line
+    cmd = cmd[:1] + ['-progress', 'pipe:2', '-nostats'] + cmd[1:]
+    process = subprocess.Popen(cmd, stdout=stdout, stderr=subprocess.PIPE)
+    log = []
+    reader = threading.Thread(target=read_ffmpeg_stderr, args=(process.stderr, log, duration, on_progress), daemon=True)
+    reader.start()
+    return process, reader, log
+
+def build_output_filter(caption_path: str, outputs: List[OutputProfile], caption_input: int = None,
+                        background_filter: str = None) -> str:
+    """
+    Decode and burn captions once, then split into one scaled stream per output, labelled [v0], [v1], ...
+    Captions are overlaid from input caption_input when given, otherwise libass renders caption_path,
+    and without either the background is passed through.
+    background_filter, if given, first brings the background to the template size and frame rate.
+    """
+    background = "[0:v]"
+    if background_filter:
+        background = f"[0:v]{background_filter}[bg];[bg]"
+    if caption_input is not None:
+        subtitles = overlay_filter(caption_input, background)
+    elif not caption_path:
+        subtitles = f"{background}null"
+    else:
+        subtitles = f"{background}subtitles='{caption_path}':force_style='Fontsize=18'"
+    if len(outputs) == 1 and outputs[0].is_full_size:
+        return subtitles + "[v0]"
+    graph = [subtitles + f",split={len(outputs)}" + "".join(f"[s{index}]" for index in range(len(outputs)))]
+    for index, output in enumerate(outputs):
+        if output.is_full_size:
+            graph.append(f"[s{index}]null[v{index}]")
+        else:
+            graph.append(f"[s{index}]scale={output.width}:{output.height}[v{index}]")
+    return ";".join(graph)
+
+def get_caption_input(caption_path: str, workdir: str, render_stats: dict = None, input_index: int = 2) -> tuple:
+    """
+    ffmpeg input arguments and input index (input_index, after the background and the voiceover by
+    default) of the caption overlay, or no arguments and None when captions are burned in with libass
+    """
+    if CAPTION_RENDERER == "overlay":
+        try:
+            layer_stats = {}
+            playlist_path = write_caption_overlay(caption_path, workdir, stats=layer_stats)
+            if render_stats is not None:
+                render_stats["caption_renderer"] = "overlay"
+                render_stats["caption_layers_rendered"] = (render_stats.get("caption_layers_rendered", 0)
+                                                           + layer_stats.get("rendered", 0))
+            return ['-f', 'concat', '-safe', '0', '-i', playlist_path], input_index
+        except Exception as e:
+            print(f"Caption overlay unavailable, burning captions in with libass: {e}")
+    if render_stats is not None:
+        render_stats["caption_renderer"] = "libass"
+    return [], None
+
+def process_video_streaming(audio_bytes: bytes, video_path: str, workdir: str, script: str = None,
+                            encode_profile: EncodeProfile = None, upload_stream=None, render_stats: dict = None,
+                            caption_path: str = None, on_progress=None, outputs: List[OutputProfile] = None):
+    """
+    Merge the background video at video_path with audio and burned-in captions using FFmpeg.
+
+    The result is written to workdir and its path returned. When upload_stream is given,
+    ffmpeg writes fragmented MP4 to a pipe instead and upload_stream(stdout, check_ffmpeg)
+    uploads it while it is being encoded, nothing is written to disk and None is returned.
+    Captions from prepare_captions can be passed as caption_path, otherwise they are made here.
+    render_stats, if given, is filled with caption time and ffmpeg CPU time and encode fps.
+    on_progress, if given, is called with the percent of the video encoded so far.
+
+    With outputs, every profile is encoded by this one ffmpeg run from a single decode and
+    subtitle burn, and a dict of output name to path is returned. Only the first output
+    goes to upload_stream, its path is None.
+    """
+    encode_profile = encode_profile or EncodeProfile.from_env()
+    profiles = outputs or [OutputProfile("output")]
+    # Write audio bytes to a work file, the video template is read in place
+    audio_path = write_audio(audio_bytes, workdir)
+
+    if not caption_path:
+        # Generate and write captions (SRT or ASS)
+        captions_start = time.perf_counter()
+        caption_path = prepare_captions(audio_bytes, script, workdir)
+        if render_stats is not None:
+            render_stats["captions_seconds"] = round(time.perf_counter() - captions_start, 3)
+    duration = get_voiceover_duration(audio_bytes, audio_path)
+    background_input = get_background_input(video_path, duration, workdir)
+    background_filter = None
+    if isinstance(video_path, BackgroundSource):
+        background_filter = video_path.normalize_filter(TEMPLATE_WIDTH, TEMPLATE_HEIGHT, TEMPLATE_FPS)
+    caption_args, caption_input = get_caption_input(caption_path, workdir, render_stats)
+    if caption_input is None:
+        caption_path = write_subtitle_file(caption_path, workdir)
+    cmd = [
+        'ffmpeg',
+        '-y',  # Overwrite output
+        '-benchmark',  # Report CPU time used on exit
+    ]
+    output_encode_profile = encode_profile
+    if encode_profile.threads:
+        # The thread budget covers the whole run, the filters and every output's encoder share it
+        cmd += ['-filter_complex_threads', str(encode_profile.threads)]
+        output_encode_profile = replace(encode_profile, threads=max(1, encode_profile.threads // len(profiles)))
+    cmd += [
+        *background_input,
+        '-i', audio_path,
+        *caption_args,
+        '-filter_complex', build_output_filter(caption_path, profiles, caption_input, background_filter),  # Burn captions, split and scale
+    ]
+    output_paths = {}
+    for index, profile in enumerate(profiles):
+        cmd += [
+            '-map', f'[v{index}]',  # Map the filtered video
             '-map', '1:a',  # Map audio from second input
+            *profile.ffmpeg_args(output_encode_profile),
+            '-pix_fmt', 'yuv420p',
+            *audio_output_args(audio_bytes),  # Compressed voiceovers are copied, not re-encoded
             '-shortest',  # End with shortest stream
-            output_path
         ]
+        if index == 0 and upload_stream:
+            # faststart needs a seekable output, fragmented MP4 can be written to a pipe
+            cmd += ['-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-f', 'mp4', 'pipe:1']
+            output_paths[profile.name] = None
+        else:
+            output_path = os.path.join(workdir, "output.mp4" if index == 0 else f"output_{profile.name}.mp4")
+            cmd += ['-movflags', '+faststart', output_path]
+            output_paths[profile.name] = output_path
+
+    if upload_stream:
+        stream_video(cmd, upload_stream, render_stats, duration, on_progress)
+    else:
         # Execute FFmpeg
+        process, reader, log = start_ffmpeg(cmd, duration, on_progress)
         try:
-            subprocess.run(cmd, check=True, stderr=subprocess.PIPE, timeout=300)
-            # Verify and return output
-            with open(output_path, "rb") as f:
-                if f.read(1):  # Check not empty
-                    f.seek(0)
-                    return BytesIO(f.read())
-                raise RuntimeError("Empty output file")
-        except subprocess.CalledProcessError:
-            raise RuntimeError("Video processing failed")
+            process.wait(timeout=300)
         except subprocess.TimeoutExpired:
-            raise RuntimeError("Processing timed out after 5 minutes")
\ No newline at end of file
+            process.kill()
+            raise RuntimeError("Processing timed out after 5 minutes")
+        finally:
+            reader.join()
+        if process.returncode != 0:
+            raise RuntimeError("Video processing failed")
+        record_ffmpeg_stats("\n".join(log), render_stats)
+    # Verify output
+    for output_path in output_paths.values():
+        if output_path and os.path.getsize(output_path) == 0:
+            raise RuntimeError("Empty output file")
+    return output_paths if outputs else output_paths["output"]
+
+def stream_video(cmd: list, upload_stream, render_stats: dict = None, duration: float = None, on_progress=None):
+    """
+    Run ffmpeg with stdout piped into upload_stream, failing the upload if ffmpeg fails
+    """
+    process, reader, log = start_ffmpeg(cmd, duration, on_progress, stdout=subprocess.PIPE)
+    timer = threading.Timer(300, process.kill)
+    timer.start()
+
+    def check_ffmpeg():
+        process.wait()
+        reader.join()
+        if not timer.is_alive():
+            raise RuntimeError("Processing timed out after 5 minutes")
+        if process.returncode != 0:
+            raise RuntimeError("Video processing failed")
+        record_ffmpeg_stats("\n".join(log), render_stats)
+
+    try:
+        upload_stream(process.stdout, check_ffmpeg)
+    finally:
+        timer.cancel()
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from utils.metrics import registry, Gauge
+from utils.job_executor import job_executor
+from utils.task_queue import task_queue
+
+router = APIRouter()
+
+registry.register(Gauge(
+    "reels_jobs_inflight", "Jobs currently running in this process", lambda: job_executor.running_jobs
+))
+registry.register(Gauge(
+    "reels_jobs_queued", "Jobs waiting for a free slot in this process", lambda: job_executor.queued_jobs
+))
+registry.register(Gauge(
+    "reels_tasks_pending", "Tasks waiting in the shared task store for a worker", task_queue.count_pending_tasks
+))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Expose pipeline metrics in the Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,112 +1,696 @@
 import os
-from fastapi import APIRouter
+import json
+import time
+import shutil
 import asyncio
-from clients.openai import OpenAIService
-from clients.deepgram import DeepgramService
-from storage.cloudflare_s3 import CloudflareS3
-from media.video import process_video_streaming
+import tempfile
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from storage.result_cache import make_cache_key
+from media.video import process_video_streaming, prepare_captions, USE_PREPARED_TEMPLATES
+from media.templates import EncodeProfile, get_prepared_template, parse_output_profiles
+from media.streaming import render_sentence_stream
+from media.captions import CAPTION_MODE, CAPTION_FORMAT, CAPTION_CHUNKING
+from media.caption_layers import CAPTION_RENDERER, CAPTION_STYLE
+from media.audio import (
+    TTS_AUDIO_CODEC, REEL_MIN_SECONDS, REEL_MAX_SECONDS, estimate_speech_seconds, fit_voiceover,
+    is_script_length_ok, target_word_count
+)
 from utils.task_queue import task_queue, TaskStatus
+from utils.task_store import check_shared_task_store
+from utils.progress import progress_broker
+from utils.job_executor import job_executor, QueueFullError
+from utils.fair_queue import INTERACTIVE, BATCH
+from media.render_scheduler import render_scheduler
+from utils.metrics import StageTimings, queue_wait_seconds, job_seconds
+from utils.pipeline_graph import PipelineGraph, Stage, StageError, STAGE_RETRIES
+from utils.services import (
+    get_cloudflare_s3, get_template_cache, get_result_cache, get_checkpoint_store, get_deepgram_service,
+    get_openai_service, get_reddit_client, get_background_library
+)
+from storage.background_library import TEMPLATE_FILE_NAME
 from clients.reddit import RedditClient
 
 BUCKET_NAME = os.environ.get('CLOUDFLARE_TTS_BUCKET_NAME')
+# "inprocess" runs jobs on this process' executor, "worker" leaves them in the task store for worker.py
+TASK_DISPATCH = os.environ.get('TASK_DISPATCH', 'inprocess')
+if TASK_DISPATCH == "worker":
+    check_shared_task_store()
+# Pipe ffmpeg's output straight into a multipart upload instead of writing the file first
+STREAM_UPLOAD = os.environ.get('STREAM_UPLOAD', '0') == '1'
+# Stream the script sentence by sentence into TTS and render segments while the rest is generated
+STREAM_TTS = os.environ.get('STREAM_TTS', '0') == '1'
+# Bump when a pipeline change should invalidate cached results
+PIPELINE_VERSION = "1"
+# Posts per batch request, and how many of a batch's jobs may be queued or running at once
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 100))
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_CONCURRENCY', job_executor.max_running_jobs))
+BATCH_RETRY_SECONDS = 1.0
+# Profiles rendered for every reel from one decode (RENDER_OUTPUTS), the first one is the main video
+OUTPUT_PROFILES = parse_output_profiles()
+# Progress stage reported to clients when a pipeline stage starts
+PROGRESS_STAGES = {
+    "reddit": "fetching",
+    "script": "scripting",
+    "tts": "tts",
+    "captions": "captions",
+    "render": "rendering",
+    "upload": "uploading",
+}
+# Idle SSE streams send a comment and re-check the task store this often
+EVENTS_KEEPALIVE_SECONDS = 15
+# Stage results kept as checkpoints so a retried task resumes after its last finished stage
+STAGE_CHECKPOINTS = {
+    "reddit": "json",
+    "script": "text",
+    "tts": "bytes",
+    "captions": "file",
+    "render": "files",
+    "upload": "json",
+}
 
 router = APIRouter()
-cloudflare_s3 = CloudflareS3()
-deepgram_service = DeepgramService()
-openai_service = OpenAIService()
+# Result cache key -> task ID of the job currently rendering it, to coalesce duplicate requests
+inflight_tasks = {}
+# Running batch dispatchers
+batch_jobs = set()
+
+class CountingReader:
+    """Wrap a stream and count the bytes read through it"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        return data
+
+def get_pipeline_settings() -> dict:
+    """Settings that change the rendered output, part of every result cache key"""
+    return {
+        "version": PIPELINE_VERSION,
+        "caption_mode": CAPTION_MODE,
+        "caption_format": CAPTION_FORMAT,
+        "caption_chunking": CAPTION_CHUNKING,
+        "caption_renderer": CAPTION_RENDERER,
+        "caption_style": CAPTION_STYLE,
+        "stream_tts": STREAM_TTS,
+        "tts_audio_codec": TTS_AUDIO_CODEC,
+        "reel_seconds": [REEL_MIN_SECONDS, REEL_MAX_SECONDS],
+        "encode_profile": vars(EncodeProfile.from_env()),
+        "outputs": [vars(profile) for profile in OUTPUT_PROFILES],
+    }
+
+async def get_cached(getter, layer: str, key: str):
+    if not key:
+        return None
+    return await job_executor.run_in_stage("storage", getter, layer, key)
+
+async def set_cached(setter, layer: str, key: str, value):
+    if key and value:
+        await job_executor.run_in_stage("storage", setter, layer, key, value)
+
+def get_video_file_names(task_id: str) -> dict:
+    """Object names of a task's rendered outputs, the main one keeps the original name"""
+    return {
+        profile.name: f"output_video_{task_id}.mp4" if index == 0 else f"output_video_{task_id}_{profile.name}.mp4"
+        for index, profile in enumerate(OUTPUT_PROFILES)
+    }
+
+def get_video_urls(cloudflare_s3, file_names: dict) -> dict:
+    return {name: cloudflare_s3.get_s3_url(BUCKET_NAME, file_name) for name, file_name in file_names.items()}
+
+def get_queue_depth() -> int:
+    """Jobs waiting for a run slot plus the other running jobs, read when a render starts"""
+    return job_executor.queued_jobs + max(0, job_executor.running_jobs - 1)
+
+async def find_existing_task(url: str, post_id: str) -> Optional[dict]:
+    """
+    Return the task for a post whose video is already cached or being rendered, if any
+    """
+    video_cache_key = make_cache_key("video", post_id, get_pipeline_settings()) if post_id else None
+    if not video_cache_key:
+        return None
+    # The first call builds the cache and its S3 client, keep that off the event loop
+    result_cache = await asyncio.to_thread(get_result_cache)
+    cached_video_names = await get_cached(result_cache.get_json, "video", video_cache_key)
+    if cached_video_names:
+        print(f"Result cache hit for post {post_id}")
+        task_id = task_queue.create_media_processing_task(payload={"url": url, "post_id": post_id})
+        video_urls = get_video_urls(await asyncio.to_thread(get_cloudflare_s3), cached_video_names)
+        task_queue.update_task_status(task_id, TaskStatus.COMPLETED, video_urls[OUTPUT_PROFILES[0].name], video_urls=video_urls)
+        return {"task_id": task_id, "status": TaskStatus.COMPLETED.value}
+
+    # Join the job already rendering this post instead of rendering it again
+    inflight_task_id = inflight_tasks.get(video_cache_key)
+    if inflight_task_id:
+        inflight_status = task_queue.get_task_status(inflight_task_id)["status"]
+        if inflight_status in (TaskStatus.PENDING.value, TaskStatus.PROCESSING.value):
+            return {"task_id": inflight_task_id, "status": inflight_status}
+        inflight_tasks.pop(video_cache_key, None)
+    return None
+
+def busy_response(error_msg: str, retry_after: float = None) -> JSONResponse:
+    headers = {"Retry-After": str(max(1, round(retry_after)))} if retry_after else None
+    return JSONResponse(status_code=429, content={"status": "rejected", "errorMessage": error_msg}, headers=headers)
+
+def get_status_with_queue(task_id: str) -> dict:
+    """Task status, with queue position and estimated start while it waits for a run slot"""
+    status = task_queue.get_task_status(task_id)
+    if status["status"] == TaskStatus.PENDING.value:
+        status.update(job_executor.get_queue_position(task_id) or {})
+    return status
+
+def create_commentary_task(url: str, post_id: str, post_data: dict = None, user_id: str = None,
+                           priority: str = INTERACTIVE) -> str:
+    """Create a PENDING task, claimable by worker processes when TASK_DISPATCH is worker"""
+    payload = {"url": url, "post_id": post_id, "user_id": user_id, "priority": priority}
+    if post_data:
+        payload["post"] = post_data
+    task_id = task_queue.create_media_processing_task(payload=payload, claimable=TASK_DISPATCH == "worker")
+    if post_id:
+        inflight_tasks[make_cache_key("video", post_id, get_pipeline_settings())] = task_id
+    return task_id
 
 @router.post("/reddit-commentary")
-async def start_reddit_commentary(url: str):
-    """Create a task and start processing in background"""
+async def start_reddit_commentary(url: str, reddit_client: RedditClient = Depends(get_reddit_client),
+                                  user_id: Optional[str] = Header(None, alias="X-User-Id")):
+    """
+    Create a task and queue it for processing in background. X-User-Id, forwarded by the
+    proxy, keys fair queuing so one user's burst doesn't hold up everyone else's requests.
+    """
+    task_id = None
     try:
         print("Processing Reddit commentary for URL:", url)
-        task_id = task_queue.create_media_processing_task()
-        task_queue.update_task_status(task_id, TaskStatus.PROCESSING)
-        # Start processing in background
-        asyncio.create_task(process_reddit_commentary(task_id, url))
-        return {"task_id": task_id}
+        # Canonical post ID (share links resolved) keys the result cache
+        post_id = None
+        try:
+            post_id = await job_executor.run_in_stage("reddit", reddit_client.get_post_id, url)
+        except Exception as e:
+            print(f"Could not resolve Reddit post ID, skipping result cache: {e}")
+        existing_task = await find_existing_task(url, post_id)
+        if existing_task:
+            return existing_task
+
+        # Worker processes claim PENDING tasks from the shared task store
+        if TASK_DISPATCH == "worker":
+            if task_queue.count_pending_tasks() >= job_executor.max_queued_jobs:
+                raise QueueFullError("Worker queue is full")
+        else:
+            # Turn the request away before creating a task when there is no capacity for it
+            job_executor.check_admission(user_id, INTERACTIVE)
+        task_id = create_commentary_task(url, post_id, user_id=user_id)
+        if TASK_DISPATCH != "worker":
+            # Queue processing in background, the task stays PENDING until a worker slot frees up
+            job_executor.submit(process_reddit_commentary(task_id, url, post_id), key=task_id, user_id=user_id)
+        return dict({"task_id": task_id, "status": TaskStatus.PENDING.value}, **(job_executor.get_queue_position(task_id) or {}))
+    except QueueFullError as e:
+        error_msg = f"Server is busy, try again later: {str(e)}"
+        if task_id:
+            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
+        return busy_response(error_msg, e.retry_after)
     except Exception as e:
-        task_queue.update_task_status(task_id, TaskStatus.FAILED, error=str(e))
+        if task_id:
+            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=str(e))
         raise
 
-async def process_reddit_commentary(task_id: str, url: str):
-    """Process Reddit commentary in background"""
-    try:
-        print("Fetching Reddit post and comments for URL:", url)
-        # Get Reddit content
-        reddit_client = RedditClient()
+class BatchRequest(BaseModel):
+    """Either a list of post URLs or a subreddit listing to render"""
+    urls: List[str] = []
+    subreddit: Optional[str] = None
+    listing: str = "top"  # "top" or "hot"
+    time_filter: str = "day"  # Window of the top listing: hour, day, week, month, year or all
+    limit: int = 10
+
+async def prefetch_batch_resources():
+    """Load the background index (or download and prepare the template) and get a Reddit token once, before the batch fans out"""
+    async def prefetch_template():
         try:
-            post_data = reddit_client.get_post_and_comments(url, top_n=5)
+            index = await job_executor.run_in_stage("storage", lambda: get_background_library().get_index())
+            if index.get("assets"):
+                return
         except Exception as e:
-            error_msg = f"Error fetching and processing Reddit post: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e 
-        
-        print("Generating script for Reddit post")
-        # Generate script
+            print(f"Background library unavailable, prefetching the template: {e}")
+        template_path = await job_executor.run_in_stage(
+            "storage", lambda: get_template_cache().get_template_path(BUCKET_NAME, TEMPLATE_FILE_NAME)
+        )
+        if USE_PREPARED_TEMPLATES:
+            await job_executor.run_in_stage("render", get_prepared_template, template_path)
+
+    results = await asyncio.gather(
+        prefetch_template(),
+        job_executor.run_in_stage("reddit", lambda: get_reddit_client().get_reddit_access_token()),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"Batch prefetch failed, jobs will fetch on their own: {result}")
+
+async def run_batch(jobs: List[tuple]):
+    """
+    Feed batch jobs to the executor at batch priority, keeping at most BATCH_CONCURRENCY of them
+    queued or running so a large batch never fills the queue that single requests share
+    """
+    await prefetch_batch_resources()
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run_item(task_id: str, url: str, post_id: str, post_data: dict, user_id: str):
+        async with slots:
+            while True:
+                try:
+                    job = job_executor.submit(process_reddit_commentary(task_id, url, post_id, post_data),
+                                              key=task_id, user_id=user_id, priority=BATCH)
+                    break
+                except QueueFullError:
+                    await asyncio.sleep(BATCH_RETRY_SECONDS)
+            try:
+                await job
+            except Exception:
+                pass  # The pipeline already recorded the failure on the task
+
+    await asyncio.gather(*(run_item(*job) for job in jobs))
+
+@router.post("/reddit-commentary/batch")
+async def start_reddit_commentary_batch(request: BatchRequest, reddit_client: RedditClient = Depends(get_reddit_client),
+                                        user_id: Optional[str] = Header(None, alias="X-User-Id")):
+    """Create tasks for a list of URLs or a subreddit listing and process them as one batch"""
+    if request.subreddit:
         try:
-            script = openai_service.generate_commentary_script(post_data["title"], post_data["description"])
+            posts = await job_executor.run_in_stage(
+                "reddit", reddit_client.get_listing, request.subreddit, request.listing, request.time_filter, request.limit
+            )
+        except ValueError as e:
+            return JSONResponse(status_code=400, content={"status": "rejected", "errorMessage": str(e)})
         except Exception as e:
-            error_msg = f"Error generating script: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
-        
-        print("Generating audio for Reddit post")
-        # Generate audio
+            return JSONResponse(status_code=502, content={"status": "rejected", "errorMessage": f"Error fetching subreddit listing: {str(e)}"})
+        source = {"subreddit": request.subreddit, "listing": request.listing, "time_filter": request.time_filter, "limit": request.limit}
+    else:
+        posts = [{"url": url} for url in dict.fromkeys(request.urls)]
+        source = {"urls": len(posts)}
+
+    if not posts:
+        return JSONResponse(status_code=400, content={"status": "rejected", "errorMessage": "No posts to process"})
+    if len(posts) > BATCH_MAX_ITEMS:
+        return JSONResponse(status_code=400, content={"status": "rejected", "errorMessage": f"A batch can have at most {BATCH_MAX_ITEMS} posts"})
+    if TASK_DISPATCH == "worker" and task_queue.count_pending_tasks() >= job_executor.max_queued_jobs:
+        return busy_response("Server is busy, try again later: Worker queue is full")
+
+    async def resolve_post_id(post: dict) -> Optional[str]:
+        # Listing posts carry their ID, share links are resolved concurrently
+        if post.get("post_id"):
+            return post["post_id"]
         try:
-            audio_speech = deepgram_service.generate_audio_with_deepgram(script)
+            return await job_executor.run_in_stage("reddit", reddit_client.get_post_id, post["url"])
         except Exception as e:
-            error_msg = f"Error generating voiceover: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
-        
+            print(f"Could not resolve Reddit post ID of {post['url']}, skipping result cache: {e}")
+            return None
+
+    post_ids = await asyncio.gather(*(resolve_post_id(post) for post in posts))
+    items = []
+    jobs = []
+    task_ids_by_post = {}
+    for post, post_id in zip(posts, post_ids):
+        item = {"url": post["url"], "post_id": post_id}
+        # The same post twice in a batch (e.g. a share link and its full URL) renders once
+        existing_task = {"task_id": task_ids_by_post[post_id]} if post_id in task_ids_by_post else None
+        existing_task = existing_task or await find_existing_task(post["url"], post_id)
+        if existing_task:
+            item["task_id"] = existing_task["task_id"]
+        else:
+            post_data = None
+            if "title" in post:
+                # The listing already has what the script needs, the job skips fetching the post
+                post_data = {"title": post["title"], "description": post["description"], "top_comments": []}
+            item["task_id"] = create_commentary_task(post["url"], post_id, post_data, user_id=user_id, priority=BATCH)
+            jobs.append((item["task_id"], post["url"], post_id, post_data, user_id))
+        if post_id:
+            task_ids_by_post[post_id] = item["task_id"]
+        items.append(item)
+
+    batch_id = task_queue.create_batch(items, source)
+    if TASK_DISPATCH != "worker" and jobs:
+        batch_job = asyncio.create_task(run_batch(jobs))
+        # Keep a reference so the batch is not garbage collected
+        batch_jobs.add(batch_job)
+        batch_job.add_done_callback(batch_jobs.discard)
+    print(f"Batch {batch_id} created with {len(items)} posts, {len(jobs)} to render")
+    return {"batch_id": batch_id, "status": TaskStatus.PENDING.value, "total": len(items), "items": items}
+
+async def process_reddit_commentary(task_id: str, url: str, post_id: str = None, post_data: dict = None):
+    """Process Reddit commentary in background"""
+    task_queue.update_task_status(task_id, TaskStatus.PROCESSING)
+    # Clients are built on first use, which imports their SDKs, so resolve them off the event loop
+    try:
+        (cloudflare_s3, template_cache, result_cache, checkpoints, background_library,
+         deepgram_service, openai_service, reddit_client) = await asyncio.to_thread(
+            lambda: (get_cloudflare_s3(), get_template_cache(), get_result_cache(), get_checkpoint_store(),
+                     get_background_library(), get_deepgram_service(), get_openai_service(), get_reddit_client())
+        )
+    except Exception as e:
+        task_queue.update_task_status(task_id, TaskStatus.FAILED, error=f"Error creating service clients: {str(e)}")
+        raise e
+    # Work files (audio, captions, rendered video) live here until the job ends
+    workdir = tempfile.mkdtemp(prefix="reel_")
+    settings = get_pipeline_settings()
+    video_cache_key = make_cache_key("video", post_id, settings) if post_id else None
+    video_file_names = get_video_file_names(task_id)
+    video_file_name = video_file_names[OUTPUT_PROFILES[0].name]
+    def report_stage(stage: str):
+        if stage in PROGRESS_STAGES:
+            task_queue.report_stage(task_id, PROGRESS_STAGES[stage])
+
+    timings = StageTimings(lambda stages: task_queue.update_task_fields(task_id, timings=stages), on_start=report_stage)
+    job_start = time.time()
+    job_status = TaskStatus.FAILED
+    task = task_queue.get_task(task_id)
+    if task and task.get("created_at"):
+        queue_wait = job_start - task["created_at"]
+        queue_wait_seconds.observe(queue_wait)
+        timings.record("queue", queue_wait)
+
+    async def fetch_post(results: dict) -> dict:
+        print("Fetching Reddit post and comments for URL:", url)
+        # Get Reddit content
+        with timings.stage("reddit") as span:
+            # Posts from a subreddit listing arrive with the task
+            fetched_post = post_data or await get_cached(result_cache.get_json, "post", post_id)
+            span["cached"] = bool(fetched_post)
+            if not fetched_post:
+                fetched_post = await job_executor.run_in_stage("reddit", reddit_client.get_post_and_comments, url, top_n=5)
+                await set_cached(result_cache.set_json, "post", post_id, fetched_post)
+            span["bytes"] = len(json.dumps(fetched_post)) if fetched_post else 0
+        return fetched_post
+
+    async def generate_script(results: dict) -> str:
+        print("Generating script for Reddit post")
+        post_data = results["reddit"]
+        script_cache_key = make_cache_key("script", post_id, settings["version"]) if post_id else None
+        with timings.stage("script") as span:
+            script = await get_cached(result_cache.get_text, "script", script_cache_key)
+            span["cached"] = bool(script)
+            if not script:
+                script = await job_executor.run_in_stage(
+                    "script", openai_service.generate_commentary_script, post_data["title"], post_data["description"]
+                )
+                # Regenerate once with a word budget rather than voicing a script that cannot fit the reel
+                if not is_script_length_ok(script):
+                    print(f"Script reads in about {estimate_speech_seconds(script):.1f}s, regenerating it")
+                    span["regenerated"] = True
+                    script = await job_executor.run_in_stage(
+                        "script", openai_service.generate_commentary_script, post_data["title"],
+                        post_data["description"], target_word_count()
+                    )
+                await set_cached(result_cache.set_text, "script", script_cache_key, script)
+            span["bytes"] = len(script.encode())
+            span["estimated_seconds"] = round(estimate_speech_seconds(script), 1)
+        return script
+
+    async def generate_audio(results: dict) -> bytes:
+        print("Generating audio for Reddit post")
+        audio_cache_key = make_cache_key("audio", results["script"], [settings["version"], TTS_AUDIO_CODEC])
+        with timings.stage("tts") as span:
+            audio_speech = await get_cached(result_cache.get, "audio", audio_cache_key)
+            span["cached"] = bool(audio_speech)
+            if not audio_speech:
+                audio_speech = await job_executor.run_in_stage("tts", deepgram_service.generate_audio_with_deepgram, results["script"])
+                await set_cached(result_cache.set, "audio", audio_cache_key, audio_speech)
+            # Checked from the audio headers, so a voiceover off target is fixed before the render starts
+            audio_speech, audio_seconds, tempo = await job_executor.run_in_stage("tts", fit_voiceover, audio_speech)
+            span["audio_seconds"] = round(audio_seconds, 2)
+            span["tempo"] = round(tempo, 3)
+            span["bytes"] = len(audio_speech)
+        return audio_speech
+
+    async def generate_captions(results: dict) -> str:
+        print("Generating captions for Reddit post")
+        with timings.stage("captions"):
+            return await job_executor.run_in_stage("captions", prepare_captions, results["tts"], results["script"], workdir)
+
+    async def fetch_template(results: dict):
         print("Fetching video template for Reddit post")
-        # Get video template
-        try:
-            subway_surfers_video = cloudflare_s3.read_file_from_s3(BUCKET_NAME, "ss_background.mp4")
-        except Exception as e:
-            error_msg = f"Error fetching background video: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
-        
+        with timings.stage("template") as span:
+            # Pick a background from the library, only the window the reel needs is read later
+            try:
+                background = await job_executor.run_in_stage(
+                    "storage", background_library.get_background, REEL_MAX_SECONDS
+                )
+            except Exception as e:
+                print(f"Background library unavailable, using the template: {e}")
+                background = None
+            if background:
+                span["background"] = background.name
+                span["background_source"] = "cache" if background.is_local else "range"
+                return background
+            # Get video template
+            misses_before = template_cache.misses
+            template_path = await job_executor.run_in_stage(
+                "storage", template_cache.get_template_path, BUCKET_NAME, TEMPLATE_FILE_NAME
+            )
+            # Only a cache miss actually moved the template over the network
+            if template_cache.misses > misses_before:
+                span["bytes"] = os.path.getsize(template_path)
+        return template_path
+
+    async def prepare_background(results: dict):
+        # Slice the template into segments while the voiceover is still being generated,
+        # library backgrounds are read as a keyframe-aligned window instead
+        if USE_PREPARED_TEMPLATES and isinstance(results["template"], str):
+            with timings.stage("prepare_template"):
+                try:
+                    await job_executor.run_in_stage("render", get_prepared_template, results["template"])
+                except Exception as e:
+                    print(f"Prepared template unavailable, the render will loop the full template: {e}")
+        return True
+
+    def get_upload_stream(render_stats: dict):
+        if not STREAM_UPLOAD:
+            return None
+
+        def upload_stream(stream, check_ffmpeg):
+            counted_stream = CountingReader(stream)
+            cloudflare_s3.upload_stream_to_s3(counted_stream, BUCKET_NAME, video_file_name, before_complete=check_ffmpeg)
+            render_stats["bytes"] = counted_stream.bytes_read
+        return upload_stream
+
+    async def render_video(results: dict) -> dict:
         print("Processing video for Reddit post")
-        # Process video
-        try:
-            video_bytes = process_video_streaming(audio_speech, subway_surfers_video)
-        except Exception as e:
-            error_msg = f"Error processing video: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
+        render_stats = {}
+        upload_stream = get_upload_stream(render_stats)
+        with timings.stage("render") as span:
+            # Every output profile comes out of one ffmpeg run
+            video_paths = await job_executor.run_in_stage(
+                "render", render_scheduler.run, process_video_streaming, results["tts"], results["template"], workdir,
+                script=results["script"], upload_stream=upload_stream, render_stats=render_stats,
+                caption_path=results["captions"], outputs=OUTPUT_PROFILES, get_queue_depth=get_queue_depth,
+                on_progress=lambda percent: task_queue.report_progress(task_id, "rendering", percent)
+            )
+            task_queue.update_task_fields(task_id, encode_profile=render_stats["encode_profile"])
+            span.update(render_stats)
+            span["outputs"] = len(video_paths)
+            span["bytes"] = span.get("bytes", 0) + sum(os.path.getsize(path) for path in video_paths.values() if path)
+        return video_paths
+
+    async def render_streaming(results: dict) -> dict:
+        print("Streaming script, voiceover and video for Reddit post")
+        post_data = results["reddit"]
+        script_cache_key = make_cache_key("script", post_id, settings["version"]) if post_id else None
+        script = await get_cached(result_cache.get_text, "script", script_cache_key)
+        render_stats = {"cached_script": bool(script)}
+        upload_stream = get_upload_stream(render_stats)
+        if script:
+            deltas = [script]
+        else:
+            deltas = openai_service.stream_commentary_script(post_data["title"], post_data["description"])
+
+        with timings.stage("render") as span:
+            # Script, TTS and segment renders overlap, so they run as one stage on a render slot
+            video_paths, streamed_script = await job_executor.run_in_stage(
+                "render", render_scheduler.run, render_sentence_stream, deltas, deepgram_service.stream_pcm_with_deepgram,
+                results["template"], workdir, upload_stream=upload_stream, render_stats=render_stats,
+                get_queue_depth=get_queue_depth, outputs=OUTPUT_PROFILES
+            )
+            task_queue.update_task_fields(task_id, encode_profile=render_stats["encode_profile"])
+            span.update(render_stats)
+            span["bytes"] = sum(os.path.getsize(path) for path in video_paths.values() if path)
+        if not script:
+            await set_cached(result_cache.set_text, "script", script_cache_key, streamed_script)
+        return video_paths
 
-        print("Uploading video to S3 for Reddit post")
-        # Upload video to S3
+    async def upload_video(results: dict) -> dict:
+        """Upload the rendered outputs, returns the object name of every output by profile name"""
+        # With STREAM_UPLOAD the main video was uploaded while it was rendered
+        video_paths = {name: path for name, path in results["render"].items() if path}
+        if video_paths:
+            print(f"Uploading {len(video_paths)} videos to S3 for Reddit post")
+            with timings.stage("upload") as span:
+                await asyncio.gather(*(
+                    job_executor.run_in_stage(
+                        "storage", cloudflare_s3.upload_path_to_s3, path, BUCKET_NAME, video_file_names[name]
+                    )
+                    for name, path in video_paths.items()
+                ))
+                span["bytes"] = sum(os.path.getsize(path) for path in video_paths.values())
+        # Checkpointed, so a resumed task builds its URLs without the render outputs
+        return {name: video_file_names[name] for name in results["render"]}
+
+    async def get_video_url(results: dict) -> dict:
+        print("Getting video URLs for Reddit post")
+        return get_video_urls(cloudflare_s3, results["upload"])
+
+    def checkpointed(stage: Stage) -> Stage:
+        kind = STAGE_CHECKPOINTS.get(stage.name)
+        if not kind:
+            return stage
+        func = stage.func
+
+        async def run_and_save(results: dict):
+            value = await func(results)
+            # A streamed render has no file, its upload checkpoint covers it
+            if value is not None:
+                try:
+                    await job_executor.run_in_stage("storage", checkpoints.save, task_id, stage.name, kind, value)
+                except Exception as e:
+                    print(f"Error saving checkpoint {stage.name} of task {task_id}: {e}")
+            return value
+        stage.func = run_and_save
+        return stage
+
+    # The template chain has no dependency on Reddit/OpenAI/TTS and runs alongside it.
+    # Stages calling external services are retried on transient errors.
+    stages = [
+        Stage("reddit", fetch_post, error_message="Error fetching and processing Reddit post", retries=STAGE_RETRIES),
+        Stage("template", fetch_template, error_message="Error fetching background video", retries=STAGE_RETRIES),
+        Stage("prepare_template", prepare_background, deps=["template"], error_message="Error preparing background video"),
+        Stage("upload", upload_video, deps=["render"], error_message="Error uploading video to S3", retries=STAGE_RETRIES),
+        Stage("url", get_video_url, deps=["upload"], error_message="Error getting video URL", retries=STAGE_RETRIES),
+    ]
+    if STREAM_TTS:
+        stages.append(Stage("render", render_streaming, deps=["reddit", "template", "prepare_template"],
+                            error_message="Error processing video"))
+    else:
+        stages += [
+            Stage("script", generate_script, deps=["reddit"], error_message="Error generating script", retries=STAGE_RETRIES),
+            Stage("tts", generate_audio, deps=["script"], error_message="Error generating voiceover", retries=STAGE_RETRIES),
+            Stage("captions", generate_captions, deps=["tts", "script"], error_message="Error generating captions"),
+            Stage("render", render_video, deps=["tts", "script", "captions", "template", "prepare_template"],
+                  error_message="Error processing video"),
+        ]
+    pipeline = PipelineGraph([checkpointed(stage) for stage in stages])
+
+    try:
+        # A retried task resumes after the stages its earlier attempts finished
         try:
-            cloudflare_s3.upload_file_to_s3(video_bytes, BUCKET_NAME, f"output_video_{task_id}.mp4")
+            restored = await job_executor.run_in_stage("storage", checkpoints.load_all, task_id, STAGE_CHECKPOINTS, workdir)
         except Exception as e:
-            error_msg = f"Error uploading video to S3: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
-
-        print("Getting video URL for Reddit post")
-        # Get S3 URL for the video
+            print(f"Error loading checkpoints of task {task_id}, running every stage: {e}")
+            restored = {}
+        if restored:
+            print(f"Resuming task {task_id} after stages: {', '.join(sorted(restored))}")
+            task_queue.update_task_fields(task_id, resumed_stages=sorted(restored))
+        results = await pipeline.run(restored)
+        video_urls = results["url"]
+        await set_cached(result_cache.set_json, "video", video_cache_key,
+                         {name: video_file_names[name] for name in video_urls})
         try:
-            video_url = cloudflare_s3.get_s3_url(BUCKET_NAME, f"output_video_{task_id}.mp4")
+            await job_executor.run_in_stage("storage", checkpoints.delete, task_id)
         except Exception as e:
-            error_msg = f"Error getting video URL: {str(e)}"
-            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
-            raise e
-        
+            print(f"Error deleting checkpoints of task {task_id}: {e}")
+
         print("Updating task status to COMPLETED with video URL")
         # Update task status to COMPLETED with video URL
-        task_queue.update_task_status(task_id, TaskStatus.COMPLETED, video_url)
+        task_queue.update_task_status(task_id, TaskStatus.COMPLETED, video_urls[OUTPUT_PROFILES[0].name], video_urls=video_urls)
+        job_status = TaskStatus.COMPLETED
+    except StageError as e:
+        print(f"Stage {e.stage} failed for task {task_id}: {e.message}")
+        task_queue.update_task_status(task_id, TaskStatus.FAILED, error=e.message)
+        raise e
     except Exception as e:
-        print("General error in process_reddit_commentary for task {task_id}: {str(e)}")
+        print(f"General error in process_reddit_commentary for task {task_id}: {str(e)}")
         # If an error occurs, mark the task as failed
         error_msg = f"General error in process_reddit_commentary for task {task_id}: {str(e)}"
         task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
         raise e
+    finally:
+        job_seconds.observe(time.time() - job_start, status=job_status.value)
+        shutil.rmtree(workdir, ignore_errors=True)
+        if inflight_tasks.get(video_cache_key) == task_id:
+            inflight_tasks.pop(video_cache_key, None)
+
+@router.post("/reddit-commentary/{task_id}/retry")
+async def retry_reddit_commentary(task_id: str):
+    """Queue a failed task again, it resumes from its first stage without a checkpoint"""
+    task = task_queue.get_task(task_id)
+    if not task or task.get("kind") == "batch":
+        return JSONResponse(status_code=404, content={"status": "not_found"})
+    if task["status"] != TaskStatus.FAILED.value:
+        return JSONResponse(status_code=409, content={
+            "status": task["status"], "errorMessage": "Only failed tasks can be retried"
+        })
+    if TASK_DISPATCH == "worker" and task_queue.count_pending_tasks() >= job_executor.max_queued_jobs:
+        return busy_response("Server is busy, try again later")
+
+    payload = task.get("payload") or {}
+    task_queue.requeue_task(task_id, claimable=TASK_DISPATCH == "worker")
+    post_id = payload.get("post_id")
+    if post_id:
+        inflight_tasks[make_cache_key("video", post_id, get_pipeline_settings())] = task_id
+    if TASK_DISPATCH != "worker":
+        try:
+            job_executor.submit(process_reddit_commentary(task_id, payload["url"], post_id, payload.get("post")),
+                                key=task_id, user_id=payload.get("user_id"), priority=payload.get("priority", INTERACTIVE))
+        except QueueFullError as e:
+            error_msg = f"Server is busy, try again later: {str(e)}"
+            task_queue.update_task_status(task_id, TaskStatus.FAILED, error=error_msg)
+            return busy_response(error_msg, e.retry_after)
+    return {"task_id": task_id, "status": TaskStatus.PENDING.value}
 
 @router.get("/reddit-commentary/status/{task_id}")
 async def get_task_status(task_id: str):
-    """Get the status of a running task"""
-    return task_queue.get_task_status(task_id)
+    """Get the status of a running task, with its queue position and estimated start while pending"""
+    return get_status_with_queue(task_id)
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.get("/reddit-commentary/events/{task_id}")
+async def stream_task_events(task_id: str, request: Request):
+    """
+    Stream a task's progress as Server-Sent Events: the current status first, then
+    stage, progress and status events until the task completes or fails
+    """
+    finished = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, "not_found")
+
+    async def events():
+        # Subscribe before reading the snapshot so no event falls in between
+        async with progress_broker.subscribe(task_id) as subscription:
+            status = get_status_with_queue(task_id)
+            yield format_sse("status", dict(status, type="status"))
+            if status["status"] in finished:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Without cross-replica pub/sub the final status may never be pushed here
+                    status = task_queue.get_task_status(task_id)
+                    if status["status"] in finished:
+                        yield format_sse("status", dict(status, type="status"))
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event["type"], event)
+                if event["type"] == "status" and event["status"] in finished:
+                    return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Stop reverse proxies from buffering the stream
+    })
+
+@router.get("/reddit-commentary/batch/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Get the aggregate progress of a batch and the status of each of its tasks"""
+    return task_queue.get_batch_status(batch_id)
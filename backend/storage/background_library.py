@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+from dataclasses import dataclass, field
+from typing import List, Optional
+from storage.cloudflare_s3 import CloudflareS3
+from utils.metrics import background_cache_downloads
+
+# Background videos live under this prefix of the bucket, with the index next to them
+BACKGROUND_PREFIX = os.environ.get("BACKGROUND_PREFIX", "backgrounds/")
+BACKGROUND_INDEX_NAME = "index.json"
+# Only pick backgrounds with one of these tags (comma separated), any background when empty
+BACKGROUND_TAGS = [tag.strip() for tag in os.environ.get("BACKGROUND_TAGS", "").split(",") if tag.strip()]
+BACKGROUND_INDEX_REFRESH_SECONDS = int(os.environ.get("BACKGROUND_INDEX_REFRESH_SECONDS", 300))
+# Lifetime of the presigned URLs ffmpeg reads uncached backgrounds through
+BACKGROUND_URL_EXPIRES_SECONDS = int(os.environ.get("BACKGROUND_URL_EXPIRES_SECONDS", 3600))
+# Download a background into the template cache once this many jobs read it from the bucket, later
+# jobs then read it from disk. 0 (the default) never downloads whole assets, jobs only read their window
+BACKGROUND_CACHE_AFTER_USES = int(os.environ.get("BACKGROUND_CACHE_AFTER_USES", 0))
+# The single template used while the library has no index
+TEMPLATE_FILE_NAME = os.environ.get("TEMPLATE_FILE_NAME", "ss_background.mp4")
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".m4v", ".webm", ".mkv")
+
+@dataclass
+class BackgroundSource:
+    """
+    A background picked for one job and where ffmpeg reads it from: a path in the template
+    cache, or a presigned URL that ffmpeg seeks in with range requests
+    """
+    name: str
+    source: str
+    duration: float
+    keyframes: List[float] = field(default_factory=list)
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+
+    @property
+    def is_local(self) -> bool:
+        return not self.source.startswith(("http://", "https://"))
+
+    def pick_start(self, duration: float, rng: random.Random = None) -> float:
+        """A random keyframe with duration seconds of video after it, 0 when the asset is shorter"""
+        rng = rng or random.Random()
+        fitting = [time for time in self.keyframes if time + duration <= self.duration]
+        return rng.choice(fitting) if fitting else 0.0
+
+    def input_args(self, duration: float, rng: random.Random = None) -> list:
+        """
+        ffmpeg input arguments for a keyframe-aligned window of exactly duration seconds, so only
+        that part of the file is read and decoded. Assets shorter than duration are looped.
+        """
+        if self.duration < duration:
+            return ['-stream_loop', '-1', '-i', self.source]
+        start = self.pick_start(duration, rng)
+        return ['-ss', f"{start:.3f}", '-t', f"{duration:.3f}", '-i', self.source]
+
+    def normalize_filter(self, width: int, height: int, fps: int) -> Optional[str]:
+        """Filter that scales, crops and retimes the asset to the output format, None when it already matches"""
+        if (self.width, self.height) == (width, height) and self.fps and abs(self.fps - fps) < 0.01:
+            return None
+        return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height},fps={fps}"
+
+def parse_frame_rate(rate: str) -> Optional[float]:
+    try:
+        numerator, _, denominator = rate.partition("/")
+        return round(float(numerator) / float(denominator or 1), 3)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+def probe_asset(source: str) -> dict:
+    """
+    Duration, size, frame rate and keyframe times of a video, from its packet headers (no decoding).
+    source can be a path or a URL.
+    """
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-select_streams', 'v:0',
+         '-show_entries', 'format=duration:stream=width,height,avg_frame_rate:packet=pts_time,flags',
+         '-of', 'json', source],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, timeout=600
+    )
+    output = json.loads(result.stdout)
+    stream = (output.get("streams") or [{}])[0]
+    keyframes = sorted(
+        round(float(packet["pts_time"]), 3) for packet in output.get("packets", [])
+        if "K" in packet.get("flags", "") and packet.get("pts_time") not in (None, "N/A")
+    )
+    return {
+        "duration": float(output["format"]["duration"]),
+        "width": stream.get("width"),
+        "height": stream.get("height"),
+        "fps": parse_frame_rate(stream.get("avg_frame_rate", "")),
+        "keyframes": keyframes,
+    }
+
+class BackgroundLibrary:
+    """
+    This class is used to pick background videos from the library index in S3.
+
+    The index, written by the scan command below, lists every background with its duration,
+    resolution, keyframe times and tags. It is reloaded every BACKGROUND_INDEX_REFRESH_SECONDS.
+    """
+    def __init__(self, cloudflare_s3: CloudflareS3, bucket_name: str, template_cache=None,
+                 prefix: str = BACKGROUND_PREFIX, refresh_seconds: int = BACKGROUND_INDEX_REFRESH_SECONDS):
+        self.cloudflare_s3 = cloudflare_s3
+        self.bucket_name = bucket_name
+        self.template_cache = template_cache
+        self.prefix = prefix
+        self.refresh_seconds = refresh_seconds
+        self.lock = threading.Lock()
+        self.index = None
+        self.loaded_at = 0.0
+        self.uses = {}
+        self.caching = set()
+        self.cache_threads = set()
+        self.stopping = threading.Event()
+
+    def _key(self, name: str) -> str:
+        return f"{self.bucket_name}/{name}"
+
+    def get_index(self) -> dict:
+        """The library index, an empty one when none has been written yet"""
+        from botocore.exceptions import ClientError  # Loaded with boto3 by the S3 client
+
+        with self.lock:
+            if self.index is not None and time.time() - self.loaded_at < self.refresh_seconds:
+                return self.index
+            try:
+                response = self.cloudflare_s3.s3_client.get_object(
+                    Bucket=self.bucket_name, Key=self._key(self.prefix + BACKGROUND_INDEX_NAME)
+                )
+                self.index = json.loads(response['Body'].read())
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                    if self.index is None:
+                        raise e
+                    # Keep picking from the index already loaded
+                    print(f"Error reloading background index: {e}")
+                else:
+                    self.index = {"assets": []}
+            self.loaded_at = time.time()
+            return self.index
+
+    def pick(self, min_duration: float = 0.0, tags: List[str] = None, rng: random.Random = None) -> Optional[dict]:
+        """
+        A random asset with one of tags (BACKGROUND_TAGS by default), preferring ones at least
+        min_duration long so no loop is needed. None when the library is empty.
+        """
+        rng = rng or random.Random()
+        tags = BACKGROUND_TAGS if tags is None else tags
+        assets = self.get_index().get("assets", [])
+        if tags:
+            assets = [asset for asset in assets if set(asset.get("tags", [])) & set(tags)]
+        long_enough = [asset for asset in assets if asset["duration"] >= min_duration]
+        candidates = long_enough or assets
+        return rng.choice(candidates) if candidates else None
+
+    def resolve(self, asset: dict) -> BackgroundSource:
+        """Read a cached copy when the template cache has this version of the asset, the bucket otherwise"""
+        source = None
+        if self.template_cache:
+            source = self.template_cache.get_cached_path(self.bucket_name, asset["name"], asset.get("etag"))
+        if not source:
+            source = self.cloudflare_s3.s3_client.generate_presigned_url(
+                'get_object', Params={'Bucket': self.bucket_name, 'Key': self._key(asset["name"])},
+                ExpiresIn=BACKGROUND_URL_EXPIRES_SECONDS
+            )
+            if self.template_cache and BACKGROUND_CACHE_AFTER_USES:
+                with self.lock:
+                    self.uses[asset["name"]] = uses = self.uses.get(asset["name"], 0) + 1
+                if uses >= BACKGROUND_CACHE_AFTER_USES:
+                    self.cache_in_background(asset["name"])
+        return BackgroundSource(
+            name=asset["name"], source=source, duration=asset["duration"], keyframes=asset.get("keyframes", []),
+            width=asset.get("width"), height=asset.get("height"), fps=asset.get("fps")
+        )
+
+    def cache_in_background(self, name: str):
+        """Download an asset into the template cache off the job's path, once at a time per asset"""
+        with self.lock:
+            if name in self.caching or self.stopping.is_set():
+                return
+            self.caching.add(name)
+
+        def download():
+            try:
+                self.template_cache.get_template_path(self.bucket_name, name, cancel=self.stopping)
+                background_cache_downloads.inc(result="completed")
+            except InterruptedError:
+                # Stopped at shutdown, not a failure
+                background_cache_downloads.inc(result="cancelled")
+            except Exception as e:
+                # Counted, so a cache that never warms shows up in the metrics
+                background_cache_downloads.inc(result="failed")
+                print(f"Error caching background {name}: {e}")
+            finally:
+                with self.lock:
+                    self.caching.discard(name)
+                    self.cache_threads.discard(thread)
+
+        thread = threading.Thread(target=download, name="background-cache", daemon=True)
+        with self.lock:
+            self.cache_threads.add(thread)
+        thread.start()
+
+    def close(self, timeout: float = 5.0):
+        """Stop downloads in progress, called with the other services at shutdown"""
+        self.stopping.set()
+        with self.lock:
+            threads = list(self.cache_threads)
+        for thread in threads:
+            thread.join(timeout)
+
+    def get_background(self, min_duration: float = 0.0, rng: random.Random = None) -> Optional[BackgroundSource]:
+        """Pick and resolve a background, None when the library is empty"""
+        asset = self.pick(min_duration, rng=rng)
+        return self.resolve(asset) if asset else None
+
+    def scan(self, tags: List[str] = None, rescan: bool = False) -> dict:
+        """
+        Probe every video under the prefix and write the index. Assets whose ETag is unchanged keep
+        their previous entry unless rescan is set. Folder names below the prefix become tags.
+        """
+        previous = {} if rescan else {asset["name"]: asset for asset in self.get_index().get("assets", [])}
+        paginator = self.cloudflare_s3.s3_client.get_paginator('list_objects_v2')
+        assets = []
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=self._key(self.prefix)):
+            for item in page.get('Contents', []):
+                name = item['Key'][len(self.bucket_name) + 1:]
+                if not name.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+                etag = item['ETag'].strip('"')
+                if name in previous and previous[name].get("etag") == etag:
+                    assets.append(previous[name])
+                    continue
+                print(f"Scanning background {name}")
+                url = self.cloudflare_s3.s3_client.generate_presigned_url(
+                    'get_object', Params={'Bucket': self.bucket_name, 'Key': item['Key']},
+                    ExpiresIn=BACKGROUND_URL_EXPIRES_SECONDS
+                )
+                try:
+                    info = probe_asset(url)
+                except (subprocess.SubprocessError, ValueError, KeyError) as e:
+                    print(f"Skipping background {name}, it could not be probed: {e}")
+                    continue
+                folder_tags = name[len(self.prefix):].split("/")[:-1]
+                assets.append(dict(info, name=name, etag=etag, size=item['Size'],
+                                   tags=sorted(set(folder_tags + (tags or [])))))
+
+        index = {"version": 1, "scanned_at": time.time(), "assets": assets}
+        self.cloudflare_s3.s3_client.put_object(
+            Bucket=self.bucket_name, Key=self._key(self.prefix + BACKGROUND_INDEX_NAME),
+            Body=json.dumps(index).encode(), ContentType='application/json'
+        )
+        with self.lock:
+            self.index = index
+            self.loaded_at = time.time()
+        return index
+
+if __name__ == "__main__":
+    # Build the index: python -m storage.background_library [--tag minecraft] [--rescan]
+    from utils.services import get_background_library
+
+    parser = argparse.ArgumentParser(description="Scan the background videos under BACKGROUND_PREFIX and write the library index")
+    parser.add_argument("--tag", action="append", default=[], help="Tag added to every newly scanned background")
+    parser.add_argument("--rescan", action="store_true", help="Probe every background again, even if unchanged")
+    args = parser.parse_args()
+    result = get_background_library().scan(tags=args.tag, rescan=args.rescan)
+    total = sum(asset["duration"] for asset in result["assets"])
+    print(f"Indexed {len(result['assets'])} backgrounds, {total / 60:.1f} minutes of video")
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional
+from storage.cloudflare_s3 import CloudflareS3
+
+# "local" keeps checkpoints on this host's disk, "s3" shares them between replicas and workers
+CHECKPOINT_BACKEND = os.environ.get('CHECKPOINT_BACKEND', 'local')
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', os.path.join(tempfile.gettempdir(), 'reels-checkpoints'))
+CHECKPOINT_S3_PREFIX = os.environ.get('CHECKPOINT_S3_PREFIX', 'checkpoints')
+# Checkpoints of tasks that were not resumed within this time are garbage collected
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL_SECONDS', 2 * 24 * 60 * 60))
+CHECKPOINT_GC_INTERVAL_SECONDS = int(os.environ.get('CHECKPOINT_GC_INTERVAL_SECONDS', 60 * 60))
+
+# How a stage's result is stored: "json" and "text" values, "bytes", "file" for a path to a work file,
+# or "files" for a dict of name to work file path
+CHECKPOINT_KINDS = ("json", "text", "bytes", "file", "files")
+
+def encode_value(kind: str, value: Any) -> bytes:
+    if kind == "json":
+        return json.dumps(value).encode()
+    if kind == "text":
+        return value.encode()
+    return value
+
+def decode_value(kind: str, data: bytes) -> Any:
+    if kind == "json":
+        return json.loads(data)
+    if kind == "text":
+        return data.decode()
+    return data
+
+def link_or_copy(source: str, target: str) -> bool:
+    """
+    Hard link a work file, so checkpointing a rendered video costs no copy when the work
+    and checkpoint directories share a filesystem. Returns False when a copy is needed.
+    """
+    try:
+        if os.path.exists(target):
+            os.remove(target)
+        os.link(source, target)
+        return True
+    except OSError:
+        return False
+
+class CheckpointStore:
+    """
+    Base class for checkpoint backends.
+
+    A checkpoint is one stage's result, stored under the task ID, so a failed or retried
+    job can resume from its first incomplete stage instead of redoing the whole pipeline.
+    File results (captions, the rendered video) are copied and restored into the job's workdir.
+    """
+    # Whether "files" results (the rendered outputs) are kept, see S3CheckpointStore
+    store_outputs = True
+
+    def save(self, task_id: str, stage: str, kind: str, value: Any):
+        # Files keep their extension after the kind, e.g. render.files.hd.mp4
+        if kind == "files" and not self.store_outputs:
+            return
+        if kind == "file":
+            self.put_file(task_id, f"{stage}.{kind}{os.path.splitext(value)[1]}", value)
+        elif kind == "files":
+            for name, path in value.items():
+                if path:
+                    self.put_file(task_id, f"{stage}.{kind}.{name}{os.path.splitext(path)[1]}", path)
+            # Written last, a dict is only restored once all of its files are saved
+            self.put_bytes(task_id, f"{stage}.{kind}", json.dumps(sorted(value)).encode())
+        else:
+            self.put_bytes(task_id, f"{stage}.{kind}", encode_value(kind, value))
+
+    def load_all(self, task_id: str, kinds: Dict[str, str], workdir: str) -> Dict[str, Any]:
+        """Return the checkpointed results of a task, for the stages in kinds (stage name -> kind)"""
+        results = {}
+        entries = self.list_entries(task_id)
+        for stage, kind in kinds.items():
+            prefix = f"{stage}.{kind}"
+            files = sorted(entry for entry in entries if entry.startswith(prefix + "."))
+            try:
+                if kind == "file" and files:
+                    results[stage] = self.get_file(task_id, files[0], workdir)
+                elif kind == "files" and prefix in entries:
+                    # Names without a file (a streamed output) map to None
+                    paths = dict.fromkeys(json.loads(self.get_bytes(task_id, prefix)))
+                    for entry in files:
+                        paths[entry.split(".")[2]] = self.get_file(task_id, entry, workdir)
+                    results[stage] = paths
+                elif kind not in ("file", "files") and prefix in entries:
+                    results[stage] = decode_value(kind, self.get_bytes(task_id, prefix))
+            except Exception as e:
+                # An unreadable checkpoint only means the stage runs again
+                print(f"Error loading checkpoint {prefix} of task {task_id}: {e}")
+        return results
+
+    def put_bytes(self, task_id: str, name: str, data: bytes):
+        raise NotImplementedError
+
+    def get_bytes(self, task_id: str, name: str) -> bytes:
+        raise NotImplementedError
+
+    def put_file(self, task_id: str, name: str, path: str):
+        raise NotImplementedError
+
+    def get_file(self, task_id: str, name: str, workdir: str) -> str:
+        """Restore a stored file into workdir and return its path"""
+        raise NotImplementedError
+
+    def list_entries(self, task_id: str) -> set:
+        """Names of the checkpoints stored for a task"""
+        raise NotImplementedError
+
+    def delete(self, task_id: str):
+        raise NotImplementedError
+
+    def collect_garbage(self, max_age_seconds: int = CHECKPOINT_TTL_SECONDS) -> int:
+        """Delete checkpoints of tasks untouched for max_age_seconds, returns how many tasks were removed"""
+        raise NotImplementedError
+
+class LocalCheckpointStore(CheckpointStore):
+    """
+    This class is used to keep checkpoints as files on local disk, one directory per task
+    """
+    def __init__(self, checkpoint_dir: str = CHECKPOINT_DIR):
+        self.checkpoint_dir = checkpoint_dir
+
+    def _task_dir(self, task_id: str) -> str:
+        return os.path.join(self.checkpoint_dir, task_id)
+
+    def _write(self, task_id: str, name: str, write):
+        task_dir = self._task_dir(task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        # Written under a hidden temporary name, a half-written checkpoint is never picked up
+        with tempfile.NamedTemporaryFile(dir=task_dir, prefix=".tmp-", delete=False) as f:
+            write(f)
+            tmp_path = f.name
+        os.replace(tmp_path, os.path.join(task_dir, name))
+
+    def put_bytes(self, task_id: str, name: str, data: bytes):
+        self._write(task_id, name, lambda f: f.write(data))
+
+    def get_bytes(self, task_id: str, name: str) -> bytes:
+        with open(os.path.join(self._task_dir(task_id), name), "rb") as f:
+            return f.read()
+
+    def put_file(self, task_id: str, name: str, path: str):
+        task_dir = self._task_dir(task_id)
+        os.makedirs(task_dir, exist_ok=True)
+        if not link_or_copy(path, os.path.join(task_dir, name)):
+            def copy(f):
+                with open(path, "rb") as source:
+                    shutil.copyfileobj(source, f, 1024 * 1024)
+            self._write(task_id, name, copy)
+
+    def get_file(self, task_id: str, name: str, workdir: str) -> str:
+        stored_path = os.path.join(self._task_dir(task_id), name)
+        path = os.path.join(workdir, name)
+        if not link_or_copy(stored_path, path):
+            shutil.copyfile(stored_path, path)
+        return path
+
+    def list_entries(self, task_id: str) -> set:
+        try:
+            entries = os.listdir(self._task_dir(task_id))
+        except OSError:
+            return set()
+        return {entry for entry in entries if not entry.startswith(".")}
+
+    def delete(self, task_id: str):
+        shutil.rmtree(self._task_dir(task_id), ignore_errors=True)
+
+    def collect_garbage(self, max_age_seconds: int = CHECKPOINT_TTL_SECONDS) -> int:
+        removed = 0
+        try:
+            task_ids = os.listdir(self.checkpoint_dir)
+        except OSError:
+            return 0
+        now = time.time()
+        for task_id in task_ids:
+            try:
+                if now - os.path.getmtime(self._task_dir(task_id)) > max_age_seconds:
+                    self.delete(task_id)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+class S3CheckpointStore(CheckpointStore):
+    """
+    This class is used to keep checkpoints in the S3 bucket so any replica or worker can resume a task
+
+    Rendered outputs are not checkpointed here: storing them costs the same upload as the upload
+    stage itself, so a task whose upload failed renders again instead.
+    """
+    store_outputs = False
+
+    def __init__(self, cloudflare_s3: CloudflareS3, bucket_name: str, prefix: str = CHECKPOINT_S3_PREFIX):
+        self.cloudflare_s3 = cloudflare_s3
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _key(self, task_id: str, name: str = "") -> str:
+        return f"{self.bucket_name}/{self.prefix}/{task_id}/{name}"
+
+    def put_bytes(self, task_id: str, name: str, data: bytes):
+        self.cloudflare_s3.s3_client.put_object(Bucket=self.bucket_name, Key=self._key(task_id, name), Body=data)
+
+    def get_bytes(self, task_id: str, name: str) -> bytes:
+        response = self.cloudflare_s3.s3_client.get_object(Bucket=self.bucket_name, Key=self._key(task_id, name))
+        return response['Body'].read()
+
+    def put_file(self, task_id: str, name: str, path: str):
+        self.cloudflare_s3.s3_client.upload_file(
+            path, self.bucket_name, self._key(task_id, name), Config=self.cloudflare_s3.transfer_config
+        )
+
+    def get_file(self, task_id: str, name: str, workdir: str) -> str:
+        path = os.path.join(workdir, name)
+        self.cloudflare_s3.s3_client.download_file(
+            self.bucket_name, self._key(task_id, name), path, Config=self.cloudflare_s3.transfer_config
+        )
+        return path
+
+    def _list_keys(self, task_id: str) -> list:
+        response = self.cloudflare_s3.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix=self._key(task_id))
+        return [item['Key'] for item in response.get('Contents', [])]
+
+    def list_entries(self, task_id: str) -> set:
+        return {key.rsplit("/", 1)[1] for key in self._list_keys(task_id)}
+
+    def _delete_keys(self, keys: list):
+        # delete_objects takes at most 1000 keys per request
+        for start in range(0, len(keys), 1000):
+            self.cloudflare_s3.s3_client.delete_objects(
+                Bucket=self.bucket_name,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+    def delete(self, task_id: str):
+        keys = self._list_keys(task_id)
+        if keys:
+            self._delete_keys(keys)
+
+    def collect_garbage(self, max_age_seconds: int = CHECKPOINT_TTL_SECONDS) -> int:
+        # A bucket lifecycle rule on the prefix does the same without listing, this covers buckets without one
+        paginator = self.cloudflare_s3.s3_client.get_paginator('list_objects_v2')
+        latest = {}
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=f"{self.bucket_name}/{self.prefix}/"):
+            for item in page.get('Contents', []):
+                task_id = item['Key'].split("/")[-2]
+                keys, modified = latest.get(task_id, ([], item['LastModified']))
+                keys.append(item['Key'])
+                latest[task_id] = (keys, max(modified, item['LastModified']))
+        now = datetime.now(timezone.utc)
+        stale = [keys for keys, modified in latest.values() if (now - modified).total_seconds() > max_age_seconds]
+        for keys in stale:
+            self._delete_keys(keys)
+        return len(stale)
+
+def create_checkpoint_store(cloudflare_s3: Optional[CloudflareS3], bucket_name: str,
+                            backend: str = CHECKPOINT_BACKEND) -> CheckpointStore:
+    """
+    Create the checkpoint store configured by CHECKPOINT_BACKEND (local or s3)
+    """
+    if backend == "local":
+        return LocalCheckpointStore()
+    if backend == "s3":
+        return S3CheckpointStore(cloudflare_s3, bucket_name)
+    raise ValueError(f"Unknown checkpoint backend: {backend}")
+
+async def collect_garbage_periodically(get_store: Callable[[], CheckpointStore],
+                                       interval_seconds: int = CHECKPOINT_GC_INTERVAL_SECONDS):
+    """Delete stale checkpoints every interval_seconds, for the lifetime of the app or worker"""
+    while True:
+        try:
+            removed = await asyncio.to_thread(lambda: get_store().collect_garbage())
+            if removed:
+                print(f"Deleted stale checkpoints of {removed} tasks")
+        except Exception as e:
+            print(f"Error collecting stale checkpoints: {e}")
+        await asyncio.sleep(interval_seconds)
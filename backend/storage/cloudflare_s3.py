@@ -1,6 +1,7 @@
 import os
-import boto3
+import threading
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 # Configuration
 S3_CONFIG = {
@@ -13,12 +14,26 @@ S3_CONFIG = {
 
 CLOUDFLARE_PUBLIC_BUCKET_URL = os.environ.get('CLOUDFLARE_PUBLIC_BUCKET_URL')
 
+# Multipart upload tuning, S3 requires parts of at least 5 MiB except the last one
+UPLOAD_PART_SIZE = max(5 * 1024 ** 2, int(os.environ.get('UPLOAD_PART_SIZE', 8 * 1024 ** 2)))
+UPLOAD_CONCURRENCY = int(os.environ.get('UPLOAD_CONCURRENCY', 4))
+
 class CloudflareS3:
     """
     This class is used to read and write files to a Cloudflare S3 bucket
     """
     def __init__(self, s3_client=None):
+        # boto3 takes a while to import, so it is only loaded once a client is needed
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
         self.s3_client = s3_client or boto3.client(**S3_CONFIG)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=UPLOAD_PART_SIZE,
+            multipart_chunksize=UPLOAD_PART_SIZE,
+            max_concurrency=UPLOAD_CONCURRENCY,
+            use_threads=True
+        )
 
     def read_file_from_s3(self, bucket_name: str, file_name: str) -> BytesIO:
         """
@@ -61,6 +76,66 @@ class CloudflareS3:
         except Exception as e:
             raise e
 
+    def upload_path_to_s3(self, file_path: str, bucket_name: str, file_name_in_s3: str, content_type: str = 'video/mp4') -> bool:
+        """
+        Upload a local file to S3 bucket with parallel multipart upload, reading it from disk part by part
+        """
+        full_path = f"{bucket_name}/{file_name_in_s3}"
+        self.s3_client.upload_file(
+            file_path,
+            bucket_name,
+            full_path,
+            ExtraArgs={'ContentType': content_type},
+            Config=self.transfer_config
+        )
+        return True
+
+    def upload_stream_to_s3(self, stream, bucket_name: str, file_name_in_s3: str, content_type: str = 'video/mp4',
+                            before_complete=None) -> bool:
+        """
+        Upload a non-seekable stream (e.g. an ffmpeg pipe) to S3 bucket as a multipart upload.
+        At most UPLOAD_CONCURRENCY parts are buffered at a time, so memory stays bounded.
+        before_complete is called once the stream is exhausted, raising from it aborts the upload.
+        """
+        full_path = f"{bucket_name}/{file_name_in_s3}"
+        upload = self.s3_client.create_multipart_upload(Bucket=bucket_name, Key=full_path, ContentType=content_type)
+        upload_id = upload['UploadId']
+        in_flight = threading.Semaphore(UPLOAD_CONCURRENCY)
+
+        def upload_part(part_number: int, body: bytes) -> dict:
+            try:
+                response = self.s3_client.upload_part(
+                    Bucket=bucket_name, Key=full_path, UploadId=upload_id, PartNumber=part_number, Body=body
+                )
+                return {'PartNumber': part_number, 'ETag': response['ETag']}
+            finally:
+                in_flight.release()
+
+        try:
+            futures = []
+            with ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY) as pool:
+                part_number = 1
+                while True:
+                    body = read_exactly(stream, UPLOAD_PART_SIZE)
+                    if not body and part_number > 1:
+                        break
+                    in_flight.acquire()
+                    futures.append(pool.submit(upload_part, part_number, body))
+                    part_number += 1
+                    if len(body) < UPLOAD_PART_SIZE:
+                        break
+            parts = [future.result() for future in futures]
+            if before_complete:
+                before_complete()
+            self.s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=full_path, UploadId=upload_id, MultipartUpload={'Parts': parts}
+            )
+            return True
+        except Exception as e:
+            print(f"Error streaming upload to S3: {e}")
+            self.s3_client.abort_multipart_upload(Bucket=bucket_name, Key=full_path, UploadId=upload_id)
+            raise e
+
     def get_s3_url(self, bucket_name: str, file_name: str) -> str:
         """
         Get the public URL for a file in S3 bucket
@@ -71,3 +146,15 @@ class CloudflareS3:
             return url
         except Exception as e:
             raise e
+
+def read_exactly(stream, size: int) -> bytes:
+    """Read up to size bytes, looping over short reads from pipes"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
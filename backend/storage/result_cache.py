@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from storage.cloudflare_s3 import CloudflareS3
+
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'reels-result-cache'))
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get('RESULT_CACHE_DISK_MAX_BYTES', 1024 ** 3))
+RESULT_CACHE_MEMORY_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MEMORY_MAX_ENTRIES', 512))
+RESULT_CACHE_S3_PREFIX = os.environ.get('RESULT_CACHE_S3_PREFIX', 'result-cache')
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+class MemoryTier:
+    """
+    This class is used to keep small cache entries in process memory with LRU eviction
+    """
+    name = "memory"
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MEMORY_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, layer: str, key: str, ttl: int) -> Optional[bytes]:
+        with self.lock:
+            entry = self.entries.get((layer, key))
+            if not entry:
+                return None
+            stored_at, value = entry
+            if time.time() - stored_at > ttl:
+                del self.entries[(layer, key)]
+                return None
+            self.entries.move_to_end((layer, key))
+            return value
+
+    def set(self, layer: str, key: str, value: bytes):
+        with self.lock:
+            self.entries[(layer, key)] = (time.time(), value)
+            self.entries.move_to_end((layer, key))
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+class DiskTier:
+    """
+    This class is used to keep cache entries as files on local disk, bounded by total size
+    """
+    name = "disk"
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def _path(self, layer: str, key: str) -> str:
+        return os.path.join(self.cache_dir, layer, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, layer: str, key: str, ttl: int) -> Optional[bytes]:
+        path = self._path(layer, key)
+        try:
+            if time.time() - os.path.getmtime(path) > ttl:
+                os.remove(path)
+                return None
+            with open(path, 'rb') as f:
+                value = f.read()
+            # Reading refreshes the access time used for eviction
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+            return value
+        except OSError:
+            return None
+
+    def set(self, layer: str, key: str, value: bytes):
+        path = self._path(layer, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+            f.write(value)
+            tmp_path = f.name
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently read files until the cache fits in max_bytes"""
+        with self.lock:
+            files = []
+            for root, _, names in os.walk(self.cache_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_atime, stat.st_size, path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+class S3Tier:
+    """
+    This class is used to keep cache entries in the S3 bucket so they are shared by every replica
+    """
+    name = "s3"
+
+    def __init__(self, cloudflare_s3: CloudflareS3, bucket_name: str, prefix: str = RESULT_CACHE_S3_PREFIX):
+        self.cloudflare_s3 = cloudflare_s3
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+
+    def _key(self, layer: str, key: str) -> str:
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return f"{self.bucket_name}/{self.prefix}/{layer}/{digest}"
+
+    def get(self, layer: str, key: str, ttl: int) -> Optional[bytes]:
+        try:
+            response = self.cloudflare_s3.s3_client.get_object(Bucket=self.bucket_name, Key=self._key(layer, key))
+        except Exception:
+            return None
+        age = (datetime.now(timezone.utc) - response['LastModified']).total_seconds()
+        if age > ttl:
+            response['Body'].close()
+            return None
+        return response['Body'].read()
+
+    def set(self, layer: str, key: str, value: bytes):
+        self.cloudflare_s3.s3_client.put_object(Bucket=self.bucket_name, Key=self._key(layer, key), Body=value)
+
+class ResultCache:
+    """
+    This class is used to cache pipeline results in layers (post, script, audio, video),
+    each with its own TTL and list of tiers checked from fastest to slowest.
+    A hit in a slower tier is copied into the faster ones.
+    """
+    def __init__(self, layers: Dict[str, dict]):
+        self.layers = layers
+        self.hits = {}
+        self.misses = {}
+
+    def get(self, layer: str, key: str) -> Optional[bytes]:
+        config = self.layers[layer]
+        for index, tier in enumerate(config["tiers"]):
+            try:
+                value = tier.get(layer, key, config["ttl"])
+            except Exception as e:
+                print(f"Error reading {layer} from {tier.name} cache: {e}")
+                continue
+            if value is not None:
+                self.hits[layer] = self.hits.get(layer, 0) + 1
+                for faster_tier in config["tiers"][:index]:
+                    self._set_tier(faster_tier, layer, key, value)
+                return value
+        self.misses[layer] = self.misses.get(layer, 0) + 1
+        return None
+
+    def set(self, layer: str, key: str, value: bytes):
+        for tier in self.layers[layer]["tiers"]:
+            self._set_tier(tier, layer, key, value)
+
+    def _set_tier(self, tier, layer: str, key: str, value: bytes):
+        try:
+            tier.set(layer, key, value)
+        except Exception as e:
+            # A broken tier must never fail the job, it only costs a cache miss later
+            print(f"Error writing {layer} to {tier.name} cache: {e}")
+
+    def get_json(self, layer: str, key: str) -> Optional[dict]:
+        value = self.get(layer, key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, layer: str, key: str, value):
+        self.set(layer, key, json.dumps(value).encode())
+
+    def get_text(self, layer: str, key: str) -> Optional[str]:
+        value = self.get(layer, key)
+        return value.decode() if value is not None else None
+
+    def set_text(self, layer: str, key: str, value: str):
+        self.set(layer, key, value.encode())
+
+    def stats(self) -> dict:
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+def make_cache_key(*parts) -> str:
+    """Build a cache key from the post ID and anything that changes the result"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+def create_result_cache(cloudflare_s3: CloudflareS3, bucket_name: str) -> ResultCache:
+    memory = MemoryTier()
+    disk = DiskTier()
+    s3 = S3Tier(cloudflare_s3, bucket_name)
+    return ResultCache({
+        "post": {"ttl": int(os.environ.get('RESULT_CACHE_POST_TTL', HOUR)), "tiers": [memory, disk]},
+        "script": {"ttl": int(os.environ.get('RESULT_CACHE_SCRIPT_TTL', 7 * DAY)), "tiers": [memory, disk, s3]},
+        # Audio is large, so it skips the memory tier
+        "audio": {"ttl": int(os.environ.get('RESULT_CACHE_AUDIO_TTL', 7 * DAY)), "tiers": [disk, s3]},
+        "video": {"ttl": int(os.environ.get('RESULT_CACHE_VIDEO_TTL', 30 * DAY)), "tiers": [memory, disk, s3]},
+    })
@@ -0,0 +1,206 @@
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+from storage.cloudflare_s3 import CloudflareS3
+from utils.metrics import template_cache_hits, template_cache_misses
+
+TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'reels-template-cache'))
+TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get('TEMPLATE_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+# How long a cached copy is trusted before it is revalidated with a conditional GET
+TEMPLATE_CACHE_REVALIDATE_SECONDS = int(os.environ.get('TEMPLATE_CACHE_REVALIDATE_SECONDS', 300))
+# Files used within this window may still be read by a job's ffmpeg and are never evicted
+TEMPLATE_CACHE_IN_USE_SECONDS = int(os.environ.get('TEMPLATE_CACHE_IN_USE_SECONDS', 900))
+# Access times are kept in memory and written to the index at most this often
+TEMPLATE_CACHE_FLUSH_SECONDS = 60
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+class TemplateCache:
+    """
+    This class is used to keep video templates from S3 on local disk, keyed by object key and ETag.
+
+    Cached files are revalidated with If-None-Match, evicted in LRU order once the cache
+    grows over max_bytes and handed to ffmpeg by path so the bytes never go through Python memory.
+    Files used within in_use_seconds are kept even over max_bytes, a running job may still read them.
+    """
+    def __init__(self, cloudflare_s3: CloudflareS3, cache_dir: str = TEMPLATE_CACHE_DIR,
+                 max_bytes: int = TEMPLATE_CACHE_MAX_BYTES, revalidate_seconds: int = TEMPLATE_CACHE_REVALIDATE_SECONDS,
+                 in_use_seconds: int = TEMPLATE_CACHE_IN_USE_SECONDS):
+        self.cloudflare_s3 = cloudflare_s3
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+        self.in_use_seconds = in_use_seconds
+        self.saved_at = 0.0
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self) -> OrderedDict:
+        """Load entries that survived a restart, dropping any whose file is gone"""
+        entries = OrderedDict()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                for key, entry in json.load(f):
+                    if os.path.exists(entry['path']):
+                        entries[key] = entry
+        except (OSError, ValueError):
+            pass
+        return entries
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self.entries.items()), f)
+        os.replace(tmp_path, self.index_path)
+        self.saved_at = time.time()
+
+    def _get_key_lock(self, key: str) -> threading.Lock:
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def _local_path(self, key: str, etag: str) -> str:
+        key_hash = hashlib.sha1(key.encode()).hexdigest()[:16]
+        etag_clean = etag.strip('"').replace('/', '_')
+        extension = os.path.splitext(key)[1]
+        return os.path.join(self.cache_dir, f"{key_hash}-{etag_clean}{extension}")
+
+    def _touch(self, key: str, entry: dict, added: bool = False):
+        """
+        Mark an entry as just used. The index is written right away only when a file was added,
+        a hit only updates memory and is flushed with the next write or TEMPLATE_CACHE_FLUSH_SECONDS later.
+        """
+        with self.lock:
+            self.entries[key] = dict(entry, used_at=time.time())
+            self.entries.move_to_end(key)
+            if added:
+                self._evict(keep=key)
+            if added or time.time() - self.saved_at > TEMPLATE_CACHE_FLUSH_SECONDS:
+                self._save_index()
+
+    def _remove_file(self, path: str):
+        """Remove a cached file and anything derived from it (e.g. prepared segments)"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        for derived_path in glob.glob(glob.escape(path) + '.*'):
+            shutil.rmtree(derived_path, ignore_errors=True)
+
+    def _retire(self, key: str, entry: dict):
+        """Drop a replaced version, or keep it under its own key for eviction while a job may still read it"""
+        if time.time() - entry.get('used_at', 0) >= self.in_use_seconds:
+            self._remove_file(entry['path'])
+            return
+        with self.lock:
+            stale_key = f"{key}#{entry['etag']}"
+            self.entries[stale_key] = entry
+            self.entries.move_to_end(stale_key, last=False)
+
+    def _evict(self, keep: str):
+        """Drop least recently used files until the cache fits in max_bytes, skipping files in use"""
+        total = sum(entry['size'] for entry in self.entries.values())
+        now = time.time()
+        for key in list(self.entries.keys()):
+            if total <= self.max_bytes:
+                break
+            if key == keep or now - self.entries[key].get('used_at', 0) < self.in_use_seconds:
+                continue
+            entry = self.entries.pop(key)
+            total -= entry['size']
+            self.evictions += 1
+            self._remove_file(entry['path'])
+
+    def _download(self, key: str, response: dict, cancel: threading.Event = None) -> dict:
+        etag = response['ETag']
+        path = self._local_path(key, etag)
+        # Stream into a temp file first so readers never see a partial template
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, delete=False) as f:
+            tmp_path = f.name
+            try:
+                while chunk := response['Body'].read(DOWNLOAD_CHUNK_SIZE):
+                    if cancel is not None and cancel.is_set():
+                        raise InterruptedError(f"Download of {key} cancelled")
+                    f.write(chunk)
+            except BaseException:
+                f.close()
+                os.remove(tmp_path)
+                raise
+        os.replace(tmp_path, path)
+        return {'etag': etag, 'path': path, 'size': os.path.getsize(path), 'checked_at': time.time()}
+
+    def get_template_path(self, bucket_name: str, file_name: str, cancel: threading.Event = None) -> str:
+        """
+        Return a local path for a template in S3, downloading it only when missing or changed.
+        Setting cancel stops a download in progress with InterruptedError.
+        """
+        from botocore.exceptions import ClientError  # Loaded with boto3 by the S3 client
+
+        key = f"{bucket_name}/{file_name}"
+        with self._get_key_lock(key):
+            with self.lock:
+                entry = self.entries.get(key)
+
+            if entry and time.time() - entry['checked_at'] < self.revalidate_seconds:
+                self.hits += 1
+                template_cache_hits.inc()
+                self._touch(key, entry)
+                return entry['path']
+
+            request = {'Bucket': bucket_name, 'Key': key}
+            if entry:
+                request['IfNoneMatch'] = entry['etag']
+            try:
+                response = self.cloudflare_s3.s3_client.get_object(**request)
+            except ClientError as e:
+                status_code = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+                if entry and (status_code == 304 or e.response['Error']['Code'] in ('304', 'NotModified')):
+                    self.hits += 1
+                    template_cache_hits.inc()
+                    self._touch(key, dict(entry, checked_at=time.time()))
+                    return entry['path']
+                print(f"Error reading template from S3: {e}")
+                raise e
+
+            self.misses += 1
+            template_cache_misses.inc()
+            new_entry = self._download(key, response, cancel)
+            if entry and entry['path'] != new_entry['path']:
+                self._retire(key, entry)
+            self._touch(key, new_entry, added=True)
+            return new_entry['path']
+
+    def get_cached_path(self, bucket_name: str, file_name: str, etag: str = None) -> str:
+        """
+        Return the local path of a file already in the cache, None when it isn't (or is another
+        version than etag), without going to S3
+        """
+        key = f"{bucket_name}/{file_name}"
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry or not os.path.exists(entry['path']):
+            return None
+        if etag and entry['etag'].strip('"') != etag.strip('"'):
+            return None
+        self._touch(key, entry)
+        return entry['path']
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'size_bytes': sum(entry['size'] for entry in self.entries.values())
+            }
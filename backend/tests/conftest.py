@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app runs from backend/ and imports its packages from there (utils.*, media.*, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
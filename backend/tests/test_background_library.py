@@ -0,0 +1,49 @@
+import random
+import types
+from storage.background_library import BackgroundLibrary, BackgroundSource, parse_frame_rate
+from utils.metrics import background_cache_downloads
+
+def source(**kwargs):
+    values = dict(name="backgrounds/a.mp4", source="https://bucket/a.mp4", duration=100.0,
+                  keyframes=[0.0, 10.0, 50.0, 80.0, 95.0], width=1920, height=1080, fps=29.97)
+    values.update(kwargs)
+    return BackgroundSource(**values)
+
+def test_window_starts_on_a_keyframe_with_enough_video_after_it():
+    background = source()
+    starts = {background.pick_start(30, random.Random(seed)) for seed in range(50)}
+    assert starts <= {0.0, 10.0, 50.0}
+    start = background.pick_start(30, random.Random(1))
+    assert background.input_args(30, random.Random(1))[:4] == ['-ss', f"{start:.3f}", '-t', '30.000']
+
+def test_short_assets_are_looped():
+    assert source(duration=10.0).input_args(30) == ['-stream_loop', '-1', '-i', 'https://bucket/a.mp4']
+
+def test_normalize_filter_only_when_the_format_differs():
+    assert source().normalize_filter(1080, 1920, 30) == \
+        "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920,fps=30"
+    assert source(width=1080, height=1920, fps=30.0).normalize_filter(1080, 1920, 30) is None
+
+def test_cached_assets_are_local():
+    assert source(source="/cache/a.mp4").is_local
+    assert not source().is_local
+
+def test_frame_rates():
+    assert parse_frame_rate("30000/1001") == 29.97
+    assert parse_frame_rate("25") == 25.0
+    assert parse_frame_rate("0/0") is None
+    assert parse_frame_rate("") is None
+
+def test_failed_cache_downloads_are_counted():
+    def fail(bucket_name, file_name, cancel=None):
+        raise OSError("disk full")
+
+    def downloads(result):
+        return background_cache_downloads.values.get((result,), 0)
+
+    library = BackgroundLibrary(None, "bucket", template_cache=types.SimpleNamespace(get_template_path=fail))
+    failed_before = downloads("failed")
+    library.cache_in_background("backgrounds/a.mp4")
+    library.close()
+    assert downloads("failed") == failed_before + 1
+    assert not library.caching
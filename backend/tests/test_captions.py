@@ -0,0 +1,50 @@
+import math
+from array import array
+from media.captions import build_cues, cues_to_srt, align_script_to_samples, format_timestamp
+from media.caption_layers import parse_srt, caption_frames
+
+def timed(words, step=0.5):
+    return [{"word": word, "start": index * step, "end": index * step + step * 0.8} for index, word in enumerate(words)]
+
+def test_phrase_cues_split_at_punctuation_and_length():
+    cues = build_cues(timed("Hello there, my good friend. How are you doing today my friend".split()), "phrase")
+    assert [cue["text"] for cue in cues] == ["Hello there,", "my good friend.", "How are you doing", "today my friend"]
+    assert cues[0]["start"] == 0 and cues[0]["end"] == cues[0]["words"][-1]["end"]
+
+def test_word_cues():
+    cues = build_cues(timed(["One", "two"]), "word")
+    assert [(cue["text"], cue["words"][0]["word"]) for cue in cues] == [("One", "One"), ("two", "two")]
+
+def test_srt_round_trip():
+    cues = build_cues(timed("Hello there, my good friend.".split()), "phrase")
+    parsed = parse_srt(cues_to_srt(cues))
+    assert [cue["text"] for cue in parsed] == [cue["text"] for cue in cues]
+    assert [round(cue["start"], 3) for cue in parsed] == [round(cue["start"], 3) for cue in cues]
+    assert format_timestamp(3725.5) == "01:02:05,500"
+
+def test_parse_srt_skips_malformed_blocks():
+    content = "1\n00:00:01,000 --> 00:00:02,500\nFirst line\nsecond line\n\nnot a cue\n\n2\n00:00:03.000 --> 00:00:04.000\nLast\n"
+    assert parse_srt(content) == [
+        {"text": "First line second line", "start": 1.0, "end": 2.5},
+        {"text": "Last", "start": 3.0, "end": 4.0},
+    ]
+
+def test_alignment_follows_speech_regions():
+    sample_rate = 16000
+    samples = array("h")
+    # Two bursts of "speech" separated by silence
+    for start, end in ((0.1, 0.9), (1.4, 2.2)):
+        samples.extend([0] * (int(start * sample_rate) - len(samples)))
+        samples.extend(int(8000 * math.sin(index / 3)) for index in range(int((end - start) * sample_rate)))
+    samples.extend([0] * int(0.3 * sample_rate))
+    words = align_script_to_samples("Hello there. General Kenobi.", samples, sample_rate)
+    assert [word["word"] for word in words] == ["Hello", "there.", "General", "Kenobi."]
+    assert words[1]["end"] <= 1.0 and words[2]["start"] >= 1.3
+    assert all(word["start"] < word["end"] for word in words)
+
+def test_highlight_frames_cover_each_word():
+    cue = {"text": "one two three", "start": 0.0, "end": 1.5,
+           "words": [{"word": "one", "start": 0.0}, {"word": "two", "start": 0.4}, {"word": "three", "start": 0.9}]}
+    frames = caption_frames([cue], "highlight")
+    assert [(start, end, highlight) for start, end, _, highlight in frames] == [(0.0, 0.4, 0), (0.4, 0.9, 1), (0.9, 1.5, 2)]
+    assert caption_frames([cue], "plain") == [(0.0, 1.5, ["one", "two", "three"], None)]
@@ -0,0 +1,59 @@
+import os
+import time
+import types
+from storage.checkpoints import LocalCheckpointStore, S3CheckpointStore
+
+KINDS = {"reddit": "json", "script": "text", "tts": "bytes", "captions": "file", "render": "files"}
+
+def write(path, content: bytes) -> str:
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+def test_local_store_round_trips_every_kind(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path / "checkpoints"))
+    workdir = tmp_path / "work"
+    workdir.mkdir()
+    store.save("task", "reddit", "json", {"title": "Post"})
+    store.save("task", "script", "text", "A script")
+    store.save("task", "tts", "bytes", b"audio")
+    store.save("task", "captions", "file", write(workdir / "captions.json", b"[]"))
+    store.save("task", "render", "files", {"hd": write(workdir / "output.mp4", b"video"), "preview": None})
+
+    restore_dir = tmp_path / "restore"
+    restore_dir.mkdir()
+    results = store.load_all("task", KINDS, str(restore_dir))
+    assert results["reddit"] == {"title": "Post"}
+    assert results["script"] == "A script"
+    assert results["tts"] == b"audio"
+    assert open(results["captions"], "rb").read() == b"[]"
+    assert results["render"]["preview"] is None
+    assert open(results["render"]["hd"], "rb").read() == b"video"
+    assert os.path.dirname(results["render"]["hd"]) == str(restore_dir)
+
+def test_missing_and_deleted_checkpoints(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path))
+    assert store.load_all("task", KINDS, str(tmp_path)) == {}
+    store.save("task", "script", "text", "A script")
+    store.delete("task")
+    assert store.load_all("task", KINDS, str(tmp_path)) == {}
+
+def test_garbage_collection_removes_stale_tasks(tmp_path):
+    store = LocalCheckpointStore(str(tmp_path))
+    store.save("old", "script", "text", "old")
+    store.save("new", "script", "text", "new")
+    stale = time.time() - 3600
+    os.utime(tmp_path / "old", (stale, stale))
+    assert store.collect_garbage(max_age_seconds=60) == 1
+    assert os.listdir(tmp_path) == ["new"]
+
+def test_s3_store_does_not_upload_rendered_outputs(tmp_path):
+    uploads = []
+    client = types.SimpleNamespace(
+        put_object=lambda **kwargs: uploads.append(kwargs["Key"]),
+        upload_file=lambda path, bucket, key, Config=None: uploads.append(key),
+    )
+    store = S3CheckpointStore(types.SimpleNamespace(s3_client=client, transfer_config=None), "bucket")
+    store.save("task", "render", "files", {"hd": write(tmp_path / "output.mp4", b"video")})
+    store.save("task", "captions", "file", write(tmp_path / "captions.srt", b""))
+    assert uploads == ["bucket/checkpoints/task/captions.file.srt"]
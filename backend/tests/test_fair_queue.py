@@ -0,0 +1,44 @@
+import pytest
+from utils.fair_queue import FairQueue, INTERACTIVE, BATCH
+
+def drain(queue: FairQueue) -> list:
+    items = []
+    while (item := queue.pop()) is not None:
+        items.append(item)
+    return items
+
+def test_users_interleave():
+    queue = FairQueue()
+    for index in range(3):
+        queue.push(f"a{index}", f"a{index}", user_id="a")
+    queue.push("b0", "b0", user_id="b")
+    assert drain(queue) == ["a0", "b0", "a1", "a2"]
+
+def test_interactive_jobs_get_their_weight_without_starving_batches():
+    queue = FairQueue({INTERACTIVE: 3, BATCH: 1})
+    for index in range(6):
+        queue.push(f"batch{index}", f"batch{index}", priority=BATCH)
+    for index in range(6):
+        queue.push(f"interactive{index}", f"interactive{index}")
+    order = drain(queue)
+    assert order.index("batch0") < order.index("interactive3")
+    assert order[:4].count("batch0") == 1 and sum(item.startswith("interactive") for item in order[:4]) == 3
+
+def test_positions_and_removal():
+    queue = FairQueue()
+    queue.push("a", "a", user_id="u1")
+    queue.push("b", "b", user_id="u1")
+    queue.push("c", "c", user_id="u2")
+    assert [queue.position(key) for key in ("a", "c", "b")] == [0, 1, 2]
+    assert queue.position_for("u3") == 2
+    assert queue.count("u1") == 2
+
+    assert queue.remove("a")
+    assert not queue.remove("a")
+    assert queue.position("a") is None
+    assert len(queue) == 2
+    assert drain(queue) == ["c", "b"]
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        FairQueue().push("a", "a", priority="urgent")
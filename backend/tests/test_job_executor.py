@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+import utils.job_executor as job_executor_module
+from utils.fair_queue import BATCH
+from utils.job_executor import JobExecutor, QueueFullError
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+async def sleep_job(seconds: float = 0.01, result=None):
+    await asyncio.sleep(seconds)
+    return result
+
+def test_jobs_run_up_to_the_limit_and_queue_the_rest():
+    async def main():
+        executor = JobExecutor(max_running_jobs=2, max_queued_jobs=10)
+        tasks = [executor.submit(sleep_job(0.05, index), key=index) for index in range(4)]
+        await asyncio.sleep(0)
+        assert executor.running_jobs == 2
+        assert executor.queued_jobs == 2
+        assert executor.get_queue_position(2)["queue_position"] == 1
+        assert await asyncio.gather(*tasks) == [0, 1, 2, 3]
+        assert (executor.running_jobs, executor.queued_jobs) == (0, 0)
+    run(main())
+
+def test_job_cancelled_before_starting_releases_its_slot():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=10)
+        task = executor.submit(sleep_job(), key="x")
+        task.cancel()
+        await asyncio.sleep(0.02)
+        assert executor.running_jobs == 0
+        # The slot is usable again
+        assert await executor.submit(sleep_job(result="ok"), key="y") == "ok"
+    run(main())
+
+def test_queued_job_cancelled_before_its_turn_leaves_the_queue():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=10)
+        first = executor.submit(sleep_job(0.02, "first"), key="first")
+        second = executor.submit(sleep_job(), key="second")
+        second.cancel()
+        assert await first == "first"
+        await asyncio.sleep(0.01)
+        assert (executor.running_jobs, executor.queued_jobs) == (0, 0)
+        assert executor.get_queue_position("second") is None
+    run(main())
+
+def test_job_cancelled_while_waiting_for_its_slot_leaves_the_queue():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=10)
+        first = executor.submit(sleep_job(0.02, "first"), key="first")
+        second = executor.submit(sleep_job(), key="second")
+        # Let the second job's coroutine start awaiting its slot before cancelling it
+        await asyncio.sleep(0)
+        second.cancel()
+        assert await first == "first"
+        assert await executor.submit(sleep_job(result="third"), key="third") == "third"
+        await asyncio.sleep(0)
+        assert (executor.running_jobs, executor.queued_jobs) == (0, 0)
+    run(main())
+
+def test_dispatch_skips_slots_cancelled_before_their_cleanup_ran():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=10)
+        release = asyncio.Event()
+
+        async def blocked_job():
+            await release.wait()
+            return "first"
+
+        first = executor.submit(blocked_job(), key="first")
+        second = executor.submit(sleep_job(), key="second")
+        third = executor.submit(sleep_job(result="third"), key="third")
+        await asyncio.sleep(0)
+        # The first job finishes and dispatches before the cancelled job's done callback runs
+        second.cancel()
+        release.set()
+        assert await asyncio.gather(first, third) == ["first", "third"]
+        await asyncio.sleep(0)
+        assert (executor.running_jobs, executor.queued_jobs) == (0, 0)
+    run(main())
+
+def test_full_queue_is_rejected():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=2)
+        tasks = [executor.submit(sleep_job(0.02), key=index) for index in range(3)]
+        job = sleep_job()
+        with pytest.raises(QueueFullError) as error:
+            executor.submit(job, key="rejected")
+        assert error.value.retry_after > 0
+        await asyncio.gather(*tasks)
+    run(main())
+
+def test_per_user_limit_skips_anonymous_jobs(monkeypatch):
+    monkeypatch.setattr(job_executor_module, "MAX_QUEUED_JOBS_PER_USER", 2)
+
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=50)
+        tasks = [executor.submit(sleep_job(0.02), key="running")]
+        tasks += [executor.submit(sleep_job(), key=f"anonymous-{index}") for index in range(5)]
+        tasks += [executor.submit(sleep_job(), key=f"user-{index}", user_id="user") for index in range(2)]
+        with pytest.raises(QueueFullError):
+            executor.check_admission("user")
+        executor.check_admission("another-user")
+        await asyncio.gather(*tasks)
+    run(main())
+
+def test_admission_rejects_long_waits(monkeypatch):
+    monkeypatch.setattr(job_executor_module, "ADMISSION_MAX_WAIT_SECONDS", 30)
+
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=50)
+        executor.job_seconds = 20
+        tasks = [executor.submit(sleep_job(0.02), key="running"), executor.submit(sleep_job(), key="queued")]
+        # Two jobs ahead of a new one, about 40s of waiting
+        with pytest.raises(QueueFullError) as error:
+            executor.check_admission()
+        assert error.value.retry_after == pytest.approx(10)
+        # Batches are only bounded by the queue size
+        executor.check_admission(priority=BATCH)
+        await asyncio.gather(*tasks)
+    run(main())
+
+def test_waiting_jobs_are_dispatched_fairly_between_users():
+    async def main():
+        executor = JobExecutor(max_running_jobs=1, max_queued_jobs=50)
+        order = []
+
+        async def job(name):
+            order.append(name)
+            await asyncio.sleep(0)
+
+        tasks = [executor.submit(sleep_job(0.01), key="running")]
+        tasks += [executor.submit(job(f"a{index}"), key=f"a{index}", user_id="a") for index in range(3)]
+        tasks += [executor.submit(job(f"b{index}"), key=f"b{index}", user_id="b") for index in range(3)]
+        await asyncio.gather(*tasks)
+        assert order == ["a0", "b0", "a1", "b1", "a2", "b2"]
+    run(main())
@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+import utils.pipeline_graph as pipeline_graph_module
+from utils.pipeline_graph import PipelineGraph, Stage, StageError, is_transient_error
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(pipeline_graph_module, "STAGE_RETRY_BACKOFF_SECONDS", 0)
+
+def test_stages_run_after_their_dependencies():
+    calls = []
+
+    def stage(name, value):
+        async def func(results):
+            calls.append(name)
+            return value(results)
+        return func
+
+    graph = PipelineGraph([
+        Stage("c", stage("c", lambda r: r["a"] + r["b"]), deps=["a", "b"]),
+        Stage("a", stage("a", lambda r: 1)),
+        Stage("b", stage("b", lambda r: 2)),
+    ])
+    results = asyncio.run(graph.run())
+    assert results == {"a": 1, "b": 2, "c": 3}
+    assert calls[-1] == "c"
+
+def test_independent_stages_overlap():
+    running = []
+    peak = []
+
+    async def slow(results):
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return True
+
+    asyncio.run(PipelineGraph([Stage("a", slow), Stage("b", slow)]).run())
+    assert max(peak) == 2
+
+def test_checkpointed_stages_are_skipped():
+    calls = []
+
+    async def func(results):
+        calls.append("ran")
+        return "new"
+
+    graph = PipelineGraph([Stage("a", func), Stage("b", func, deps=["a"]), Stage("c", func, deps=["b"])])
+    assert graph.required_stages({"b": "old"}) == {"c"}
+    results = asyncio.run(graph.run({"b": "old"}))
+    assert results["c"] == "new" and "a" not in results
+    assert calls == ["ran"]
+
+def test_failure_cancels_siblings_and_carries_the_stage_message():
+    cancelled = []
+
+    async def fails(results):
+        raise RuntimeError("boom")
+
+    async def slow(results):
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    graph = PipelineGraph([Stage("a", fails, error_message="Error in a"), Stage("b", slow)])
+    with pytest.raises(StageError) as error:
+        asyncio.run(graph.run())
+    assert error.value.stage == "a"
+    assert error.value.message == "Error in a: boom"
+    assert cancelled == [True]
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    async def flaky(results):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    assert asyncio.run(PipelineGraph([Stage("a", flaky, retries=2)]).run()) == {"a": "ok"}
+    assert len(attempts) == 3
+
+def test_other_errors_are_not_retried():
+    attempts = []
+
+    async def broken(results):
+        attempts.append(1)
+        raise ValueError("bad input")
+
+    with pytest.raises(StageError):
+        asyncio.run(PipelineGraph([Stage("a", broken, retries=2)]).run())
+    assert len(attempts) == 1
+
+def test_transient_error_detection():
+    class ClientError(Exception):
+        def __init__(self, code, status):
+            self.response = {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}}
+
+    assert is_transient_error(TimeoutError())
+    assert is_transient_error(ClientError("SlowDown", 503))
+    assert not is_transient_error(ClientError("NoSuchKey", 404))
+    try:
+        try:
+            raise ConnectionError("reset")
+        except ConnectionError as e:
+            raise RuntimeError("wrapped") from e
+    except RuntimeError as e:
+        assert is_transient_error(e)
+
+def test_unknown_dependency_and_cycles_are_rejected():
+    async def func(results):
+        return None
+
+    with pytest.raises(ValueError):
+        PipelineGraph([Stage("a", func, deps=["missing"])])
+    with pytest.raises(ValueError, match="cycle"):
+        asyncio.run(PipelineGraph([Stage("a", func, deps=["b"]), Stage("b", func, deps=["a"]), Stage("c", func, deps=["a"])]).run())
@@ -0,0 +1,69 @@
+import io
+import shutil
+import struct
+import subprocess
+import wave
+import pytest
+from media.probe import (
+    get_audio_bytes_duration, get_adts_duration, get_ogg_opus_duration, get_wav_duration, probe, probe_file
+)
+
+def wav_bytes(seconds: float, sample_rate: int = 24000) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(b"\0\0" * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+def adts_frame(sample_rate_index: int = 6, payload: bytes = b"\0" * 10) -> bytes:
+    """One ADTS frame header (MPEG-4 AAC LC, mono, one raw data block) and its payload"""
+    length = 7 + len(payload)
+    return bytes([
+        0xFF, 0xF1,
+        (1 << 6) | (sample_rate_index << 2),
+        (1 << 6) | (length >> 11),
+        (length >> 3) & 0xFF,
+        ((length & 0x07) << 5) | 0x1F,
+        0xFC,
+    ]) + payload
+
+def test_wav_duration():
+    assert get_wav_duration(wav_bytes(1.5)) == pytest.approx(1.5)
+
+def test_wav_duration_with_streamed_placeholder_sizes():
+    data = bytearray(wav_bytes(2.0))
+    struct.pack_into("<I", data, 40, 0xFFFFFFFF)  # data chunk size as sent by streaming TTS
+    assert get_wav_duration(bytes(data)) == pytest.approx(2.0)
+
+def test_adts_duration():
+    # 24 kHz (index 6): 1024 samples per frame
+    assert get_adts_duration(adts_frame() * 48) == pytest.approx(48 * 1024 / 24000)
+
+def test_ogg_opus_duration():
+    head = b"OggS" + b"\0" * 24 + b"OpusHead" + bytes([1, 1]) + struct.pack("<H", 312)
+    last_page = b"OggS" + b"\0\0" + struct.pack("<q", 48000 * 3 + 312) + b"\0" * 16
+    assert get_ogg_opus_duration(head + last_page) == pytest.approx(3.0)
+
+def test_unknown_audio_has_no_header_duration():
+    assert get_audio_bytes_duration(b"ID3\x04" + b"\0" * 100) is None
+    assert get_audio_bytes_duration(b"RIFF" + b"\0" * 4) is None
+
+def test_wav_file_is_probed_from_its_header(tmp_path):
+    path = tmp_path / "audio.wav"
+    path.write_bytes(wav_bytes(3.0))
+    info = probe_file(str(path))
+    assert info["duration"] == pytest.approx(3.0)
+    assert info["has_audio"] and not info["has_video"]
+
+@pytest.mark.skipif(not shutil.which("ffmpeg"), reason="needs ffmpeg to write an MP4")
+def test_mp4_is_probed_from_its_moov_box(tmp_path):
+    path = tmp_path / "video.mp4"
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'testsrc=size=320x240:rate=25',
+                    '-f', 'lavfi', '-i', 'sine', '-t', '2', '-c:v', 'libx264', '-preset', 'ultrafast',
+                    '-c:a', 'aac', '-shortest', str(path)], check=True)
+    info = probe(str(path))
+    assert info["duration"] == pytest.approx(2.0, abs=0.1)
+    assert (info["width"], info["height"]) == (320, 240)
+    assert info["has_video"] and info["has_audio"]
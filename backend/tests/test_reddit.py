@@ -0,0 +1,57 @@
+import types
+import pytest
+import requests
+import clients.reddit as reddit_module
+from clients.reddit import RedditClient
+from utils.pipeline_graph import is_transient_error
+
+def response(status_code: int, **headers):
+    return types.SimpleNamespace(status_code=status_code, headers=headers)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(reddit_module, "REDDIT_BACKOFF_SECONDS", 0.5)
+    return RedditClient()
+
+def test_rate_limit_reset_is_only_used_for_429(client):
+    assert 20 <= client._retry_delay(response(429, **{"X-Ratelimit-Reset": "20"}), 0) <= 20.5
+    assert client._retry_delay(response(502, **{"X-Ratelimit-Reset": "20"}), 0) <= 0.5
+
+def test_retry_after_is_honored(client):
+    assert 3 <= client._retry_delay(response(503, **{"Retry-After": "3"}), 0) <= 3.5
+
+def test_backoff_grows_and_is_capped(client):
+    assert client._retry_delay(None, 2) <= 2.0
+    assert client._retry_delay(response(500), 20) <= reddit_module.REDDIT_MAX_BACKOFF_SECONDS
+
+def test_exhausted_budget_waits_for_the_reset(client):
+    client._record_rate_limit(response(200, **{"X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": "5"}))
+    assert client.rate_limited_until > 0
+    client.rate_limited_until = 0
+    client._record_rate_limit(response(200, **{"X-Ratelimit-Remaining": "10", "X-Ratelimit-Reset": "5"}))
+    assert client.rate_limited_until == 0
+
+def test_failed_fetches_raise_with_their_transient_status(client, monkeypatch):
+    monkeypatch.setattr(client, "get_post_id", lambda url: "abc")
+    monkeypatch.setattr(client, "_get_authenticated", lambda url: response(503))
+    with pytest.raises(Exception) as error:
+        client.get_post_and_comments("https://www.reddit.com/r/a/comments/abc")
+    assert is_transient_error(error.value)
+
+    monkeypatch.setattr(client, "_get_authenticated", lambda url: response(404))
+    with pytest.raises(Exception) as error:
+        client.get_post_and_comments("https://www.reddit.com/r/a/comments/abc")
+    assert not is_transient_error(error.value)
+
+def test_network_errors_propagate(client, monkeypatch):
+    def fail(url):
+        raise requests.ConnectionError("connection reset")
+    monkeypatch.setattr(client, "get_post_id", lambda url: "abc")
+    monkeypatch.setattr(client, "_get_authenticated", fail)
+    with pytest.raises(Exception) as error:
+        client.get_post_and_comments("https://www.reddit.com/r/a/comments/abc")
+    assert is_transient_error(error.value)
+
+def test_malformed_post_data_is_an_error(client):
+    with pytest.raises(ValueError):
+        client.extract_post_data([{"data": {"children": []}}])
@@ -0,0 +1,38 @@
+import pytest
+from media.render_scheduler import RenderScheduler, parse_preset_ladder
+from media.templates import EncodeProfile
+
+@pytest.fixture(autouse=True)
+def no_pinned_settings(monkeypatch):
+    monkeypatch.delenv("RENDER_PRESET", raising=False)
+    monkeypatch.delenv("RENDER_THREADS", raising=False)
+
+def test_idle_renders_use_the_default_preset():
+    scheduler = RenderScheduler(cpu_count=8, jobs_per_step=2)
+    assert scheduler.choose(0, 1).preset == EncodeProfile.preset
+
+def test_queue_depth_steps_down_the_ladder():
+    scheduler = RenderScheduler(cpu_count=8, ladder=["veryfast", "superfast", "ultrafast"], jobs_per_step=2)
+    assert [scheduler.choose(depth, 1).preset for depth in (0, 1, 2, 4, 100)] == \
+        ["veryfast", "veryfast", "superfast", "ultrafast", "ultrafast"]
+
+def test_threads_are_shared_between_running_renders():
+    scheduler = RenderScheduler(cpu_count=8)
+    assert [scheduler.choose(0, active).threads for active in (1, 2, 3, 16)] == [8, 4, 2, 1]
+
+def test_pinned_preset_is_kept(monkeypatch):
+    monkeypatch.setenv("RENDER_PRESET", "slow")
+    assert RenderScheduler(cpu_count=8, jobs_per_step=1).choose(10, 1).preset == "slow"
+
+def test_run_reports_the_profile_and_releases_the_lease():
+    scheduler = RenderScheduler(cpu_count=4)
+    stats = {}
+    result = scheduler.run(lambda value, encode_profile, render_stats: (value, encode_profile.threads), "video",
+                           get_queue_depth=lambda: 0, render_stats=stats)
+    assert result == ("video", 4)
+    assert stats["encode_profile"]["threads"] == 4
+    assert scheduler.active_renders == 0
+
+def test_empty_ladder_is_rejected():
+    with pytest.raises(ValueError):
+        parse_preset_ladder(" , ")
@@ -0,0 +1,42 @@
+import types
+import asyncio
+import pytest
+
+pytest.importorskip("fastapi")
+
+import routers.router as router_module
+from storage.checkpoints import LocalCheckpointStore
+from utils.job_executor import JobExecutor
+from utils.task_queue import TaskQueue, TaskStatus
+from utils.task_store import InMemoryTaskStore
+
+@pytest.fixture
+def services(monkeypatch, tmp_path):
+    checkpoints = LocalCheckpointStore(str(tmp_path))
+    task_queue = TaskQueue(store=InMemoryTaskStore())
+    cloudflare_s3 = types.SimpleNamespace(get_s3_url=lambda bucket, file_name: f"https://videos/{file_name}")
+    monkeypatch.setattr(router_module, "task_queue", task_queue)
+    monkeypatch.setattr(router_module, "job_executor", JobExecutor())
+    monkeypatch.setattr(router_module, "get_cloudflare_s3", lambda: cloudflare_s3)
+    monkeypatch.setattr(router_module, "get_checkpoint_store", lambda: checkpoints)
+    result_cache = types.SimpleNamespace(set_json=lambda layer, key, value: None)
+    monkeypatch.setattr(router_module, "get_result_cache", lambda: result_cache)
+    # Nothing before the upload runs again
+    for getter in ("get_template_cache", "get_background_library", "get_deepgram_service",
+                   "get_openai_service", "get_reddit_client"):
+        monkeypatch.setattr(router_module, getter, lambda: None)
+    return types.SimpleNamespace(checkpoints=checkpoints, task_queue=task_queue)
+
+def test_resume_after_upload_needs_no_render_checkpoint(services):
+    task_id = services.task_queue.create_media_processing_task({"url": "https://reddit.com/r/a/comments/x"})
+    file_names = router_module.get_video_file_names(task_id)
+    # S3 checkpoints never keep the rendered outputs, only the upload result is there
+    services.checkpoints.save(task_id, "upload", router_module.STAGE_CHECKPOINTS["upload"], file_names)
+
+    asyncio.run(router_module.process_reddit_commentary(task_id, "https://reddit.com/r/a/comments/x"))
+
+    task = services.task_queue.get_task(task_id)
+    assert task["status"] == TaskStatus.COMPLETED.value
+    assert task["resumed_stages"] == ["upload"]
+    assert task["video_urls"] == {name: f"https://videos/{file_name}" for name, file_name in file_names.items()}
+    assert services.checkpoints.list_entries(task_id) == set()
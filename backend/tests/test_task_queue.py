@@ -0,0 +1,46 @@
+import pytest
+from utils.task_queue import TaskQueue, TaskStatus
+from utils.task_store import InMemoryTaskStore
+
+@pytest.fixture
+def task_queue():
+    return TaskQueue(store=InMemoryTaskStore())
+
+def test_task_status_lifecycle(task_queue):
+    task_id = task_queue.create_media_processing_task({"url": "https://reddit.com/r/a/comments/x"})
+    assert task_queue.get_task_status(task_id)["status"] == TaskStatus.PENDING.value
+    task_queue.update_task_status(task_id, TaskStatus.COMPLETED, "https://cdn/hd.mp4",
+                                  video_urls={"hd": "https://cdn/hd.mp4", "preview": "https://cdn/preview.mp4"})
+    status = task_queue.get_task_status(task_id)
+    assert status["status"] == TaskStatus.COMPLETED.value
+    assert status["video_urls"]["preview"] == "https://cdn/preview.mp4"
+    assert task_queue.get_task_status("missing") == {"status": "not_found"}
+
+def test_batch_progress(task_queue):
+    done, running = (task_queue.create_media_processing_task() for _ in range(2))
+    batch_id = task_queue.create_batch([{"url": "a", "task_id": done}, {"url": "b", "task_id": running}])
+    task_queue.update_task_status(done, TaskStatus.COMPLETED, "https://cdn/a.mp4")
+    task_queue.update_task_status(running, TaskStatus.PROCESSING)
+    status = task_queue.get_batch_status(batch_id)
+    assert status["status"] == TaskStatus.PROCESSING.value
+    assert status["progress"] == 0.5
+
+    task_queue.update_task_status(running, TaskStatus.FAILED, error="boom")
+    status = task_queue.get_batch_status(batch_id)
+    assert status["status"] == TaskStatus.COMPLETED.value
+    assert status["progress"] == 1.0
+
+def test_batch_with_expired_or_missing_tasks_finishes(task_queue):
+    done = task_queue.create_media_processing_task()
+    task_queue.update_task_status(done, TaskStatus.COMPLETED, "https://cdn/a.mp4")
+    batch_id = task_queue.create_batch([{"url": "a", "task_id": done}, {"url": "b", "task_id": "expired"}, {"url": "c"}])
+    status = task_queue.get_batch_status(batch_id)
+    assert status["status"] == TaskStatus.COMPLETED.value
+    assert status["progress"] == 1.0
+    assert status["counts"][TaskStatus.FAILED.value] == 2
+    assert status["items"][1]["error"] == "Task not found"
+
+def test_batch_where_nothing_completed_fails(task_queue):
+    batch_id = task_queue.create_batch([{"url": "a", "task_id": "expired"}])
+    assert task_queue.get_batch_status(batch_id)["status"] == TaskStatus.FAILED.value
+    assert task_queue.get_batch_status("batch_missing") == {"status": "not_found"}
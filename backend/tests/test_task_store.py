@@ -0,0 +1,110 @@
+import pytest
+import os
+from utils.task_store import (
+    InMemoryTaskStore, SQLiteTaskStore, RedisTaskStore, PENDING, PROCESSING, TASK_STORE_SQLITE_PATH,
+    check_shared_task_store
+)
+
+def make_fakeredis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # Lua scripts need it
+    return RedisTaskStore(client=fakeredis.FakeRedis())
+
+@pytest.fixture(params=["memory", "sqlite", "fakeredis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryTaskStore()
+    if request.param == "sqlite":
+        return SQLiteTaskStore(str(tmp_path / "tasks.db"))
+    return make_fakeredis_store()
+
+def create(store, task_id, claimable=True):
+    store.create(task_id, {"task_id": task_id, "status": PENDING}, claimable=claimable)
+
+def test_claim_takes_claimable_pending_tasks_once(store):
+    create(store, "a")
+    create(store, "private", claimable=False)
+
+    task = store.claim("worker-1", 60)
+    assert task["task_id"] == "a"
+    assert task["status"] == PROCESSING
+    assert task["lease_owner"] == "worker-1"
+    assert store.claim("worker-2", 60) is None
+    assert store.get("private")["status"] == PENDING
+
+def test_claim_is_oldest_first(store):
+    for task_id in ("first", "second", "third"):
+        create(store, task_id)
+    assert [store.claim("worker", 60)["task_id"] for _ in range(3)] == ["first", "second", "third"]
+
+def test_expired_lease_is_reclaimed(store):
+    create(store, "a")
+    store.claim("worker-1", -1)  # Already expired, as if worker-1 died
+
+    task = store.claim("worker-2", 60)
+    assert task["task_id"] == "a"
+    assert task["lease_owner"] == "worker-2"
+    assert store.claim("worker-3", 60) is None
+
+def test_renew_lease_only_by_owner(store):
+    create(store, "a")
+    store.claim("worker-1", 60)
+
+    assert store.renew_lease("a", "worker-2", 60) is False
+    assert store.renew_lease("a", "worker-1", 120) is True
+    assert store.renew_lease("missing", "worker-1", 60) is False
+
+def test_renewed_lease_is_not_reclaimed(store):
+    create(store, "a")
+    store.claim("worker-1", -1)
+    assert store.renew_lease("a", "worker-1", 60)
+    assert store.claim("worker-2", 60) is None
+
+def test_finished_task_is_not_reclaimed(store):
+    create(store, "a")
+    store.claim("worker-1", -1)
+    store.update("a", {"status": "completed"})
+    assert store.claim("worker-2", 60) is None
+
+def test_requeue_makes_task_claimable_again(store):
+    create(store, "a")
+    store.claim("worker-1", 60)
+    store.update("a", {"status": "failed"})
+    assert store.count_pending() == 0
+
+    assert store.requeue("a", {"status": PENDING, "lease_owner": None, "lease_expires_at": None}, claimable=True)
+    assert store.count_pending() == 1
+    task = store.claim("worker-2", 60)
+    assert task["task_id"] == "a"
+    assert task["lease_owner"] == "worker-2"
+    assert store.claim("worker-3", 60) is None
+
+def test_requeue_unknown_task(store):
+    assert store.requeue("missing", {"status": PENDING}, claimable=True) is False
+
+def test_requeue_of_a_waiting_task_queues_it_once(store):
+    create(store, "a")
+    assert store.requeue("a", {"status": PENDING}, claimable=True)
+    assert store.count_pending() == 1
+    assert store.claim("worker-1", 60)["task_id"] == "a"
+    assert store.claim("worker-2", 60) is None
+
+def test_task_that_left_pending_while_queued_is_not_claimed(store):
+    create(store, "cancelled")
+    create(store, "b")
+    store.update("cancelled", {"status": "failed"})
+    assert store.claim("worker-1", 60)["task_id"] == "b"
+    assert store.claim("worker-2", 60) is None
+    assert store.get("cancelled")["status"] == "failed"
+
+def test_sqlite_default_path_does_not_depend_on_the_working_directory():
+    assert os.path.isabs(TASK_STORE_SQLITE_PATH) or "TASK_STORE_SQLITE_PATH" in os.environ
+
+@pytest.mark.parametrize("backend", ["memory", "fakeredis"])
+def test_worker_dispatch_needs_a_shared_store(backend):
+    with pytest.raises(RuntimeError):
+        check_shared_task_store(backend)
+
+@pytest.mark.parametrize("backend", ["sqlite", "redis"])
+def test_shared_stores_are_accepted(backend):
+    check_shared_task_store(backend)
@@ -0,0 +1,92 @@
+import io
+import os
+import time
+import types
+import pytest
+from storage.template_cache import TemplateCache
+from utils.metrics import registry, template_cache_hits, template_cache_misses
+
+class FakeS3Client:
+    """Serves objects of a fixed size, with a version per key that tests can bump"""
+    def __init__(self, size: int = 100):
+        self.size = size
+        self.versions = {}
+        self.gets = 0
+
+    def get_object(self, Bucket, Key, IfNoneMatch=None):
+        self.gets += 1
+        return {'ETag': f'"v{self.versions.get(Key, 1)}"', 'Body': io.BytesIO(b"x" * self.size)}
+
+@pytest.fixture
+def s3_client():
+    return FakeS3Client()
+
+def make_cache(s3_client, tmp_path, **kwargs):
+    return TemplateCache(types.SimpleNamespace(s3_client=s3_client), cache_dir=str(tmp_path), **kwargs)
+
+def test_hits_are_served_from_disk(s3_client, tmp_path):
+    cache = make_cache(s3_client, tmp_path, revalidate_seconds=300)
+    path = cache.get_template_path("bucket", "a.mp4")
+    assert cache.get_template_path("bucket", "a.mp4") == path
+    assert s3_client.gets == 1
+    assert cache.stats()["hits"] == 1
+    assert cache.get_cached_path("bucket", "a.mp4", etag="v1") == path
+    assert cache.get_cached_path("bucket", "a.mp4", etag="v2") is None
+    assert cache.get_cached_path("bucket", "b.mp4") is None
+
+def test_hits_and_misses_are_exported_as_counters(s3_client, tmp_path):
+    hits, misses = template_cache_hits.values[()], template_cache_misses.values[()]
+    cache = make_cache(s3_client, tmp_path, revalidate_seconds=300)
+    cache.get_template_path("bucket", "a.mp4")
+    cache.get_template_path("bucket", "a.mp4")
+    assert (template_cache_hits.values[()], template_cache_misses.values[()]) == (hits + 1, misses + 1)
+    rendered = registry.render()
+    assert "# TYPE reels_template_cache_hits_total counter" in rendered
+    assert "# TYPE reels_template_cache_misses_total counter" in rendered
+
+def test_hits_do_not_rewrite_the_index(s3_client, tmp_path):
+    cache = make_cache(s3_client, tmp_path, revalidate_seconds=300)
+    cache.get_template_path("bucket", "a.mp4")
+    written_at = os.path.getmtime(cache.index_path)
+    time.sleep(0.01)
+    cache.get_template_path("bucket", "a.mp4")
+    assert os.path.getmtime(cache.index_path) == written_at
+
+def test_least_recently_used_idle_files_are_evicted(s3_client, tmp_path):
+    cache = make_cache(s3_client, tmp_path, max_bytes=250, in_use_seconds=0)
+    first = cache.get_template_path("bucket", "a.mp4")
+    cache.get_template_path("bucket", "b.mp4")
+    cache.get_cached_path("bucket", "a.mp4")
+    cache.get_template_path("bucket", "c.mp4")
+    assert os.path.exists(first)
+    assert cache.get_cached_path("bucket", "b.mp4") is None
+    assert cache.stats()["evictions"] == 1
+
+def test_files_in_use_are_not_evicted(s3_client, tmp_path):
+    cache = make_cache(s3_client, tmp_path, max_bytes=150, in_use_seconds=60)
+    first = cache.get_template_path("bucket", "a.mp4")
+    second = cache.get_template_path("bucket", "b.mp4")
+    assert os.path.exists(first) and os.path.exists(second)
+    assert cache.stats()["size_bytes"] == 200
+
+def test_replaced_version_in_use_is_kept_until_evicted(s3_client, tmp_path):
+    cache = make_cache(s3_client, tmp_path, revalidate_seconds=0, in_use_seconds=60)
+    old = cache.get_template_path("bucket", "a.mp4")
+    s3_client.versions["bucket/a.mp4"] = 2
+    new = cache.get_template_path("bucket", "a.mp4")
+    assert new != old
+    assert os.path.exists(old)
+
+    cache.in_use_seconds = 0
+    cache.max_bytes = 100
+    cache.get_template_path("bucket", "b.mp4")
+    assert not os.path.exists(old)
+
+def test_cancelled_download_leaves_no_file(s3_client, tmp_path):
+    import threading
+    cancel = threading.Event()
+    cancel.set()
+    cache = make_cache(s3_client, tmp_path)
+    with pytest.raises(InterruptedError):
+        cache.get_template_path("bucket", "a.mp4", cancel=cancel)
+    assert os.listdir(tmp_path) == []
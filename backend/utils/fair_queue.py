@@ -0,0 +1,88 @@
+import os
+import heapq
+import itertools
+from typing import Any, Dict, Hashable, Optional
+
+# Job classes, interactive requests are served ahead of batches and cache warm-ups
+INTERACTIVE = "interactive"
+BATCH = "batch"
+# Share of dispatches each class gets while both have jobs waiting
+PRIORITY_WEIGHTS = {
+    INTERACTIVE: float(os.environ.get("INTERACTIVE_PRIORITY_WEIGHT", 8)),
+    BATCH: float(os.environ.get("BATCH_PRIORITY_WEIGHT", 1)),
+}
+# Flow of requests without a user ID
+ANONYMOUS_USER = "anonymous"
+
+class FairQueue:
+    """
+    This class is used to order waiting jobs with weighted fair queuing (self-clocked).
+
+    Every (priority class, user ID) pair is a flow. A job's tag is where its flow's previous job
+    ended, or the current virtual time if the flow was idle, plus 1 / the class weight, and jobs
+    are dispatched by smallest tag. One user's burst therefore interleaves with everyone else's
+    jobs instead of delaying them, and interactive jobs get PRIORITY_WEIGHTS times the share of
+    batch jobs without starving them.
+    """
+    def __init__(self, weights: Dict[str, float] = None):
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.virtual_time = 0.0
+        self._flow_finish: Dict[tuple, float] = {}
+        self._heap = []
+        self._entries: Dict[Hashable, list] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _flow(self, user_id: Optional[str], priority: str) -> tuple:
+        if priority not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority}")
+        return priority, user_id or ANONYMOUS_USER
+
+    def _next_tag(self, flow: tuple) -> float:
+        start = max(self.virtual_time, self._flow_finish.get(flow, 0.0))
+        return start + 1.0 / self.weights[flow[0]]
+
+    def push(self, key: Hashable, item: Any, user_id: Optional[str] = None, priority: str = INTERACTIVE):
+        """Queue item under key, which must not be queued already"""
+        flow = self._flow(user_id, priority)
+        tag = self._next_tag(flow)
+        self._flow_finish[flow] = tag
+        entry = [tag, next(self._counter), key, item, flow]
+        self._entries[key] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pop(self) -> Optional[Any]:
+        """Remove and return the item with the smallest tag, None when empty"""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._entries.get(entry[2]) is not entry:
+                continue  # Removed while waiting
+            del self._entries[entry[2]]
+            self.virtual_time = entry[0]
+            # Flows that caught up with the virtual time are idle, forget them
+            for flow in [flow for flow, finish in self._flow_finish.items() if finish <= self.virtual_time]:
+                del self._flow_finish[flow]
+            return entry[3]
+        return None
+
+    def remove(self, key: Hashable) -> bool:
+        return self._entries.pop(key, None) is not None
+
+    def position(self, key: Hashable) -> Optional[int]:
+        """Number of queued items dispatched before key, None when key is not queued"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return sum(1 for other in self._entries.values() if other[:2] < entry[:2])
+
+    def position_for(self, user_id: Optional[str] = None, priority: str = INTERACTIVE) -> int:
+        """Number of queued items a new item of this user and class would wait behind"""
+        tag = self._next_tag(self._flow(user_id, priority))
+        return sum(1 for entry in self._entries.values() if entry[0] <= tag)
+
+    def count(self, user_id: Optional[str] = None, priority: str = INTERACTIVE) -> int:
+        """Number of queued items of one user and class"""
+        flow = self._flow(user_id, priority)
+        return sum(1 for entry in self._entries.values() if entry[4] == flow)
@@ -0,0 +1,198 @@
+import os
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Coroutine, Dict, Hashable, Optional
+from utils.fair_queue import FairQueue, INTERACTIVE
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Default concurrency limit for every pipeline stage, overridable with
+# STAGE_CONCURRENCY_<STAGE> environment variables (e.g. STAGE_CONCURRENCY_RENDER=2)
+DEFAULT_STAGE_LIMITS = {
+    "reddit": 8,
+    "script": 8,
+    "tts": 8,
+    "storage": 8,
+    "captions": CPU_COUNT,
+    "render": CPU_COUNT,
+}
+# Interactive jobs whose estimated wait is longer than this are turned away, 0 disables the check
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get("ADMISSION_MAX_WAIT_SECONDS", 600))
+# Jobs one user can have waiting per class, so a single user never fills the queue. Requests
+# without a user ID share one flow, they are only bounded by MAX_QUEUED_JOBS
+MAX_QUEUED_JOBS_PER_USER = int(os.environ.get("MAX_QUEUED_JOBS_PER_USER", 5))
+# Job duration assumed for wait estimates until jobs have finished
+JOB_SECONDS_ESTIMATE = float(os.environ.get("JOB_SECONDS_ESTIMATE", 60))
+JOB_SECONDS_SMOOTHING = 0.2
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the executor queue is at capacity"""
+    def __init__(self, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class JobExecutor:
+    """
+    This class is used to run pipeline jobs off the event loop with bounded concurrency.
+
+    Blocking network stages run on a shared thread pool, ffmpeg renders run on a
+    separate pool sized to the number of cores, every stage has its own concurrency
+    limit and the number of queued jobs is capped to apply backpressure.
+
+    Jobs waiting for a run slot are dispatched by weighted fair queuing over user ID and
+    priority class (see FairQueue), and jobs are only admitted while the estimated wait,
+    from the measured job duration and the free slots, stays within ADMISSION_MAX_WAIT_SECONDS.
+    """
+    def __init__(self, stage_limits: Dict[str, int] = None, max_running_jobs: int = None, max_queued_jobs: int = None):
+        limits = dict(DEFAULT_STAGE_LIMITS)
+        limits.update(stage_limits or {})
+        for stage in limits:
+            env_value = os.environ.get(f"STAGE_CONCURRENCY_{stage.upper()}")
+            if env_value:
+                limits[stage] = max(1, int(env_value))
+        self.stage_limits = limits
+
+        self.max_running_jobs = max_running_jobs or int(os.environ.get("MAX_RUNNING_JOBS", CPU_COUNT * 2))
+        self.max_queued_jobs = max_queued_jobs or int(os.environ.get("MAX_QUEUED_JOBS", 50))
+
+        network_workers = sum(limit for stage, limit in limits.items() if stage != "render")
+        self.io_pool = ThreadPoolExecutor(max_workers=network_workers, thread_name_prefix="pipeline-io")
+        # ffmpeg is its own process, so a thread per render is enough to keep it off the loop
+        self.render_pool = ThreadPoolExecutor(max_workers=limits["render"], thread_name_prefix="pipeline-render")
+
+        self._stage_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._waiting = FairQueue()
+        # Keys of jobs handed a run slot that haven't started running yet
+        self._granted = set()
+        self._jobs = set()
+        self.running_jobs = 0
+        self.queued_jobs = 0
+        self.job_seconds = JOB_SECONDS_ESTIMATE
+
+    def _get_stage_semaphore(self, stage: str) -> asyncio.Semaphore:
+        # Semaphores are created lazily so they bind to the running event loop
+        if stage not in self._stage_semaphores:
+            self._stage_semaphores[stage] = asyncio.Semaphore(self.stage_limits.get(stage, 1))
+        return self._stage_semaphores[stage]
+
+    async def run_in_stage(self, stage: str, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a blocking function in the pool for the given stage, respecting the stage limit
+        """
+        pool = self.render_pool if stage == "render" else self.io_pool
+        loop = asyncio.get_running_loop()
+        async with self._get_stage_semaphore(stage):
+            return await loop.run_in_executor(pool, lambda: func(*args, **kwargs))
+
+    def estimate_wait_seconds(self, jobs_ahead: int) -> float:
+        """Time until a job with jobs_ahead jobs queued before it gets a run slot"""
+        if self.running_jobs + jobs_ahead < self.max_running_jobs:
+            return 0.0
+        # Slots free up at max_running_jobs per job duration
+        return (jobs_ahead + 1) * self.job_seconds / self.max_running_jobs
+
+    def get_queue_position(self, key: Hashable) -> Optional[dict]:
+        """1-based queue position and estimated start of a waiting job, None when it isn't waiting"""
+        jobs_ahead = self._waiting.position(key)
+        if jobs_ahead is None:
+            return None
+        return {
+            "queue_position": jobs_ahead + 1,
+            "estimated_start_seconds": round(self.estimate_wait_seconds(jobs_ahead)),
+        }
+
+    def check_admission(self, user_id: Optional[str] = None, priority: str = INTERACTIVE):
+        """Raise QueueFullError when a new job of this user and class should not be queued"""
+        if self.queued_jobs >= self.max_queued_jobs:
+            raise QueueFullError(f"Job queue is full ({self.queued_jobs} jobs waiting)",
+                                 retry_after=self.estimate_wait_seconds(self.queued_jobs))
+        if user_id and self._waiting.count(user_id, priority) >= MAX_QUEUED_JOBS_PER_USER:
+            raise QueueFullError(f"Too many jobs waiting for this user (at most {MAX_QUEUED_JOBS_PER_USER})",
+                                 retry_after=self.job_seconds)
+        if priority == INTERACTIVE and ADMISSION_MAX_WAIT_SECONDS:
+            wait_seconds = self.estimate_wait_seconds(self._waiting.position_for(user_id, priority))
+            if wait_seconds > ADMISSION_MAX_WAIT_SECONDS:
+                raise QueueFullError(f"Estimated wait of {wait_seconds:.0f}s is over capacity",
+                                     retry_after=wait_seconds - ADMISSION_MAX_WAIT_SECONDS)
+
+    def submit(self, job: Coroutine, key: Hashable = None, user_id: str = None, priority: str = INTERACTIVE) -> asyncio.Task:
+        """
+        Schedule a pipeline job, raising QueueFullError when it is not admitted.
+        key (e.g. the task ID) identifies the job for get_queue_position.
+        """
+        try:
+            self.check_admission(user_id, priority)
+        except QueueFullError:
+            job.close()
+            raise
+
+        key = key if key is not None else uuid.uuid4().hex
+        slot = asyncio.get_running_loop().create_future()
+        if self.running_jobs < self.max_running_jobs and not len(self._waiting):
+            # Claimed here, not in the task, so jobs submitted together can't both take the last slot
+            self.running_jobs += 1
+            self._granted.add(key)
+            slot.set_result(None)
+        else:
+            self._waiting.push(key, (key, slot), user_id, priority)
+            self.queued_jobs += 1
+        task = asyncio.create_task(self._run_job(job, slot, key))
+        task.add_done_callback(lambda _: self._release_waiting(job, slot, key))
+        # Keep a reference so running jobs are not garbage collected
+        self._jobs.add(task)
+        task.add_done_callback(self._jobs.discard)
+        return task
+
+    def _dispatch(self):
+        """Hand free run slots to waiting jobs in fair queuing order"""
+        while self.running_jobs < self.max_running_jobs:
+            waiting = self._waiting.pop()
+            if waiting is None:
+                return
+            key, slot = waiting
+            self.queued_jobs -= 1
+            if slot.done():
+                # Cancelled while waiting, its job is already finished
+                continue
+            self.running_jobs += 1
+            self._granted.add(key)
+            slot.set_result(None)
+
+    def _release_waiting(self, job: Coroutine, slot: asyncio.Future, key: Hashable):
+        """Undo the bookkeeping of a job cancelled before it ran, which may be before its coroutine started"""
+        job.close()
+        if not slot.done() or slot.cancelled():
+            # Cancelled while waiting for a slot, cancelling the task also cancels the slot it awaited
+            slot.cancel()
+            if self._waiting.remove(key):
+                self.queued_jobs -= 1
+        elif key in self._granted:
+            # Cancelled after getting a slot but before running, pass it on
+            self._granted.discard(key)
+            self.running_jobs -= 1
+            self._dispatch()
+
+    async def _run_job(self, job: Coroutine, slot: asyncio.Future, key: Hashable) -> Any:
+        try:
+            await slot
+        except BaseException:
+            job.close()
+            raise
+        self._granted.discard(key)
+        start = time.monotonic()
+        try:
+            return await job
+        finally:
+            seconds = time.monotonic() - start
+            self.job_seconds += JOB_SECONDS_SMOOTHING * (seconds - self.job_seconds)
+            self.running_jobs -= 1
+            self._dispatch()
+
+    def shutdown(self):
+        self.io_pool.shutdown(wait=False, cancel_futures=True)
+        self.render_pool.shutdown(wait=False, cancel_futures=True)
+
+# Global job executor instance
+job_executor = JobExecutor()
@@ -0,0 +1,185 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+def format_labels(label_names: Tuple[str, ...], label_values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(label_names, label_values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Metric:
+    """
+    Base class for metrics rendered in the Prometheus text exposition format
+    """
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.lock = threading.Lock()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+    def samples(self) -> list:
+        raise NotImplementedError
+
+class Counter(Metric):
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, label_names)
+        # Counters without labels are exposed at 0 before their first increment
+        self.values = {} if self.label_names else {(): 0}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self.lock:
+            return [f"{self.name}{format_labels(self.label_names, key)} {value}" for key, value in self.values.items()]
+
+class Gauge(Metric):
+    """
+    A gauge whose value is read from a callback when metrics are scraped
+    """
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback: Callable[[], float]):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self) -> list:
+        try:
+            return [f"{self.name} {self.callback()}"]
+        except Exception as e:
+            print(f"Error reading gauge {self.name}: {e}")
+            return []
+
+class Histogram(Metric):
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.label_names)
+        with self.lock:
+            series = self.values.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self) -> list:
+        lines = []
+        with self.lock:
+            for key, series in self.values.items():
+                counts, total, count = series["counts"], series["sum"], series["count"]
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, {'le': bound})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.label_names, key, {'le': '+Inf'})} {count}")
+                lines.append(f"{self.name}_sum{format_labels(self.label_names, key)} {total}")
+                lines.append(f"{self.name}_count{format_labels(self.label_names, key)} {count}")
+        return lines
+
+class Registry:
+    """
+    This class is used to collect metrics and render them for a Prometheus scrape
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+class StageTimings:
+    """
+    This class is used to time the stages of one job, feeding the global histograms
+    and a per-task breakdown that is published after every stage
+    """
+    def __init__(self, publish: Callable[[dict], None] = None, on_start: Callable[[str], None] = None):
+        self.publish = publish
+        self.on_start = on_start
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a block, the yielded span can carry bytes and extra details of the stage"""
+        span = {"bytes": 0}
+        if self.on_start:
+            try:
+                self.on_start(name)
+            except Exception as e:
+                print(f"Error reporting start of stage {name}: {e}")
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            seconds = time.perf_counter() - start
+            self.record(name, seconds, **span)
+
+    def record(self, name: str, seconds: float, bytes: int = 0, **details):
+        stage_seconds.observe(seconds, stage=name)
+        if bytes:
+            stage_bytes.inc(bytes, stage=name)
+        self.stages[name] = dict(details, seconds=round(seconds, 3), bytes=bytes)
+        if self.publish:
+            try:
+                self.publish(self.as_dict())
+            except Exception as e:
+                print(f"Error publishing stage timings: {e}")
+
+    def as_dict(self) -> dict:
+        return {name: dict(values) for name, values in self.stages.items()}
+
+# Global metrics registry and pipeline metrics
+registry = Registry()
+stage_seconds = registry.register(Histogram(
+    "reels_pipeline_stage_seconds", "Wall time of each pipeline stage", ("stage",)
+))
+stage_bytes = registry.register(Counter(
+    "reels_pipeline_stage_bytes_total", "Bytes read or written by each pipeline stage", ("stage",)
+))
+queue_wait_seconds = registry.register(Histogram(
+    "reels_pipeline_queue_wait_seconds", "Time a task waited before a worker started it"
+))
+job_seconds = registry.register(Histogram(
+    "reels_pipeline_job_seconds", "End-to-end processing time of a task", ("status",)
+))
+ffmpeg_cpu_seconds = registry.register(Histogram(
+    "reels_ffmpeg_cpu_seconds", "CPU time (user + system) spent by ffmpeg per render"
+))
+ffmpeg_encode_fps = registry.register(Histogram(
+    "reels_ffmpeg_encode_fps", "Frames per second ffmpeg encoded at", buckets=(5, 10, 20, 30, 60, 90, 120, 180, 240, 480)
+))
+render_presets = registry.register(Counter(
+    "reels_render_preset_total", "Renders started with each x264 preset", ("preset",)
+))
+template_cache_hits = registry.register(Counter(
+    "reels_template_cache_hits_total", "Background template reads served from the template cache"
+))
+template_cache_misses = registry.register(Counter(
+    "reels_template_cache_misses_total", "Background template reads downloaded from S3"
+))
+background_cache_downloads = registry.register(Counter(
+    "reels_background_cache_downloads_total", "Background library assets downloaded into the template cache, by result",
+    ("result",)
+))
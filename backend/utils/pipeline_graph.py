@@ -0,0 +1,141 @@
+import os
+import random
+import asyncio
+from typing import Awaitable, Callable, Dict, Iterable, Set
+
+# Attempts after the first for stages marked as retryable, with exponential backoff and jitter
+STAGE_RETRIES = int(os.environ.get("STAGE_RETRIES", 2))
+STAGE_RETRY_BACKOFF_SECONDS = float(os.environ.get("STAGE_RETRY_BACKOFF_SECONDS", 1.0))
+
+# Errors worth retrying, matched by class name so no client library has to be imported here
+TRANSIENT_ERROR_NAMES = {
+    "ConnectionError", "Timeout", "ReadTimeout", "ConnectTimeout", "ChunkedEncodingError",  # requests
+    "APIConnectionError", "APITimeoutError", "RateLimitError", "InternalServerError",  # openai
+    "EndpointConnectionError", "ConnectTimeoutError", "ReadTimeoutError", "ConnectionClosedError",  # botocore
+    "TimeoutException", "NetworkError", "RemoteProtocolError",  # httpx, used by the Deepgram SDK
+}
+# S3 error codes and HTTP statuses worth retrying
+TRANSIENT_ERROR_CODES = {"SlowDown", "Throttling", "ThrottlingException", "RequestTimeout", "InternalError", "ServiceUnavailable"}
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether an error (or an error it was raised from) is a network failure, timeout or throttling"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+            return True
+        if any(cls.__name__ in TRANSIENT_ERROR_NAMES for cls in type(error).__mro__):
+            return True
+        # botocore ClientError and HTTP errors carrying a status
+        response = getattr(error, "response", None)
+        if isinstance(response, dict):
+            code = response.get("Error", {}).get("Code")
+            status = response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+            if code in TRANSIENT_ERROR_CODES or status == 429 or status >= 500:
+                return True
+        status = getattr(error, "status_code", None) or getattr(response, "status_code", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+class StageError(Exception):
+    """Raised when a pipeline stage fails, carrying the stage's user-facing error message"""
+    def __init__(self, stage: str, message: str):
+        super().__init__(message)
+        self.stage = stage
+        self.message = message
+
+class Stage:
+    """
+    A pipeline stage: an async function of the results of its dependencies.
+    Retryable stages are run again, with backoff, when they fail with a transient error.
+    """
+    def __init__(self, name: str, func: Callable[[Dict], Awaitable], deps: Iterable[str] = (), error_message: str = None,
+                 retries: int = 0):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.error_message = error_message or f"Error in stage {name}"
+        self.retries = retries
+
+class PipelineGraph:
+    """
+    This class is used to run pipeline stages as a dependency graph.
+
+    Every stage starts as soon as all of its dependencies finished, so independent
+    stages run concurrently. The first failure cancels every other running stage and
+    is raised as a StageError with that stage's error message.
+
+    Results of earlier attempts (checkpoints) can be passed in: those stages are not
+    run again, and neither are stages that only finished stages depend on.
+    """
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError(f"Stage {stage.name} depends on unknown stage {dep}")
+
+    def required_stages(self, results: Dict) -> Set[str]:
+        """Stages still to run: unfinished final stages and the unfinished stages they depend on"""
+        depended_on = {dep for stage in self.stages.values() for dep in stage.deps}
+        required = set()
+        pending = [name for name in self.stages if name not in depended_on]
+        while pending:
+            name = pending.pop()
+            if name in required or name in results:
+                continue
+            required.add(name)
+            pending.extend(self.stages[name].deps)
+        return required
+
+    async def run_stage(self, stage: Stage, results: Dict):
+        attempt = 0
+        while True:
+            try:
+                return await stage.func(results)
+            except StageError:
+                raise
+            except Exception as e:
+                if attempt >= stage.retries or not is_transient_error(e):
+                    raise
+                delay = STAGE_RETRY_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+                attempt += 1
+                print(f"Stage {stage.name} failed with a transient error, retry {attempt}/{stage.retries} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def run(self, results: Dict = None) -> Dict:
+        """
+        Run all stages and return their results by stage name.
+        Stages already present in results are treated as done and not run again.
+        """
+        results = dict(results or {})
+        required = self.required_stages(results)
+        waiting = {name: stage for name, stage in self.stages.items() if name in required}
+        running = {}
+        try:
+            while waiting or running:
+                for name, stage in list(waiting.items()):
+                    if all(dep in results for dep in stage.deps):
+                        running[asyncio.create_task(self.run_stage(stage, results), name=name)] = stage
+                        del waiting[name]
+                if not running:
+                    raise ValueError(f"Pipeline graph has a dependency cycle: {sorted(waiting)}")
+
+                done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    stage = running.pop(task)
+                    try:
+                        results[stage.name] = task.result()
+                    except StageError:
+                        raise
+                    except Exception as e:
+                        raise StageError(stage.name, f"{stage.error_message}: {str(e)}") from e
+            return results
+        finally:
+            # Cancel sibling stages on failure (or if the job itself was cancelled)
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running.keys(), return_exceptions=True)
@@ -0,0 +1,123 @@
+import os
+import json
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from typing import Dict, Set
+from utils.task_store import TASK_STORE_BACKEND, REDIS_URL
+
+# "memory" fans out within this process, "redis" also relays events between replicas and workers
+PROGRESS_BROKER_BACKEND = os.environ.get(
+    "PROGRESS_BROKER_BACKEND", "redis" if TASK_STORE_BACKEND == "redis" else "memory"
+)
+# Events a slow subscriber may have waiting before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 100
+
+class Subscription:
+    """Progress events of one task for one subscriber, consumed on the subscriber's event loop"""
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def put(self, event: dict):
+        # Runs on the subscriber's loop, a full queue drops its oldest event instead of blocking publishers
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+class ProgressBroker:
+    """
+    This class is used to fan out task progress events to subscribers in this process.
+
+    publish() can be called from any thread (pipeline stages run on executor threads),
+    events are handed to each subscriber's event loop with call_soon_threadsafe.
+    """
+    def __init__(self):
+        self.subscribers: Dict[str, Set[Subscription]] = {}
+        self.lock = threading.Lock()
+
+    def publish(self, task_id: str, event: dict):
+        self.deliver(task_id, event)
+
+    def deliver(self, task_id: str, event: dict):
+        with self.lock:
+            subscriptions = list(self.subscribers.get(task_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                pass  # The subscriber's loop is closed, it unsubscribes on its own
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str):
+        subscription = Subscription(task_id)
+        with self.lock:
+            self.subscribers.setdefault(task_id, set()).add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self.lock:
+                subscriptions = self.subscribers.get(task_id)
+                if subscriptions:
+                    subscriptions.discard(subscription)
+                    if not subscriptions:
+                        del self.subscribers[task_id]
+
+class RedisProgressBroker(ProgressBroker):
+    """
+    This class is used to relay progress events between processes through Redis pub/sub.
+
+    Events are published to a per-task channel. Every process keeps a single pattern
+    subscription, started on its first subscriber, and fans the events out locally.
+    """
+    def __init__(self, client=None, channel_prefix: str = "reels:progress:"):
+        super().__init__()
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+        self.client = client
+        self.channel_prefix = channel_prefix
+        self.listener = None
+
+    def publish(self, task_id: str, event: dict):
+        try:
+            self.client.publish(self.channel_prefix + task_id, json.dumps(event))
+        except Exception as e:
+            # Progress is best effort, subscribers still get the final status from the task store
+            print(f"Error publishing progress for task {task_id}: {e}")
+
+    def handle_message(self, message: dict):
+        channel = message["channel"]
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        try:
+            self.deliver(channel[len(self.channel_prefix):], json.loads(message["data"]))
+        except ValueError as e:
+            print(f"Invalid progress message on {channel}: {e}")
+
+    @asynccontextmanager
+    async def subscribe(self, task_id: str):
+        with self.lock:
+            if self.listener is None:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(**{self.channel_prefix + "*": self.handle_message})
+                self.listener = pubsub.run_in_thread(sleep_time=0.01, daemon=True)
+        async with super().subscribe(task_id) as subscription:
+            yield subscription
+
+def create_progress_broker(backend: str = PROGRESS_BROKER_BACKEND) -> ProgressBroker:
+    """
+    Create the progress broker configured by PROGRESS_BROKER_BACKEND (memory or redis)
+    """
+    if backend == "memory":
+        return ProgressBroker()
+    if backend == "redis":
+        return RedisProgressBroker()
+    raise ValueError(f"Unknown progress broker backend: {backend}")
+
+# Global progress broker instance
+progress_broker = create_progress_broker()
@@ -0,0 +1,124 @@
+import os
+import threading
+from typing import Any, Callable, Dict
+
+BUCKET_NAME = os.environ.get('CLOUDFLARE_TTS_BUCKET_NAME')
+
+class ServiceRegistry:
+    """
+    This class is used to create shared service clients on first use.
+
+    Clients (boto3, OpenAI, Deepgram, the pooled Reddit session) are slow to import and
+    build, so nothing is constructed at import time. Every service is built once, the
+    first time it is asked for, and then shared by the whole process.
+    """
+    def __init__(self):
+        self.factories: Dict[str, Callable[[], Any]] = {}
+        self.instances: Dict[str, Any] = {}
+        # Reentrant, factories can ask for the services they depend on
+        self.lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self.factories[name] = factory
+
+    def get(self, name: str) -> Any:
+        instance = self.instances.get(name)
+        if instance is not None:
+            return instance
+        with self.lock:
+            # Another thread may have built it while we waited
+            if name not in self.instances:
+                self.instances[name] = self.factories[name]()
+            return self.instances[name]
+
+    def get_if_created(self, name: str) -> Any:
+        """Return a service only if something already created it, for metrics and shutdown"""
+        return self.instances.get(name)
+
+    def warm_up(self):
+        """Create every registered service, e.g. in the background once the app is serving"""
+        for name in list(self.factories):
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error creating service {name}: {e}")
+
+    def close(self):
+        with self.lock:
+            for name, instance in self.instances.items():
+                if hasattr(instance, "close"):
+                    try:
+                        instance.close()
+                    except Exception as e:
+                        print(f"Error closing service {name}: {e}")
+            self.instances.clear()
+
+def create_cloudflare_s3():
+    from storage.cloudflare_s3 import CloudflareS3
+    return CloudflareS3()
+
+def create_template_cache():
+    from storage.template_cache import TemplateCache
+    return TemplateCache(get_cloudflare_s3())
+
+def create_background_library():
+    from storage.background_library import BackgroundLibrary
+    return BackgroundLibrary(get_cloudflare_s3(), BUCKET_NAME, get_template_cache())
+
+def create_result_cache():
+    from storage.result_cache import create_result_cache
+    return create_result_cache(get_cloudflare_s3(), BUCKET_NAME)
+
+def create_checkpoint_store():
+    from storage.checkpoints import create_checkpoint_store, CHECKPOINT_BACKEND
+    # The local backend needs no S3 client, so boto3 is not loaded for it
+    cloudflare_s3 = get_cloudflare_s3() if CHECKPOINT_BACKEND == "s3" else None
+    return create_checkpoint_store(cloudflare_s3, BUCKET_NAME)
+
+def create_deepgram_service():
+    from clients.deepgram import DeepgramService
+    return DeepgramService()
+
+def create_openai_service():
+    from clients.openai import OpenAIService
+    return OpenAIService()
+
+def create_reddit_client():
+    from clients.reddit import RedditClient
+    return RedditClient()
+
+# Global service registry
+services = ServiceRegistry()
+services.register("cloudflare_s3", create_cloudflare_s3)
+services.register("template_cache", create_template_cache)
+services.register("background_library", create_background_library)
+services.register("result_cache", create_result_cache)
+services.register("checkpoints", create_checkpoint_store)
+services.register("deepgram", create_deepgram_service)
+services.register("openai", create_openai_service)
+services.register("reddit", create_reddit_client)
+
+# Accessors, usable directly or as FastAPI dependencies
+def get_cloudflare_s3():
+    return services.get("cloudflare_s3")
+
+def get_template_cache():
+    return services.get("template_cache")
+
+def get_background_library():
+    return services.get("background_library")
+
+def get_result_cache():
+    return services.get("result_cache")
+
+def get_checkpoint_store():
+    return services.get("checkpoints")
+
+def get_deepgram_service():
+    return services.get("deepgram")
+
+def get_openai_service():
+    return services.get("openai")
+
+def get_reddit_client():
+    return services.get("reddit")
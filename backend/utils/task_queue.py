@@ -1,6 +1,12 @@
 from datetime import datetime
 import uuid
+import time
 from enum import Enum
+from typing import Dict, List, Optional
+from utils.task_store import TaskStore, create_task_store
+from utils.progress import ProgressBroker, progress_broker
+
+DEFAULT_LEASE_SECONDS = 120
 
 class TaskStatus(Enum):
     PENDING = "pending"
@@ -9,35 +15,170 @@ class TaskStatus(Enum):
     FAILED = "failed"
 
 class TaskQueue:
-    def __init__(self):
-        self.tasks = {}
+    """
+    This class is used to create and track media processing tasks on top of a pluggable task store.
+    Status changes and stage progress are also published to a progress broker for push updates.
+    """
+    def __init__(self, store: TaskStore = None, broker: ProgressBroker = None):
+        self.store = store or create_task_store()
+        self.broker = broker or progress_broker
 
-    def create_media_processing_task(self) -> str:
+    def create_media_processing_task(self, payload: Dict = None, claimable: bool = False) -> str:
         task_id = str(uuid.uuid4()) + "_" + str(datetime.now().timestamp())
-        self.tasks[task_id] = {
-            "status": TaskStatus.PENDING,
+        self.store.create(task_id, {
+            "task_id": task_id,
+            "status": TaskStatus.PENDING.value,
             "video_url": None,
-            "error": None
-        }
+            "error": None,
+            "payload": payload or {},
+            "created_at": time.time()
+        }, claimable=claimable)
         return task_id
 
-    def update_task_status(self, task_id: str, status: TaskStatus, video_url: str = None, error: str = None):
-        if task_id in self.tasks:
-            self.tasks[task_id]["status"] = status
-            if status == TaskStatus.COMPLETED:
-                self.tasks[task_id]["video_url"] = video_url
-            if status == TaskStatus.FAILED and error:
-                self.tasks[task_id]["error"] = error
+    def update_task_status(self, task_id: str, status: TaskStatus, video_url: str = None, error: str = None,
+                           video_urls: Dict[str, str] = None):
+        fields = {"status": status.value}
+        if status == TaskStatus.COMPLETED:
+            fields["video_url"] = video_url
+            # Every rendered output profile by name, video_url is the main one
+            fields["video_urls"] = video_urls or {}
+        if status == TaskStatus.FAILED and error:
+            fields["error"] = error
+        if status in (TaskStatus.COMPLETED, TaskStatus.FAILED):
+            fields["lease_owner"] = None
+            fields["lease_expires_at"] = None
+        self.store.update(task_id, fields)
+        self.broker.publish(task_id, {
+            "type": "status",
+            "status": status.value,
+            "video_url": fields.get("video_url"),
+            "video_urls": fields.get("video_urls"),
+            "error": fields.get("error")
+        })
+
+    def report_stage(self, task_id: str, stage: str):
+        """Record the stage a task entered and publish it to progress subscribers"""
+        self.store.update(task_id, {"stage": stage})
+        self.broker.publish(task_id, {"type": "stage", "stage": stage})
+
+    def report_progress(self, task_id: str, stage: str, percent: float):
+        """Publish progress within a stage, it changes too often to be written to the store"""
+        self.broker.publish(task_id, {"type": "progress", "stage": stage, "percent": round(percent, 1)})
+
+    def requeue_task(self, task_id: str, claimable: bool = False) -> bool:
+        """
+        Put a failed task back to PENDING under the same ID, so it resumes from its checkpoints
+        """
+        task = self.store.get(task_id)
+        if not task:
+            return False
+        requeued = self.store.requeue(task_id, {
+            "status": TaskStatus.PENDING.value,
+            "error": None,
+            "stage": None,
+            "lease_owner": None,
+            "lease_expires_at": None,
+            "attempts": task.get("attempts", 1) + 1,
+            "created_at": time.time()
+        }, claimable=claimable)
+        if requeued:
+            self.broker.publish(task_id, {"type": "status", "status": TaskStatus.PENDING.value, "video_url": None, "error": None})
+        return requeued
+
+    def update_task_fields(self, task_id: str, **fields):
+        """Attach extra metadata (e.g. stage timings) to a task"""
+        self.store.update(task_id, fields)
+
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        return self.store.get(task_id)
 
     def get_task_status(self, task_id: str) -> dict:
-        if task_id in self.tasks:
-            task = self.tasks[task_id]
-            return {
-                "status": task["status"].value, 
+        task = self.store.get(task_id)
+        if task and task.get("kind") != "batch":
+            status = {
+                "status": task["status"],
                 "video_url": task["video_url"],
                 "error": task.get("error")
             }
+            if task.get("video_urls"):
+                status["video_urls"] = task["video_urls"]
+            if task.get("stage") and task["status"] == TaskStatus.PROCESSING.value:
+                status["stage"] = task["stage"]
+            if task.get("timings"):
+                status["timings"] = task["timings"]
+            if task.get("attempts"):
+                status["attempts"] = task["attempts"]
+            if task.get("encode_profile"):
+                status["encode_profile"] = task["encode_profile"]
+            return status
         return {"status": "not_found"}
 
+    def create_batch(self, items: List[Dict], source: Dict = None) -> str:
+        """
+        Record a batch of tasks, items hold the url, post_id and task_id of every entry
+        """
+        batch_id = "batch_" + str(uuid.uuid4())
+        self.store.create(batch_id, {
+            "task_id": batch_id,
+            "kind": "batch",
+            "status": TaskStatus.PENDING.value,
+            "items": items,
+            "source": source or {},
+            "created_at": time.time()
+        })
+        return batch_id
+
+    def get_batch_status(self, batch_id: str) -> dict:
+        """
+        Aggregate progress of a batch with the status of every item in the get_task_status format
+        """
+        batch = self.store.get(batch_id)
+        if not batch or batch.get("kind") != "batch":
+            return {"status": "not_found"}
+
+        items = []
+        counts = {status.value: 0 for status in TaskStatus}
+        for item in batch["items"]:
+            item_status = dict(item, **self.get_task_status(item["task_id"])) if item.get("task_id") else dict(item)
+            if item_status.get("status", "not_found") == "not_found":
+                # The task expired (TASK_STORE_TTL_SECONDS) or was never created, it will not finish any more
+                item_status.update(status=TaskStatus.FAILED.value, error=item_status.get("error") or "Task not found")
+            counts[item_status["status"]] = counts.get(item_status["status"], 0) + 1
+            items.append(item_status)
+
+        total = len(items)
+        finished = counts[TaskStatus.COMPLETED.value] + counts[TaskStatus.FAILED.value]
+        if finished < total:
+            started = total - counts[TaskStatus.PENDING.value]
+            status = TaskStatus.PROCESSING.value if started else TaskStatus.PENDING.value
+        else:
+            # A batch only fails as a whole when nothing in it completed
+            status = TaskStatus.COMPLETED.value if counts[TaskStatus.COMPLETED.value] else TaskStatus.FAILED.value
+        return {
+            "batch_id": batch_id,
+            "status": status,
+            "total": total,
+            "counts": counts,
+            "progress": round(finished / total, 3) if total else 1.0,
+            "source": batch.get("source", {}),
+            "items": items
+        }
+
+    def get_task_payload(self, task_id: str) -> Optional[Dict]:
+        task = self.store.get(task_id)
+        return task.get("payload") if task else None
+
+    def claim_task(self, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[Dict]:
+        """
+        Claim the next pending task for a worker, returns the task with its id or None
+        """
+        return self.store.claim(worker_id, lease_seconds)
+
+    def renew_task_lease(self, task_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        return self.store.renew_lease(task_id, worker_id, lease_seconds)
+
+    def count_pending_tasks(self) -> int:
+        return self.store.count_pending()
+
 # Global task queue instance
-task_queue = TaskQueue()
\ No newline at end of file
+task_queue = TaskQueue()
@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+TASK_STORE_BACKEND = os.environ.get("TASK_STORE_BACKEND", "memory")
+TASK_STORE_TTL_SECONDS = int(os.environ.get("TASK_STORE_TTL_SECONDS", 24 * 60 * 60))
+# Defaults to the backend directory, so the API and worker.py share it whatever directory they start in
+TASK_STORE_SQLITE_PATH = os.environ.get(
+    "TASK_STORE_SQLITE_PATH", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tasks.db")
+)
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+# Backends that only live in the process that created them, worker processes can't claim their tasks
+PROCESS_LOCAL_BACKENDS = ("memory", "fakeredis")
+
+PENDING = "pending"
+PROCESSING = "processing"
+
+class TaskStore:
+    """
+    Base class for task storage backends.
+
+    A task is a JSON-serializable dict. Tasks created with claimable=True can be
+    pulled by worker processes through claim(), which hands out a time-limited lease.
+    """
+    def create(self, task_id: str, task: Dict, claimable: bool = False):
+        raise NotImplementedError
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def update(self, task_id: str, fields: Dict) -> bool:
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Dict]:
+        """Atomically take the oldest claimable pending (or lease-expired) task"""
+        raise NotImplementedError
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        raise NotImplementedError
+
+    def count_pending(self) -> int:
+        raise NotImplementedError
+
+    def requeue(self, task_id: str, fields: Dict, claimable: bool = False) -> bool:
+        """Merge fields (which set the status back to pending) and make the task claimable again if asked"""
+        raise NotImplementedError
+
+class InMemoryTaskStore(TaskStore):
+    """
+    This class is used to keep tasks in process memory, evicting them after a TTL
+    """
+    def __init__(self, ttl_seconds: int = TASK_STORE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.tasks = OrderedDict()
+        self.claimable = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _evict_expired(self, now: float):
+        # Tasks are kept in last-updated order, so expired ones sit at the front
+        while self.tasks:
+            task_id, task = next(iter(self.tasks.items()))
+            if task["updated_at"] + self.ttl_seconds > now:
+                break
+            self.tasks.popitem(last=False)
+            self.claimable.pop(task_id, None)
+
+    def create(self, task_id: str, task: Dict, claimable: bool = False):
+        with self.lock:
+            now = time.time()
+            self._evict_expired(now)
+            self.tasks[task_id] = dict(task, updated_at=now)
+            if claimable:
+                self.claimable[task_id] = True
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self.lock:
+            self._evict_expired(time.time())
+            task = self.tasks.get(task_id)
+            return dict(task) if task else None
+
+    def update(self, task_id: str, fields: Dict) -> bool:
+        with self.lock:
+            now = time.time()
+            self._evict_expired(now)
+            if task_id not in self.tasks:
+                return False
+            self.tasks[task_id].update(fields, updated_at=now)
+            self.tasks.move_to_end(task_id)
+            if self.tasks[task_id]["status"] not in (PENDING, PROCESSING):
+                self.claimable.pop(task_id, None)
+            return True
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Dict]:
+        with self.lock:
+            now = time.time()
+            self._evict_expired(now)
+            for task_id in self.claimable:
+                task = self.tasks[task_id]
+                lease_expired = task["status"] == PROCESSING and (task.get("lease_expires_at") or 0) < now
+                if task["status"] == PENDING or lease_expired:
+                    task.update(
+                        status=PROCESSING,
+                        lease_owner=worker_id,
+                        lease_expires_at=now + lease_seconds,
+                        updated_at=now
+                    )
+                    self.tasks.move_to_end(task_id)
+                    return dict(task)
+            return None
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        with self.lock:
+            task = self.tasks.get(task_id)
+            if not task or task.get("lease_owner") != worker_id:
+                return False
+            now = time.time()
+            task.update(lease_expires_at=now + lease_seconds, updated_at=now)
+            self.tasks.move_to_end(task_id)
+            return True
+
+    def count_pending(self) -> int:
+        with self.lock:
+            return sum(1 for task_id in self.claimable if self.tasks[task_id]["status"] == PENDING)
+
+    def requeue(self, task_id: str, fields: Dict, claimable: bool = False) -> bool:
+        with self.lock:
+            if task_id not in self.tasks:
+                return False
+            self.tasks[task_id].update(fields, updated_at=time.time())
+            self.tasks.move_to_end(task_id)
+            if claimable:
+                self.claimable[task_id] = True
+                self.claimable.move_to_end(task_id)
+            return True
+
+class SQLiteTaskStore(TaskStore):
+    """
+    This class is used to persist tasks in a SQLite database shared by the processes of a single host
+    """
+    def __init__(self, path: str = TASK_STORE_SQLITE_PATH, ttl_seconds: int = TASK_STORE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        # isolation_level=None lets us issue BEGIN IMMEDIATE for claims ourselves
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                claimable INTEGER NOT NULL DEFAULT 0,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (claimable, status, created_at)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated_at)")
+
+    def _evict_expired(self, now: float):
+        self.connection.execute("DELETE FROM tasks WHERE updated_at < ?", (now - self.ttl_seconds,))
+
+    def create(self, task_id: str, task: Dict, claimable: bool = False):
+        with self.lock:
+            now = time.time()
+            self._evict_expired(now)
+            task = dict(task, updated_at=now)
+            self.connection.execute(
+                "INSERT INTO tasks (task_id, status, data, claimable, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (task_id, task["status"], json.dumps(task), int(claimable), now, now)
+            )
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT data FROM tasks WHERE task_id = ? AND updated_at >= ?",
+                (task_id, time.time() - self.ttl_seconds)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(self, task_id: str, fields: Dict) -> bool:
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.connection.execute("SELECT data FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+                if not row:
+                    self.connection.execute("COMMIT")
+                    return False
+                now = time.time()
+                task = json.loads(row[0])
+                task.update(fields, updated_at=now)
+                self.connection.execute(
+                    "UPDATE tasks SET status = ?, data = ?, lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE task_id = ?",
+                    (task["status"], json.dumps(task), task.get("lease_owner"), task.get("lease_expires_at"), now, task_id)
+                )
+                self.connection.execute("COMMIT")
+                return True
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Dict]:
+        with self.lock:
+            # BEGIN IMMEDIATE takes the write lock, so two processes can never claim the same row
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = self.connection.execute(
+                    """
+                    SELECT task_id, data FROM tasks
+                    WHERE claimable = 1
+                      AND (status = ? OR (status = ? AND lease_expires_at < ?))
+                    ORDER BY created_at
+                    LIMIT 1
+                    """,
+                    (PENDING, PROCESSING, now)
+                ).fetchone()
+                if not row:
+                    self.connection.execute("COMMIT")
+                    return None
+                task_id, data = row
+                task = json.loads(data)
+                task.update(status=PROCESSING, lease_owner=worker_id, lease_expires_at=now + lease_seconds, updated_at=now)
+                self.connection.execute(
+                    "UPDATE tasks SET status = ?, data = ?, lease_owner = ?, lease_expires_at = ?, updated_at = ? WHERE task_id = ?",
+                    (PROCESSING, json.dumps(task), worker_id, task["lease_expires_at"], now, task_id)
+                )
+                self.connection.execute("COMMIT")
+                return task
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        task = self.get(task_id)
+        if not task or task.get("lease_owner") != worker_id:
+            return False
+        return self.update(task_id, {"lease_expires_at": time.time() + lease_seconds})
+
+    def count_pending(self) -> int:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT COUNT(*) FROM tasks WHERE claimable = 1 AND status = ?", (PENDING,)
+            ).fetchone()
+        return row[0]
+
+    def requeue(self, task_id: str, fields: Dict, claimable: bool = False) -> bool:
+        if not self.update(task_id, fields):
+            return False
+        if claimable:
+            with self.lock:
+                self.connection.execute("UPDATE tasks SET claimable = 1 WHERE task_id = ?", (task_id,))
+        return True
+
+# Claim the next task: expired leases are retried first, then the oldest pending task
+REDIS_CLAIM_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', now, 'LIMIT', 0, 1)
+local task_id = expired[1]
+-- A lease entry is only reclaimed while its task is still processing, a queued ID only while it is pending
+local expected = 'processing'
+if not task_id then
+    task_id = redis.call('RPOP', KEYS[1])
+    expected = 'pending'
+end
+while task_id do
+    local raw = redis.call('GET', ARGV[4] .. task_id)
+    local task = raw and cjson.decode(raw)
+    if task and task['status'] == expected then
+        task['status'] = 'processing'
+        task['lease_owner'] = ARGV[2]
+        task['lease_expires_at'] = now + tonumber(ARGV[3])
+        task['updated_at'] = now
+        local encoded = cjson.encode(task)
+        redis.call('SET', ARGV[4] .. task_id, encoded, 'EX', ARGV[5])
+        redis.call('ZADD', KEYS[2], task['lease_expires_at'], task_id)
+        return encoded
+    end
+    -- The task expired from the store, finished or was already claimed: drop the entry and try the next one
+    if expected == 'processing' or not task then
+        redis.call('ZREM', KEYS[2], task_id)
+    end
+    task_id = redis.call('RPOP', KEYS[1])
+    expected = 'pending'
+end
+return false
+"""
+
+# Merge fields into a stored task without a read-modify-write race between processes
+REDIS_UPDATE_SCRIPT = """
+local raw = redis.call('GET', KEYS[1])
+if not raw then
+    return 0
+end
+local task = cjson.decode(raw)
+local fields = cjson.decode(ARGV[1])
+for key, value in pairs(fields) do
+    task[key] = value
+end
+redis.call('SET', KEYS[1], cjson.encode(task), 'EX', ARGV[2])
+if task['status'] ~= 'pending' and task['status'] ~= 'processing' then
+    redis.call('ZREM', KEYS[2], ARGV[3])
+elseif task['lease_expires_at'] and task['lease_expires_at'] ~= cjson.null then
+    redis.call('ZADD', KEYS[2], 'XX', task['lease_expires_at'], ARGV[3])
+end
+return 1
+"""
+
+class RedisTaskStore(TaskStore):
+    """
+    This class is used to share tasks between processes and hosts through Redis
+    """
+    def __init__(self, client=None, ttl_seconds: int = TASK_STORE_TTL_SECONDS, prefix: str = "reels:"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self.task_prefix = f"{prefix}task:"
+        self.pending_key = f"{prefix}pending"
+        self.leases_key = f"{prefix}leases"
+        self.claim_script = client.register_script(REDIS_CLAIM_SCRIPT)
+        self.update_script = client.register_script(REDIS_UPDATE_SCRIPT)
+
+    def create(self, task_id: str, task: Dict, claimable: bool = False):
+        task = dict(task, updated_at=time.time())
+        pipe = self.client.pipeline()
+        pipe.set(self.task_prefix + task_id, json.dumps(task), ex=self.ttl_seconds)
+        if claimable:
+            pipe.lpush(self.pending_key, task_id)
+        pipe.execute()
+
+    def get(self, task_id: str) -> Optional[Dict]:
+        raw = self.client.get(self.task_prefix + task_id)
+        return json.loads(raw) if raw else None
+
+    def update(self, task_id: str, fields: Dict) -> bool:
+        fields = dict(fields, updated_at=time.time())
+        updated = self.update_script(
+            keys=[self.task_prefix + task_id, self.leases_key],
+            args=[json.dumps(fields), self.ttl_seconds, task_id]
+        )
+        return bool(updated)
+
+    def claim(self, worker_id: str, lease_seconds: int) -> Optional[Dict]:
+        raw = self.claim_script(
+            keys=[self.pending_key, self.leases_key],
+            args=[time.time(), worker_id, lease_seconds, self.task_prefix, self.ttl_seconds]
+        )
+        return json.loads(raw) if raw else None
+
+    def renew_lease(self, task_id: str, worker_id: str, lease_seconds: int) -> bool:
+        task = self.get(task_id)
+        if not task or task.get("lease_owner") != worker_id:
+            return False
+        return self.update(task_id, {"lease_expires_at": time.time() + lease_seconds})
+
+    def count_pending(self) -> int:
+        return self.client.llen(self.pending_key)
+
+    def requeue(self, task_id: str, fields: Dict, claimable: bool = False) -> bool:
+        if not self.update(task_id, fields):
+            return False
+        if claimable:
+            # A task still waiting in the list is not queued a second time
+            pipe = self.client.pipeline()
+            pipe.lrem(self.pending_key, 0, task_id)
+            pipe.lpush(self.pending_key, task_id)
+            pipe.execute()
+        return True
+
+def check_shared_task_store(backend: str = TASK_STORE_BACKEND):
+    """Raise when tasks are handed to worker processes through a store they can't see"""
+    if backend in PROCESS_LOCAL_BACKENDS:
+        raise RuntimeError(
+            f"TASK_STORE_BACKEND={backend} is not shared between processes, "
+            "use sqlite or redis with TASK_DISPATCH=worker and worker.py"
+        )
+
+def create_task_store(backend: str = TASK_STORE_BACKEND) -> TaskStore:
+    """
+    Create the task store configured by TASK_STORE_BACKEND (memory, sqlite, redis or fakeredis)
+    """
+    if backend == "memory":
+        return InMemoryTaskStore()
+    if backend == "sqlite":
+        return SQLiteTaskStore()
+    if backend == "redis":
+        return RedisTaskStore()
+    if backend == "fakeredis":
+        # Local testing without a Redis server, requires `pip install fakeredis lupa`
+        import fakeredis
+        return RedisTaskStore(client=fakeredis.FakeRedis())
+    raise ValueError(f"Unknown task store backend: {backend}")
@@ -0,0 +1,69 @@
+import os
+import uuid
+import socket
+import asyncio
+import multiprocessing
+from utils.task_queue import task_queue, DEFAULT_LEASE_SECONDS
+from utils.task_store import check_shared_task_store
+from utils.services import get_checkpoint_store
+from storage.checkpoints import collect_garbage_periodically
+
+# Run with TASK_DISPATCH=worker on the API and a shared TASK_STORE_BACKEND (sqlite or redis)
+WORKER_PROCESSES = int(os.environ.get("WORKER_PROCESSES", 1))
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", os.cpu_count() or 1))
+WORKER_POLL_INTERVAL = float(os.environ.get("WORKER_POLL_INTERVAL", 1.0))
+
+async def keep_lease_alive(task_id: str, worker_id: str):
+    """Renew the task lease while the job is running so no other worker claims it"""
+    while True:
+        await asyncio.sleep(DEFAULT_LEASE_SECONDS / 3)
+        await asyncio.to_thread(task_queue.renew_task_lease, task_id, worker_id)
+
+async def run_claimed_task(task: dict, worker_id: str):
+    from routers.router import process_reddit_commentary
+
+    task_id = task["task_id"]
+    lease_task = asyncio.create_task(keep_lease_alive(task_id, worker_id))
+    try:
+        payload = task["payload"]
+        await process_reddit_commentary(task_id, payload["url"], payload.get("post_id"), payload.get("post"))
+    except Exception as e:
+        # The pipeline already recorded the failure on the task
+        print(f"Task {task_id} failed on worker {worker_id}: {e}")
+    finally:
+        lease_task.cancel()
+
+async def run_worker(worker_id: str):
+    """Claim pending tasks from the task store and process up to WORKER_CONCURRENCY at a time"""
+    print(f"Worker {worker_id} started")
+    slots = asyncio.Semaphore(WORKER_CONCURRENCY)
+    running = set()
+    # Failed tasks leave checkpoints on this host when CHECKPOINT_BACKEND is local
+    running.add(asyncio.create_task(collect_garbage_periodically(get_checkpoint_store)))
+    while True:
+        await slots.acquire()
+        task = await asyncio.to_thread(task_queue.claim_task, worker_id)
+        if not task:
+            slots.release()
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+            continue
+        print(f"Worker {worker_id} claimed task {task['task_id']}")
+        job = asyncio.create_task(run_claimed_task(task, worker_id))
+        running.add(job)
+        job.add_done_callback(running.discard)
+        job.add_done_callback(lambda _: slots.release())
+
+def worker_main():
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    asyncio.run(run_worker(worker_id))
+
+if __name__ == "__main__":
+    check_shared_task_store()
+    if WORKER_PROCESSES == 1:
+        worker_main()
+    else:
+        processes = [multiprocessing.Process(target=worker_main) for _ in range(WORKER_PROCESSES)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()